@@ -8,35 +8,19 @@ Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
 
 import typing
 import JackTokenizer
+from NAND11.JackLexer import KEYWORD, SYMBOL, INT_CONST, STRING_CONST, IDENTIFIER
 from NAND11.SymbolTable import SymbolTable
 
-NON_VALID_TYPE = ['class', 'constructor', 'function', 'method', 'field',
-           'static', 'var','true',
-           'false', 'null', 'this', 'let', 'do', 'if', 'else',
-           'while', 'return','{', '}', '(', ')', '[', ']', '.', ',', ';', '+',
-           '-', '*', '/', '&', ',', '<', '>', '=', '~', '^', '#','0', '1', '2', '3', '4', '5', '6', '7', '8', '9']
-
-NON_VALID_NAME = ['class', 'constructor', 'function', 'method', 'field',
-           'static', 'var', 'int', 'char', 'boolean', 'void', 'true',
-           'false', 'null', 'this', 'let', 'do', 'if', 'else',
-           'while', 'return','{', '}', '(', ')', '[', ']', '.', ',', ';', '+',
-           '-', '*', '/', '&', ',', '<', '>', '=', '~', '^', '#', '0', '1', '2', '3', '4', '5', '6', '7', '8', '9']
-
-KEYORDS = ['class', 'constructor', 'function', 'method', 'field',
-           'static', 'var', 'int', 'char', 'boolean', 'void', 'true',
-           'false', 'null', 'this', 'let', 'do', 'if', 'else',
-           'while', 'return']
-SYMBOLS = ['{', '}', '(', ')', '[', ']', '.', ',', ';', '+',
-           '-', '*', '/', '&', ',', '<', '>', '=', '~', '^', '#']
-INTEGERS = ['0', '1', '2', '3', '4', '5', '6', '7', '8', '9']
+# The keywords which may be used where a type is expected.
+TYPE_KEYWORDS = ['int', 'char', 'boolean', 'void']
 
 
 class CompilationEngine:
     """Gets input from a JackTokenizer and emits its parsed structure into an
     output stream.
     """
-    dict = {"KEYWORD": "keyword", "SYMBOL": "symbol", "INT_CONST": "integerConstant",
-            "STRING_CONST": "stringConstant", "IDENTIFIER": "identifier"}
+    # xml tag of every token kind, indexed by the kinds from JackLexer.
+    tags = ("keyword", "symbol", "integerConstant", "stringConstant", "identifier")
 
     tabs = 0
 
@@ -273,7 +257,7 @@ class CompilationEngine:
         """
         # Your code goes here!
         self.write_tabs("open", "term")
-        if self.tokenizer.token_type() == "IDENTIFIER":
+        if self.tokenizer.cur_kind == IDENTIFIER:
             self.is_valid_name()
             if self.tokenizer.cur_token == "[":
                 self.eat("[")
@@ -317,21 +301,19 @@ class CompilationEngine:
 
     def write_out(self):
         self.write_tabs()
-        value = "ERROR"
-        type = self.tokenizer.token_type()
-        if type == "IDENTIFIER":
+        kind = self.tokenizer.cur_kind
+        if kind == IDENTIFIER:
             value = self.tokenizer.identifier()
-
-        if type == "INT_CONST":
-            value = self.tokenizer.int_val()
-        if type == "STRING_CONST":
-            value = self.tokenizer.string_val()
-        if type == "SYMBOL":
+        elif kind == SYMBOL:
             value = self.tokenizer.symbol()
-        if type == "KEYWORD":
+        elif kind == KEYWORD:
             value = self.tokenizer.keyword()
+        elif kind == INT_CONST:
+            value = self.tokenizer.int_val()
+        else:
+            value = self.tokenizer.string_val()
 
-        self.output.write("<" + self.dict[type] + "> " + str(value) + " </" + self.dict[type] + ">\n")
+        self.output.write("<" + self.tags[kind] + "> " + str(value) + " </" + self.tags[kind] + ">\n")
         self.tokenizer.advance()
 
     def write_tabs(self, state=None, token=None):
@@ -354,14 +336,13 @@ class CompilationEngine:
         self.write_tabs("close", "subroutineBody")
 
     def is_valid_type(self):
-        if self.tokenizer.cur_token in NON_VALID_TYPE:
+        if self.tokenizer.cur_kind != IDENTIFIER and \
+                self.tokenizer.cur_token not in TYPE_KEYWORDS:
             self.eat(1)
         self.write_out()
 
     def is_valid_name(self):
-        if self.tokenizer.cur_token in NON_VALID_NAME:
-            self.eat(1)
-        if self.tokenizer.cur_token[0] in INTEGERS:
+        if self.tokenizer.cur_kind != IDENTIFIER:
             self.eat(1)
         self.write_out()
 
@@ -5,6 +5,10 @@ was written by Aviv Yaish. It is an extension to the specifications given
 as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
 Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
 """
+import argparse
+import concurrent.futures
+import contextlib
+import io
 import os
 import sys
 import typing
@@ -27,28 +31,78 @@ def analyze_file(
 
 
 
+def analyze_path(input_path: str) -> str:
+    """Analyzes a .jack file into a .xml file with the same name. This is the
+    unit of work handed to the worker processes, so it opens the files
+    itself.
+
+    Args:
+        input_path (str): path of the file to analyze.
+
+    Returns:
+        str: everything the analyzer printed while analyzing the file.
+    """
+    output_path = os.path.splitext(input_path)[0] + ".xml"
+    with open(input_path, 'r') as input_file, \
+            open(output_path, 'w') as output_file, \
+            contextlib.redirect_stdout(io.StringIO()) as log:
+        analyze_file(input_file, output_file)
+    return log.getvalue()
+
+
+def analyze_paths(input_paths: typing.List[str], jobs: int = 1) -> bool:
+    """Analyzes every given file, possibly in parallel. Whatever the number
+    of jobs, the printed output and the errors are reported file by file, in
+    the order of the given paths.
+
+    Args:
+        input_paths (list): paths of the files to analyze.
+        jobs (int): how many worker processes to use, 1 analyzes in-process.
+
+    Returns:
+        bool: True if every file was analyzed, False otherwise.
+    """
+    if jobs > 1:
+        executor = concurrent.futures.ProcessPoolExecutor(jobs)
+        results = [executor.submit(analyze_path, input_path)
+                   for input_path in input_paths]
+    else:
+        executor = None
+        results = input_paths
+    success = True
+    for input_path, result in zip(input_paths, results):
+        try:
+            if executor is None:
+                log = analyze_path(input_path)
+            else:
+                log = result.result()
+        except Exception as error:
+            print(input_path + ": " + str(error).strip(), file=sys.stderr)
+            success = False
+            continue
+        sys.stdout.write(log)
+    if executor is not None:
+        executor.shutdown()
+    return success
+
+
 if "__main__" == __name__:
-    # Parses the input path and calls analyze_file on each input file.
-    # This opens both the input and the output files!
-    # Both are closed automatically when the code finishes running.
-    # If the output file does not exist, it is created automatically in the
-    # correct path, using the correct filename.
-    # analyze_file("NAND\NAND11\Seven\Main.jack","NAND\NAND11\Seven\Main.vm")
-
-    if not len(sys.argv) == 2:
-        sys.exit("Invalid usage, please use: JackAnalyzer <input path>")
-    argument_path = os.path.abspath(sys.argv[1])
+    # Parses the input path and analyzes each input file. The output file of
+    # every class is created next to it, using the correct filename.
+    parser = argparse.ArgumentParser(prog="JackAnalyzer")
+    parser.add_argument("input_path")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="analyze the files in N worker processes")
+    args = parser.parse_args()
+    argument_path = os.path.abspath(args.input_path)
     if os.path.isdir(argument_path):
         files_to_assemble = [
             os.path.join(argument_path, filename)
-            for filename in os.listdir(argument_path)]
+            for filename in sorted(os.listdir(argument_path))]
     else:
         files_to_assemble = [argument_path]
-    for input_path in files_to_assemble:
-        filename, extension = os.path.splitext(input_path)
-        if extension.lower() != ".jack":
-            continue
-        output_path = filename + ".xml"
-        with open(input_path, 'r') as input_file, \
-                open(output_path, 'w') as output_file:
-            analyze_file(input_file, output_file)
+    files_to_assemble = [
+        input_path for input_path in files_to_assemble
+        if os.path.splitext(input_path)[1].lower() == ".jack"]
+    if not analyze_paths(files_to_assemble, args.jobs):
+        sys.exit(1)
@@ -0,0 +1,1418 @@
+"""
+This file is part of nand2tetris, as taught in The Hebrew University, and
+was written by Aviv Yaish. It is an extension to the specifications given
+[here](https://www.nand2tetris.org) (Shimon Schocken and Noam Nisan, 2017),
+as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
+"""
+import contextlib
+import io
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import typing
+import CallGraph
+import ControlFlow
+import JackLexer
+import SourceMap
+import StringPool
+import VMInliner
+import VMOptimizer
+from BuildCache import BuildCache
+from CompilationEngine import CompilationEngine
+from HackEmulator import HackEmulator
+from HackWriter import HackWriter, link, rom_size
+from JackCompiler import compile_project
+from JackTokenizer import JackTokenizer
+from SymbolTable import SymbolTable
+from VMInterpreter import VMInterpreter, parse
+from VMProfiler import Profile
+from VMJit import TRANSLATIONS, VMJit
+from VMWriter import BUFFER_SIZE, VMWriter, encode
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLES = os.path.join(ROOT, "NAND11")
+
+
+def jack_sources(path: str = ROOT) -> typing.List[str]:
+    """Reads every .jack file under the given path.
+
+    Args:
+        path (str): a directory to search recursively, or a single file.
+
+    Returns:
+        list: the contents of the files, sorted by path.
+    """
+    if not os.path.isdir(path):
+        with open(path, 'r') as input_file:
+            return [input_file.read()]
+    paths = []
+    for dir_path, dir_names, file_names in os.walk(path):
+        for filename in file_names:
+            if os.path.splitext(filename)[1].lower() == ".jack":
+                paths.append(os.path.join(dir_path, filename))
+    sources = []
+    for input_path in sorted(paths):
+        with open(input_path, 'r') as input_file:
+            sources.append(input_file.read())
+    return sources
+
+
+def best_time(function: typing.Callable, repeat: int = 5) -> float:
+    """Runs a function a few times.
+
+    Args:
+        function (typing.Callable): a function without arguments.
+        repeat (int): how many times to run it.
+
+    Returns:
+        float: the fastest run, in seconds.
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def bench_tokenizer(path: str = ROOT) -> None:
+    """Compares the throughput of the tokenizer backends, in chars/sec."""
+    sources = jack_sources(path)
+    chars = sum(len(source) for source in sources)
+    print("tokenizer: %d files, %d chars" % (len(sources), chars))
+    results = {}
+    for name, backend in JackLexer.BACKENDS.items():
+        elapsed = best_time(lambda: [backend(source) for source in sources])
+        results[name] = elapsed
+        print("  %-8s %10.3f ms %14.0f chars/sec"
+              % (name, elapsed * 1000, chars / elapsed))
+    print("  speedup  %10.1fx" % (results["legacy"] / results["regex"]))
+
+
+def scan_token_type(token: str) -> str:
+    """Classifies a token the way token_type() used to, by scanning the
+    keyword and symbol lists on every call.
+    """
+    if token in JackLexer.KEYORDS:
+        return "KEYWORD"
+    elif token in JackLexer.SYMBOLS:
+        return "SYMBOL"
+    elif token[0] in JackLexer.INTEGERS:
+        return "INT_CONST"
+    elif token[0] in ['\"', '\'']:
+        return "STRING_CONST"
+    else:
+        return "IDENTIFIER"
+
+
+def compile_sources(sources: typing.List[str], backend: str = "regex",
+                    **options) -> typing.List[str]:
+    """Compiles the given sources into memory.
+
+    Args:
+        sources (list): the sources of the classes.
+        backend (str): the lexer to use.
+        options: keyword arguments for the CompilationEngine.
+
+    Returns:
+        list: the VM code of every class.
+    """
+    outputs = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for source in sources:
+            tokenizer = JackTokenizer(io.StringIO(source), backend)
+            output = io.StringIO()
+            CompilationEngine(tokenizer, output, **options)
+            outputs.append(output.getvalue())
+    return outputs
+
+
+def sample_programs(path: str = SAMPLES) -> typing.Dict[str, typing.List[str]]:
+    """Reads the programs under a directory: every directory which has .jack
+    files directly inside it is a program.
+
+    Args:
+        path (str): the directory to search.
+
+    Returns:
+        dict: the sources of every program's classes, by program name.
+    """
+    programs = {}
+    for dir_path, dir_names, file_names in sorted(os.walk(path)):
+        sources = []
+        for filename in sorted(file_names):
+            if os.path.splitext(filename)[1].lower() == ".jack":
+                sources.extend(jack_sources(os.path.join(dir_path, filename)))
+        if sources:
+            programs[os.path.relpath(dir_path, path)] = sources
+    return programs
+
+
+def count_instructions(outputs: typing.List[str]) -> int:
+    """
+    Args:
+        outputs (list): VM code.
+
+    Returns:
+        int: the number of VM instructions in it.
+    """
+    return sum(output.count("\n") for output in outputs)
+
+
+def count_math_calls(outputs: typing.List[str]) -> int:
+    """
+    Args:
+        outputs (list): VM code.
+
+    Returns:
+        int: the number of calls to Math.multiply and Math.divide in it.
+    """
+    return sum(output.count("call Math.multiply 2\n") +
+               output.count("call Math.divide 2\n") for output in outputs)
+
+
+def report_counts(title: str, path: str,
+                  options: typing.Dict[str, typing.Any],
+                  count: typing.Callable = count_instructions,
+                  unit: str = "VM instructions") -> None:
+    """Prints a count over every program under a directory, compiled without
+    and with the given options.
+    """
+    print("%s: %s" % (title, unit))
+    total_before = total_after = 0
+    for name, sources in sample_programs(path).items():
+        before = count(compile_sources(sources))
+        after = count(compile_sources(sources, **options))
+        total_before += before
+        total_after += after
+        print("  %-24s %7d %7d %6.1f%%"
+              % (name, before, after,
+                 100.0 * (before - after) / max(before, 1)))
+    print("  %-24s %7d %7d %6.1f%%" % (
+        "total", total_before, total_after,
+        100.0 * (total_before - total_after) / max(total_before, 1)))
+
+
+def bench_peephole(path: str = SAMPLES) -> None:
+    """Reports the VM instruction counts before and after -O."""
+    report_counts("peephole", path, {"optimize": True})
+
+
+def bench_fold(path: str = SAMPLES) -> None:
+    """Reports the Math.multiply and Math.divide calls left after -O folds
+    the constants of a project.
+    """
+    report_counts("fold", path, {"optimize": True}, count_math_calls,
+                  "Math.multiply and Math.divide calls")
+
+
+def bench_tokens(path: str = SAMPLES) -> None:
+    """Measures the per token overhead of classifying and compiling."""
+    sources = jack_sources(path)
+    all_tokens = [JackLexer.tokenize(source) for source in sources]
+    count = sum(len(tokens) for tokens in all_tokens)
+    print("tokens: %d files, %d tokens" % (len(sources), count))
+
+    def scan():
+        for tokens in all_tokens:
+            for text in tokens.texts:
+                scan_token_type(text)
+
+    def lookup():
+        types = JackLexer.TOKEN_TYPES
+        for tokens in all_tokens:
+            for kind in tokens.kinds:
+                types[kind]
+
+    rows = [("classify, list scans", scan),
+            ("classify, kind lookup", lookup)]
+    for name in JackLexer.BACKENDS:
+        rows.append(("compile, %s lexer" % name,
+                     lambda name=name: compile_sources(sources, backend=name)))
+    for name, function in rows:
+        elapsed = best_time(function)
+        print("  %-24s %10.3f ms %10.1f ns/token"
+              % (name, elapsed * 1000, elapsed * 1e9 / count))
+
+
+def write_synthetic_class(
+        output_file: typing.TextIO, name: str, size: int) -> None:
+    """Writes a valid Jack class of roughly the given size, one subroutine
+    at a time.
+
+    Args:
+        output_file (typing.TextIO): writes the class to this file.
+        name (str): the name of the class.
+        size (int): the wanted size of the source, in chars.
+    """
+    output_file.write("/** A generated class. */\nclass " + name + " {\n"
+                      "    static int count;\n")
+    index = 0
+    while output_file.tell() < size:
+        output_file.write(
+            "    /** Generated function number %d. */\n"
+            "    function int f%d(int x, int y) {\n"
+            "        var int i, sum;\n"
+            "        let i = 0;\n"
+            "        let sum = x;\n"
+            "        while (i < y) {\n"
+            "            let sum = sum + (i * %d) - (x / 2);\n"
+            "            let i = i + 1;\n"
+            "        }\n"
+            "        let count = count + 1;\n"
+            "        return sum;\n"
+            "    }\n" % (index, index, index))
+        index += 1
+    output_file.write("}\n")
+
+
+# Compiles a file in a fresh interpreter and prints its peak RSS.
+PEAK_RSS_SCRIPT = """
+import contextlib, os, resource, sys
+from JackCompiler import compile_file
+with open(sys.argv[1]) as input_file, open(os.devnull, "w") as output_file:
+    with contextlib.redirect_stdout(output_file):
+        compile_file(input_file, output_file, sys.argv[2] == "stream")
+print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+"""
+
+
+def peak_rss(input_path: str, mode: str) -> int:
+    """Compiles a file in a subprocess.
+
+    Args:
+        input_path (str): the file to compile.
+        mode (str): "stream" to lex lazily, anything else to read it whole.
+
+    Returns:
+        int: the peak RSS of the subprocess, in KB.
+    """
+    output = subprocess.run(
+        [sys.executable, "-c", PEAK_RSS_SCRIPT, input_path, mode],
+        cwd=SAMPLES, check=True, stdout=subprocess.PIPE,
+        universal_newlines=True).stdout
+    return int(output.split()[-1])
+
+
+def bench_memory(*sizes: str) -> None:
+    """Compares the peak RSS of whole-file and streaming tokenizing on
+    synthetic classes of the given sizes, in MB (Unix only).
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for size in [float(size) for size in sizes] or [1, 4]:
+            input_path = os.path.join(temp_dir, "Main.jack")
+            with open(input_path, "w") as input_file:
+                write_synthetic_class(input_file, "Main", int(size * 2 ** 20))
+            results = ["%s %8d KB" % (mode, peak_rss(input_path, mode))
+                       for mode in ("whole", "stream")]
+            print("memory: %5.1f MB source  %s" % (size, "  ".join(results)))
+
+
+def bench_jobs(*arguments: str) -> None:
+    """Measures how JackCompiler --jobs scales on a generated corpus.
+
+    Args:
+        arguments: optionally, the number of classes and of KB per class.
+    """
+    classes, size = [int(argument) for argument in arguments] + \
+        [300, 8][len(arguments):]
+    compiler = os.path.join(SAMPLES, "JackCompiler.py")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        write_corpus(temp_dir, classes, size)
+        print("jobs: %d classes of %d KB, %d cpus"
+              % (classes, size, os.cpu_count()))
+        serial = None
+        for jobs in (1, 2, 4, 8):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, compiler, temp_dir,
+                            "--jobs", str(jobs)],
+                           check=True, stdout=subprocess.DEVNULL)
+            elapsed = time.perf_counter() - start
+            serial = serial or elapsed
+            print("  --jobs %d %10.3f s %8.2fx" % (jobs, elapsed,
+                                                  serial / elapsed))
+
+
+def write_corpus(output_dir: str, classes: int, size: int) -> typing.List[str]:
+    """Writes generated classes into a directory.
+
+    Args:
+        output_dir (str): the directory to write into.
+        classes (int): how many classes to write.
+        size (int): the size of every class, in KB.
+
+    Returns:
+        list: the paths of the written files.
+    """
+    paths = []
+    for index in range(classes):
+        class_name = "Class%d" % index
+        paths.append(os.path.join(output_dir, class_name + ".jack"))
+        with open(paths[-1], "w") as input_file:
+            write_synthetic_class(input_file, class_name, size * 1024)
+    return paths
+
+
+def bench_cache(*arguments: str) -> None:
+    """Times a full build, a no-op rebuild and a rebuild after changing a
+    single class, with the build cache on.
+
+    Args:
+        arguments: optionally, the number of classes and of KB per class.
+    """
+    classes, size = [int(argument) for argument in arguments] + \
+        [300, 8][len(arguments):]
+    with tempfile.TemporaryDirectory() as temp_dir:
+        paths = write_corpus(temp_dir, classes, size)
+        print("cache: %d classes of %d KB" % (classes, size))
+        cache_dir = os.path.join(temp_dir, "cache")
+        for name in ("cold build", "no-op rebuild", "one class changed"):
+            if name == "one class changed":
+                with open(paths[0], "a") as input_file:
+                    input_file.write("// changed\n")
+            cache = BuildCache(cache_dir)
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                compile_project(paths, cache=cache)
+            elapsed = time.perf_counter() - start
+            print("  %-18s %10.1f ms  %s" % (name, elapsed * 1000, cache))
+
+
+def many_locals_class(count: int) -> str:
+    """
+    Args:
+        count (int): how many locals to declare.
+
+    Returns:
+        str: a class with one function which declares the given number of
+        locals and references each of them a few times.
+    """
+    names = ["v%d" % index for index in range(count)]
+    lines = ["class Main {", "    function int f(int x) {"]
+    lines.extend("        var int %s;" % name for name in names)
+    lines.append("        let v0 = x;")
+    for index in range(1, count):
+        lines.append("        let %s = %s + %s;" % (
+            names[index], names[index - 1], names[index * 7 % count]))
+    lines.extend(["        return %s;" % names[-1], "    }", "}"])
+    return "\n".join(lines)
+
+
+def bench_symbols() -> None:
+    """Measures symbol table lookups and compilation as the number of
+    locals in a subroutine grows.
+    """
+    for count in (10, 100, 1000, 5000):
+        table = SymbolTable()
+        table.start_subroutine()
+        names = ["v%d" % index for index in range(count)]
+        for name in names:
+            table.define(name, "int", "VAR")
+
+        def lookups():
+            for name in names:
+                table.kind_of(name)
+                table.type_of(name)
+                table.index_of(name)
+
+        lookup_time = best_time(lookups) / (3 * count)
+        source = many_locals_class(count)
+        compile_time = best_time(lambda: compile_sources([source]), 3)
+        print("symbols: %5d locals %8.1f ns/lookup %10.2f us/statement"
+              % (count, lookup_time * 1e9, compile_time * 1e6 / count))
+
+
+def long_expression_class(terms: int) -> str:
+    """
+    Args:
+        terms (int): how many terms the expression has.
+
+    Returns:
+        str: a class with one function which returns a single expression of
+        the given number of terms, mixing variables, constants, array entries,
+        calls and every operator.
+    """
+    operators = ["+", "-", "*", "&", "|", "/", "<", ">", "="]
+    parts = ["x"]
+    for index in range(1, terms):
+        term = ("x", "%d" % index, "a[%d]" % (index % 8), "Main.f(x)",
+                "(x + %d)" % index, "-y")[index % 6]
+        parts.append(operators[index % len(operators)])
+        parts.append(term)
+    return "\n".join([
+        "class Main {", "    function int f(int x) {",
+        "        var int y; var Array a;",
+        "        return " + " ".join(parts) + ";", "    }", "}"])
+
+
+def bench_expressions(path: str = SAMPLES) -> None:
+    """Measures the time to parse expressions into trees and generate their
+    code, on the samples and on single expressions of growing length,
+    including some far beyond sys.getrecursionlimit().
+    """
+    print("expressions: recursion limit %d" % sys.getrecursionlimit())
+    rows = [("samples", jack_sources(path))]
+    for terms in (10, 100, 1000, 10000, 100000):
+        rows.append(("%d terms" % terms, [long_expression_class(terms)]))
+    for name, sources in rows:
+        lex_time = best_time(
+            lambda: [JackLexer.tokenize(source) for source in sources], 3)
+        compile_time = best_time(lambda: compile_sources(sources), 3)
+        count = sum(len(JackLexer.tokenize(source)) for source in sources)
+        print("  %-14s %8d tokens %10.2f ms parse+codegen %8.1f ns/token"
+              % (name, count, (compile_time - lex_time) * 1000,
+                 (compile_time - lex_time) * 1e9 / count))
+
+
+def run_program(outputs: typing.List[str], max_steps: int,
+                machine: typing.Type[VMInterpreter] = VMInterpreter
+                ) -> VMInterpreter:
+    """Runs compiled classes in the VM interpreter.
+
+    Args:
+        outputs (list): the VM code of every class.
+        max_steps (int): the largest number of instructions to execute.
+        machine (type): VMInterpreter, or a subclass of it like VMJit.
+
+    Returns:
+        VMInterpreter: the machine, after the run.
+    """
+    interpreter = machine()
+    for index, output in enumerate(outputs):
+        interpreter.load_source("Class%d" % index, output)
+    interpreter.run(max_steps)
+    return interpreter
+
+
+def bench_vm(path: str = SAMPLES, max_steps: str = "2000000") -> None:
+    """Runs every program under a directory in the VM interpreter, compiled
+    without and with -O, and checks that both print the same text and draw
+    the same screen.
+    """
+    print("vm: executed VM instructions, without and with -O")
+    for name, sources in sample_programs(path).items():
+        plain = run_program(compile_sources(sources), int(max_steps))
+        optimized = run_program(compile_sources(sources, optimize=True),
+                                int(max_steps))
+        same = plain.output() == optimized.output() and \
+            plain.screen_checksum() == optimized.screen_checksum()
+        print("  %-16s %9d %9d %11.0f/s  %-10s %s" % (
+            name, plain.steps, optimized.steps,
+            plain.steps / plain.elapsed, plain.halted,
+            "same" if same else "DIFFERENT"))
+
+
+# A MathTest-style program: multiplication, division and square roots
+# written in Jack, so the calls and loops run in the VM rather than the OS.
+MATH_WORKLOAD = """
+class Main {
+    function int multiply(int x, int y) {
+        var int sum, shifted, bit, i;
+        let shifted = x;
+        let bit = 1;
+        while (i < 16) {
+            if (~((y & bit) = 0)) {
+                let sum = sum + shifted;
+            }
+            let shifted = shifted + shifted;
+            let bit = bit + bit;
+            let i = i + 1;
+        }
+        return sum;
+    }
+
+    function int divide(int x, int y) {
+        var int q;
+        if ((y > x) | (y < 0)) {
+            return 0;
+        }
+        let q = Main.divide(x, y + y);
+        if ((x - Main.multiply(q + q, y)) < y) {
+            return q + q;
+        }
+        return q + q + 1;
+    }
+
+    function int sqrt(int x) {
+        var int y, j, t, tt;
+        let j = 7;
+        while (~(j < 0)) {
+            let t = y + Main.power(j);
+            let tt = Main.multiply(t, t);
+            if ((~(tt > x)) & (tt > 0)) {
+                let y = t;
+            }
+            let j = j - 1;
+        }
+        return y;
+    }
+
+    function int power(int j) {
+        var int p;
+        let p = 1;
+        while (j > 0) {
+            let p = p + p;
+            let j = j - 1;
+        }
+        return p;
+    }
+
+    function void main() {
+        var int i, total;
+        var Array results;
+        let results = Array.new(16);
+        let i = 1;
+        while (i < 300) {
+            let total = total + Main.multiply(i, 37) + Main.divide(30000, i)
+                + Main.sqrt(i * 100);
+            let results[i & 15] = total;
+            let i = i + 1;
+        }
+        do Output.printInt(total);
+        return;
+    }
+}
+"""
+
+
+def bench_jit(path: str = SAMPLES, max_steps: str = "3000000",
+              repeat: str = "20") -> None:
+    """Compares the VM interpreter with the VMJit on the programs under a
+    directory and on a MathTest-style workload, and checks that both print
+    the same text and draw the same screen. Every program is run repeat
+    times on a fresh machine, so the short ones take long enough to time.
+    The rates only count the runs; loading and linking, which is where the
+    JIT translates, are timed on their own, and the JIT only translates on
+    its first run.
+    """
+    programs = sample_programs(path)
+    programs["MathWorkload"] = [MATH_WORKLOAD]
+    print("jit: VM instructions per second, interpreter vs. VMJit, and the "
+          "load+link time of a run")
+    for name, sources in programs.items():
+        outputs = compile_sources(sources)
+        rates = []
+        links = []
+        machines = []
+        for machine in (VMInterpreter, VMJit):
+            TRANSLATIONS.clear()
+            steps = elapsed = total = 0
+            for _ in range(int(repeat)):
+                start = time.perf_counter()
+                result = run_program(outputs, int(max_steps), machine)
+                total += time.perf_counter() - start
+                elapsed += result.elapsed
+                steps += result.steps
+            rates.append(steps / elapsed)
+            links.append((total - elapsed) / int(repeat))
+            machines.append(result)
+        plain, jit = machines
+        same = plain.output() == jit.output() and \
+            plain.screen_checksum() == jit.screen_checksum()
+        print("  %-14s %8d steps %10.0f/s %11.0f/s %6.1fx %7.2f ms %7.2f ms"
+              "  %s" % (name, plain.steps, rates[0], rates[1],
+                        rates[1] / rates[0], links[0] * 1000,
+                        links[1] * 1000, "same" if same else "DIFFERENT"))
+
+
+def translate_outputs(outputs: typing.List[str],
+                      trampolines: bool = True) -> typing.List[str]:
+    """Translates VM code into Hack assembly, after parsing its text.
+
+    Args:
+        outputs (list): the VM code of every class.
+        trampolines (bool): use the shared call and return routines.
+
+    Returns:
+        list: the Hack assembly of every class.
+    """
+    translations = []
+    for output in outputs:
+        translation = io.StringIO()
+        writer = HackWriter(translation, trampolines=trampolines)
+        for instruction in parse(output):
+            writer.emit(instruction)
+        writer.flush()
+        translations.append(translation.getvalue())
+    return translations
+
+
+def bench_asm(path: str = SAMPLES) -> None:
+    """Reports the ROM size of every program under a directory, translated
+    with call, return and comparison sequences written out at every use and
+    with the shared trampolines, and times compiling straight to assembly
+    against compiling to VM code and translating its text.
+    """
+    print("asm: words of ROM, inline vs. trampolines, and the time to compile "
+          "through VM text vs. straight to assembly")
+    for name, sources in sample_programs(path).items():
+        outputs = compile_sources(sources)
+        inline = rom_size(link(translate_outputs(outputs, False), False))
+        shared = rom_size(link(translate_outputs(outputs)))
+        direct = best_time(lambda: compile_sources(sources, target="asm"), 3)
+        round_trip = best_time(
+            lambda: translate_outputs(compile_sources(sources)), 3)
+        print("  %-16s %7d %7d %6.1f%% %9.2f ms %9.2f ms" % (
+            name, inline, shared, 100.0 * (inline - shared) / inline,
+            round_trip * 1000, direct * 1000))
+
+
+def bench_hack(path: str = SAMPLES, budget: str = "20000000") -> None:
+    """Runs every program under a directory on the Hack emulator, translated
+    with the calls written out and with the shared trampolines, and reports
+    the cycles each takes, and per VM instruction run by the interpreter
+    for the programs which stop within the budget.
+    """
+    print("hack: cycles, inline vs. trampolines, and cycles per VM "
+          "instruction")
+    for name, sources in sample_programs(path).items():
+        outputs = compile_sources(sources)
+        steps = run_program(outputs, int(budget) // 10).steps
+        emulators = []
+        for trampolines in (False, True):
+            emulator = HackEmulator()
+            emulator.load_source(link(translate_outputs(outputs, trampolines),
+                                      trampolines))
+            emulator.run(int(budget))
+            emulators.append(emulator)
+        inline, shared = emulators
+        if shared.halted == "cycle budget":
+            ratios = "     -      -"
+        else:
+            ratios = "%6.1f %6.1f" % (inline.cycles / steps,
+                                     shared.cycles / steps)
+        print("  %-16s %9d %9d %s %11.0f/s  %s" % (
+            name, inline.cycles, shared.cycles, ratios,
+            shared.cycles / shared.elapsed, shared.halted))
+
+
+def bench_profile(path: str = SAMPLES, max_steps: str = "3000000") -> None:
+    """Measures the cost of profiling a run of the VM interpreter, on the
+    programs under a directory and on the MathTest-style workload, and
+    prints the most expensive functions of each program.
+    """
+    programs = sample_programs(path)
+    programs["MathWorkload"] = [MATH_WORKLOAD]
+    print("profile: run time without and with a profile, and the top "
+          "functions by exclusive instructions")
+    for name, sources in programs.items():
+        outputs = compile_sources(sources)
+        plain = best_time(lambda: run_program(outputs, int(max_steps)), 3)
+        profiles = []
+
+        def profiled():
+            profile = Profile()
+            interpreter = VMInterpreter()
+            for index, output in enumerate(outputs):
+                interpreter.load_source("Class%d" % index, output)
+            interpreter.run(int(max_steps), profile)
+            profiles.append(profile)
+
+        elapsed = best_time(profiled, 3)
+        top = sorted(profiles[-1].functions.items(),
+                     key=lambda item: -item[1].exclusive)[:3]
+        print("  %-16s %9.2f ms %9.2f ms %+6.1f%%  %s" % (
+            name, plain * 1000, elapsed * 1000,
+            100.0 * (elapsed - plain) / plain,
+            ", ".join("%s %d" % (function, stats.exclusive)
+                      for function, stats in top)))
+
+
+def compile_with_maps(sources: typing.List[str], **options) -> typing.List[
+        str]:
+    """Compiles the given sources into memory, with source maps.
+
+    Args:
+        sources (list): the sources of the classes.
+        options: keyword arguments for the CompilationEngine.
+
+    Returns:
+        list: the source map of every class.
+    """
+    maps = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for source in sources:
+            tokenizer = JackTokenizer(io.StringIO(source))
+            engine = CompilationEngine(tokenizer, io.StringIO(),
+                                       source_map=True, **options)
+            maps.append(SourceMap.encode(engine.source_lines))
+    return maps
+
+
+def bench_sourcemap(path: str = SAMPLES) -> None:
+    """Measures what source maps cost: the compile time of the programs
+    under a directory without and with them, with and without -O, and the
+    size of the maps against the size of the VM code.
+    """
+    print("sourcemap: compile time without and with maps, and map size")
+    for name, sources in sample_programs(path).items():
+        row = []
+        for optimize in (False, True):
+            plain = best_time(lambda: compile_sources(
+                sources, optimize=optimize), 5)
+            mapped = best_time(lambda: compile_with_maps(
+                sources, optimize=optimize), 5)
+            row.append("%8.2f ms %+6.1f%%" % (
+                plain * 1000, 100.0 * (mapped - plain) / plain))
+        code = sum(len(output) for output in compile_sources(sources))
+        maps = sum(len(text) for text in compile_with_maps(sources))
+        print("  %-16s %s  -O %s  %7d bytes %5.1f%% of the code" % (
+            name, row[0], row[1], maps, 100.0 * maps / code))
+
+
+# A game loop which prints the same labels every frame.
+STRING_WORKLOAD = """
+class Main {
+    function void main() {
+        var int frame;
+        let frame = 0;
+        while (frame < 200) {
+            do Output.moveCursor(0, 0);
+            do Output.printString("Score: ");
+            do Output.printInt(frame);
+            do Output.printString(" Lives: ");
+            do Output.printInt(3);
+            let frame = frame + 1;
+        }
+        do Output.printString("Game Over");
+        return;
+    }
+}
+"""
+
+
+def compile_pooled(sources: typing.List[str], **options) -> typing.List[str]:
+    """Compiles the given sources into memory in string pool mode.
+
+    Args:
+        sources (list): the sources of the classes.
+        options: keyword arguments for the CompilationEngine.
+
+    Returns:
+        list: the VM code of every class, followed by the pool class.
+    """
+    pool = io.StringIO()
+    StringPool.write_pool(StringPool.collect(sources), VMWriter(pool))
+    return compile_sources(sources, string_pool=True, **options) + [
+        pool.getvalue()]
+
+
+def bench_stringpool(max_steps: str = "3000000") -> None:
+    """Runs OutputTest, Pong and a game loop which prints labels, without
+    and with the string pool, and counts the executed VM instructions and
+    the strings allocated and filled on the heap.
+    """
+    programs = {"OutputTest": sample_programs(os.path.join(
+                    ROOT, "NAND12", "OutputTest"))["."],
+                "Pong": sample_programs(os.path.join(SAMPLES, "Pong"))["."],
+                "StringWorkload": [STRING_WORKLOAD]}
+    print("stringpool: executed VM instructions, String.new and "
+          "String.appendChar calls, without and with the pool")
+    for name, sources in programs.items():
+        row = []
+        machines = []
+        for outputs in (compile_sources(sources), compile_pooled(sources)):
+            profile = Profile()
+            interpreter = VMInterpreter()
+            for index, output in enumerate(outputs):
+                interpreter.load_source("Class%d" % index, output)
+            interpreter.run(int(max_steps), profile)
+            calls = [profile.functions[function].calls
+                     if function in profile.functions else 0
+                     for function in ("String.new", "String.appendChar")]
+            row.append("%9d %5d %6d" % (interpreter.steps, *calls))
+            machines.append(interpreter)
+        same = machines[0].output() == machines[1].output() and \
+            machines[0].screen_checksum() == machines[1].screen_checksum()
+        print("  %-16s %s   %s  %s" % (name, row[0], row[1],
+                                     "same" if same else "DIFFERENT"))
+
+
+# Fills the character map of the Output class from NAND12.
+INIT_MAP_MAIN = """
+class Main {
+    function void main() {
+        do Output.initMap();
+        return;
+    }
+}
+"""
+
+
+def bench_tables() -> None:
+    """Runs Output.initMap, which fills a table of 95 arrays of 11 entries
+    at constant indices, without and with -O, and counts the VM
+    instructions of the functions which fill it.
+    """
+    with open(os.path.join(ROOT, "NAND12", "Output.jack"), 'r') as output:
+        sources = [output.read(), INIT_MAP_MAIN]
+    print("tables: VM instructions executed by Output.initMap and "
+          "Output.create, and written in Output.create")
+    for optimize in (False, True):
+        outputs = compile_sources(sources, optimize=optimize)
+        profile = Profile()
+        interpreter = VMInterpreter()
+        for index, output in enumerate(outputs):
+            interpreter.load_source("Class%d" % index, output)
+        interpreter.run(None, profile)
+        create = parse(outputs[0])
+        start = create.index(("function", "Output.create", 1))
+        end = next(index for index in range(start + 1, len(create))
+                   if create[index][0] == "function")
+        print("  %-4s %9d %9d %9d" % (
+            "-O" if optimize else "", profile.functions[
+                "Output.initMap"].inclusive,
+            profile.functions["Output.create"].inclusive, end - start))
+
+
+def bench_prune(path: str = SAMPLES) -> None:
+    """Compiles every program under a directory on its own and with the
+    NAND12 OS classes, drops the functions which can't be reached from
+    Main.main or Sys.init, and reports the functions, the VM instructions
+    and the ROM words before and after.
+    """
+    os_path = os.path.join(ROOT, "NAND12")
+    os_sources = []
+    for filename in sorted(os.listdir(os_path)):
+        if os.path.splitext(filename)[1].lower() == ".jack":
+            os_sources.extend(jack_sources(os.path.join(os_path, filename)))
+    print("prune: functions, VM instructions and ROM words, before and "
+          "after dropping unreachable functions")
+    for name, sources in sample_programs(path).items():
+        for title, program in ((name, sources), ("  + NAND12 OS",
+                                                 sources + os_sources)):
+            before = compile_sources(program)
+            after = CallGraph.prune(before)
+            row = []
+            for size in (lambda texts: sum(text.count("function ")
+                                           for text in texts),
+                         count_instructions,
+                         lambda texts: sum(rom_size(text) for text in
+                                           translate_outputs(texts))):
+                row.append("%6d %6d" % (size(before), size(after)))
+            print("  %-16s %s" % (title, "   ".join(row)))
+
+
+# Points whose coordinates are read through getters in a loop.
+POINT_WORKLOAD = ["""
+class Point {
+    field int x, y;
+    constructor Point new(int ax, int ay) {
+        let x = ax;
+        let y = ay;
+        return this;
+    }
+    method int getX() { return x; }
+    method int getY() { return y; }
+    method void moveBy(int dx) { let x = x + dx; return; }
+}
+""", """
+class Main {
+    function void main() {
+        var Point a, b;
+        var int i, sum;
+        let a = Point.new(1, 2);
+        let b = Point.new(3, 4);
+        let i = 0;
+        while (i < 500) {
+            let sum = sum + a.getX() + b.getY();
+            do a.moveBy(1);
+            let i = i + 1;
+        }
+        do Output.printInt(sum);
+        return;
+    }
+}
+"""]
+
+
+def bench_inline(path: str = SAMPLES, threshold: str = "8",
+                 budget: str = "20000000") -> None:
+    """Inlines the small leaf functions of the programs under a directory
+    and of a workload which calls getters in a loop, and reports the
+    inlined calls, the executed VM instructions, the Hack cycles and the
+    ROM words before and after.
+    """
+    programs = sample_programs(path)
+    programs["PointWorkload"] = POINT_WORKLOAD
+    print("inline: calls inlined, VM instructions, Hack cycles and ROM "
+          "words, before and after")
+    for name, sources in programs.items():
+        before = compile_sources(sources, optimize=True)
+        after, inlined = VMInliner.inline(before, int(threshold))
+        row = []
+        for outputs in (before, after):
+            machine = run_program(outputs, int(budget) // 10)
+            program = link(translate_outputs(outputs))
+            emulator = HackEmulator()
+            emulator.load_source(program)
+            emulator.run(int(budget))
+            same = (machine.output(), machine.screen_checksum()) == (
+                emulator.output(), emulator.screen_checksum())
+            row.append((machine.steps, emulator.cycles, rom_size(program),
+                        same, machine.output()))
+        print("  %-16s %4d  %8d %8d  %9d %9d  %6d %6d  %s" % (
+            name, sum(inlined.values()), row[0][0], row[1][0], row[0][1],
+            row[1][1], row[0][2], row[1][2],
+            "same" if row[0][3] and row[1][3] and row[0][4] == row[1][4]
+            else "DIFFERENT"))
+
+
+# A function whose locals hold one intermediate result after another, called
+# in a loop.
+LOCALS_WORKLOAD = """
+class Main {
+    function int score(int a, int b) {
+        var int sum, i, diff, j, product, k;
+        let sum = a + b;
+        let i = sum + 1;
+        let diff = a - b;
+        let j = diff + i;
+        let product = j + j;
+        let k = product - a;
+        return k;
+    }
+
+    function void main() {
+        var int i, total;
+        let i = 0;
+        while (i < 300) {
+            let total = total + Main.score(i, 3);
+            let i = i + 1;
+        }
+        do Output.printInt(total);
+        return;
+    }
+}
+"""
+
+
+def bench_locals(path: str = SAMPLES, budget: str = "20000000") -> None:
+    """Compiles the programs under a directory and a workload with short
+    lived locals with -O, without and with local slot reuse, and reports
+    the frames which shrank, their locals before and after, and the Hack
+    cycles of a run before and after.
+    """
+    programs = sample_programs(path)
+    programs["LocalsWorkload"] = [LOCALS_WORKLOAD]
+    print("locals: frames shrunk, their locals, and Hack cycles, without "
+          "and with slot reuse")
+    for name, sources in programs.items():
+        frames = []
+        with contextlib.redirect_stdout(io.StringIO()):
+            for source in sources:
+                frames += CompilationEngine(
+                    JackTokenizer(io.StringIO(source)), io.StringIO(),
+                    optimize=True, reuse_locals=True).frames
+        cycles = []
+        for reuse_locals in (False, True):
+            emulator = HackEmulator()
+            emulator.load_source(link(translate_outputs(compile_sources(
+                sources, optimize=True, reuse_locals=reuse_locals))))
+            emulator.run(int(budget))
+            cycles.append(emulator.cycles)
+        print("  %-16s %3d %4d %4d  %9d %9d  %s" % (
+            name, len(frames), sum(frame[1] for frame in frames),
+            sum(frame[2] for frame in frames), cycles[0], cycles[1],
+            ", ".join("%s %d->%d" % frame for frame in frames)))
+
+
+# Array statements, by what they exercise.
+ARRAY_STATEMENTS = {
+    "a[3] = x": "let a[3] = x;",
+    "a[i] = x + 1": "let a[i] = x + 1;",
+    "a[i] = f(x)": "let a[i] = Main.f(x);",
+    "a[i] = b[j]": "let a[i] = b[j];",
+    "x = a[3]": "let x = a[3];",
+    "x = a[i]": "let x = a[i];",
+    "a[0..9] = x": " ".join("let a[%d] = x;" % index for index in range(10)),
+}
+
+
+def bench_arrays(count: str = "100") -> None:
+    """Compiles functions made of array reads and stores without and with
+    -O, and reports the VM instructions and Hack words per statement.
+    """
+    print("arrays: VM instructions and ROM words per statement, without and "
+          "with -O")
+    for title, statement in ARRAY_STATEMENTS.items():
+        source = ("class Main { function int f(int x) { return x; } "
+                  "function void g(Array a, Array b, int i, int j, int x) { "
+                  "%s return; } }" % (" ".join([statement] * int(count))))
+        sizes = []
+        for optimize in (False, True):
+            outputs = compile_sources([source], optimize=optimize)
+            sizes.append((count_instructions(outputs),
+                          rom_size(translate_outputs(outputs)[0])))
+        statements = int(count) * len(statement.split(";")[:-1])
+        print("  %-14s %6.2f %6.2f   %6.2f %6.2f" % (
+            title, sizes[0][0] / statements, sizes[1][0] / statements,
+            sizes[0][1] / statements, sizes[1][1] / statements))
+
+
+def emit_commands(writer: VMWriter, count: int) -> None:
+    """Writes a typical mix of VM commands, count times each batch of ten."""
+    for index in range(count // 10):
+        writer.write_function("Main.f", 2)
+        writer.write_push("ARG", 0)
+        writer.write_push("LOCAL", index & 7)
+        writer.write_arithmetic("ADD")
+        writer.write_pop("THIS", 1)
+        writer.write_label("label%d" % index)
+        writer.write_push("CONST", index & 255)
+        writer.write_call("Math.multiply", 2)
+        writer.write_if("label%d" % index)
+        writer.write_return()
+    writer.flush()
+
+
+def bench_writer(count: int = 200000) -> None:
+    """Measures how many VM commands per second the VMWriter emits, for a
+    few buffer sizes. A buffer of 1 writes every command on its own.
+    """
+    print("writer: %d commands" % count)
+    for buffer_size in (1, 4096, BUFFER_SIZE):
+        with open(os.devnull, "w") as output_file:
+            elapsed = best_time(lambda: emit_commands(
+                VMWriter(output_file, buffer_size), count))
+        print("  buffer %6d %10.3f ms %12.0f commands/sec"
+              % (buffer_size, elapsed * 1000, count / elapsed))
+
+
+def bench_loops(max_steps: str = "3000000",
+               budget: str = "60000000") -> None:
+    """Compiles ConvertToBin, MathTest and a MathTest-style workload with
+    -O, with the condition of every while loop before and after its body,
+    and reports the executed VM instructions and the Hack cycles of a run
+    of each layout.
+    """
+    programs = {"ConvertToBin": sample_programs(os.path.join(
+                    SAMPLES, "ConvertToBin"))["."],
+                "MathTest": sample_programs(os.path.join(
+                    ROOT, "NAND12", "MathTest"))["."],
+                "MathWorkload": [MATH_WORKLOAD]}
+    print("loops: executed VM instructions and Hack cycles, top-tested vs. "
+          "bottom-tested loops")
+    for name, sources in programs.items():
+        steps = []
+        cycles = []
+        for bottom_loops in (False, True):
+            outputs = compile_sources(sources, optimize=True,
+                                      bottom_loops=bottom_loops)
+            steps.append(run_program(outputs, int(max_steps)).steps)
+            emulator = HackEmulator()
+            emulator.load_source(link(translate_outputs(outputs)))
+            emulator.run(int(budget))
+            cycles.append(emulator.cycles)
+        print("  %-14s %9d %9d %5.1f%%  %10d %10d %5.1f%%" % (
+            name, steps[0], steps[1], 100.0 * (steps[0] - steps[1]) /
+            max(steps[0], 1), cycles[0], cycles[1],
+            100.0 * (cycles[0] - cycles[1]) / max(cycles[0], 1)))
+
+
+# Counts the points of a grid within circles, with loops which recompute
+# products of fields and of variables the inner loop doesn't change.
+CIRCLE_WORKLOAD = ["""
+class Circle {
+    field int cx, cy, r;
+    constructor Circle new(int x, int y, int radius) {
+        let cx = x;
+        let cy = y;
+        let r = radius;
+        return this;
+    }
+    method int count(int n) {
+        var int x, y, hits;
+        let y = -n;
+        while (y < n) {
+            let x = -n;
+            while (x < n) {
+                if (((x - cx) * (x - cx)) + ((y - cy) * (y - cy)) <
+                        (r * r)) {
+                    let hits = hits + 1;
+                }
+                let x = x + 1;
+            }
+            let y = y + 1;
+        }
+        return hits;
+    }
+}
+""", """
+class Main {
+    function void main() {
+        var Circle c;
+        var int i, sum;
+        let i = 0;
+        while (i < 4) {
+            let c = Circle.new(i, 1 - i, 3 + i);
+            let sum = sum + c.count(8);
+            let i = i + 1;
+        }
+        do Output.printInt(sum);
+        return;
+    }
+}
+"""]
+
+
+def bench_hoist(path: str = SAMPLES, max_steps: str = "3000000",
+                budget: str = "60000000") -> None:
+    """Compiles the programs under a directory and a workload with loop
+    invariant expressions with -O, without and with hoisting, and reports
+    the loops which hoisted any expression, the executed VM instructions
+    and the Hack cycles of a run before and after.
+    """
+    programs = sample_programs(path)
+    programs["CircleWorkload"] = CIRCLE_WORKLOAD
+    print("hoist: loops and expressions hoisted, VM instructions and Hack "
+          "cycles, without and with hoisting")
+    for name, sources in programs.items():
+        loops = []
+        with contextlib.redirect_stdout(io.StringIO()):
+            for source in sources:
+                loops += CompilationEngine(
+                    JackTokenizer(io.StringIO(source)), io.StringIO(),
+                    optimize=True, hoist_invariants=True).hoisted
+        steps = []
+        cycles = []
+        for hoist_invariants in (False, True):
+            outputs = compile_sources(sources, optimize=True,
+                                      hoist_invariants=hoist_invariants)
+            steps.append(run_program(outputs, int(max_steps)).steps)
+            emulator = HackEmulator()
+            emulator.load_source(link(translate_outputs(outputs)))
+            emulator.run(int(budget))
+            cycles.append(emulator.cycles)
+        print("  %-16s %3d %3d  %9d %9d  %10d %10d" % (
+            name, len(loops), sum(len(loop[2]) for loop in loops),
+            steps[0], steps[1], cycles[0], cycles[1]))
+        for function, line, expressions in loops:
+            print("    %s line %d: %s" % (function, line,
+                                         ", ".join(expressions)))
+
+
+def bench_cfg(path: str = SAMPLES, repeat: str = "10",
+              max_steps: str = "3000000") -> None:
+    """Compiles the programs under a directory and the workloads without and
+    with the control flow graph. Reports the compile time of the default
+    build, which comes out the same, and the VM instructions and executed
+    instructions with -O. It also reports the blocks and loops of the
+    optimized code and the time the reachability, dominator and liveness
+    analyses take over all of its functions.
+    """
+    programs = sample_programs(path)
+    programs["MathWorkload"] = [MATH_WORKLOAD]
+    programs["CircleWorkload"] = CIRCLE_WORKLOAD
+    print("cfg: compile ms without and with the graph, -O VM instructions "
+          "and steps without and with it, blocks, loops, analysis ms")
+    for name, sources in programs.items():
+        times = [best_time(lambda: compile_sources(
+            sources, control_flow=control_flow), int(repeat)) * 1000
+            for control_flow in (False, True)]
+        sizes = []
+        steps = []
+        for control_flow in (False, True):
+            outputs = compile_sources(sources, optimize=True,
+                                      control_flow=control_flow)
+            sizes.append(count_instructions(outputs))
+            steps.append(run_program(outputs, int(max_steps)).steps)
+        graphs = [ControlFlow.build(function)
+                  for output in outputs
+                  for function in VMInliner.split_functions(parse(output))]
+        start = time.perf_counter()
+        loops = 0
+        for graph in graphs:
+            ControlFlow.reachable(graph)
+            loops += len(ControlFlow.back_edges(
+                graph, ControlFlow.dominators(graph)))
+            ControlFlow.live_locals(graph)
+        analysis = (time.perf_counter() - start) * 1000
+        print("  %-16s %7.2f %7.2f  %5d %5d  %8d %8d  %4d %3d %6.2f" % (
+            name, times[0], times[1], sizes[0], sizes[1], steps[0],
+            steps[1], sum(len(graph.blocks) for graph in graphs), loops,
+            analysis))
+
+
+# Small programs which a pass once compiled wrongly, each with the value
+# which set it off.
+REGRESSION_PROGRAMS = {"ArrayIndex": ["""
+class Main {
+    function void main() {
+        var Array arr;
+        let arr = Array.new(8);
+        let arr[2] = 3;
+        let arr[arr[2] * 2] = 7;
+        do Output.printInt(arr[6]);
+        do Output.printInt(arr[3]);
+        return;
+    }
+}
+"""], "IfNumber": ["""
+class Main {
+    function void main() {
+        var int n;
+        let n = 5;
+        if (n) {
+        } else {
+            do Output.printInt(1);
+        }
+        if (~n) {
+            do Output.printInt(2);
+        }
+        return;
+    }
+}
+"""], "WhileNumber": ["""
+class Main {
+    function void main() {
+        var int n, i;
+        let n = 5;
+        while (n) {
+            do Output.printInt(n);
+            let n = n - 1;
+        }
+        let i = 3;
+        while ((i > 0) & ~(i = 2)) {
+            do Output.printInt(i);
+            let i = i - 1;
+        }
+        let n = -1;
+        while (n) {
+            do Output.printInt(n);
+            let n = n + 3;
+        }
+        return;
+    }
+}
+"""], "Compare": ["""
+class Main {
+    function void main() {
+        var int x, y, z;
+        let x = 30000;
+        let y = -30000;
+        let z = -32767 - 1;
+        if (x < y) { do Output.printInt(1); }
+        if (y > x) { do Output.printInt(2); }
+        if (x > y) { do Output.printInt(3); }
+        if (y < x) { do Output.printInt(4); }
+        if (~(x < y)) { do Output.printInt(5); }
+        if (z < x) { do Output.printInt(6); }
+        if (x > z) { do Output.printInt(7); }
+        do Output.printInt(x < y);
+        do Output.printInt(y > x);
+        do Output.printInt(z < 0);
+        do Output.printInt(y = x);
+        return;
+    }
+}
+"""]}
+
+
+def function_pass(pass_: typing.Callable[[typing.List[tuple]],
+                                         typing.List[tuple]]
+                  ) -> typing.Callable[[typing.List[str]], typing.List[str]]:
+    """
+    Args:
+        pass_ (function): a pass over the instructions of a function.
+
+    Returns:
+        function: gets the VM code of every class, and returns it with the
+        pass run over every function.
+    """
+    def run(outputs: typing.List[str]) -> typing.List[str]:
+        return ["".join(encode(instruction)
+                        for function in VMInliner.split_functions(parse(text))
+                        for instruction in pass_(function))
+                for text in outputs]
+    return run
+
+
+# The ways of compiling which should never change what a program does, by
+# name: the options of the CompilationEngine, and a pass to run over its
+# default output, if any.
+VARIANTS = {
+    "fold": ({}, function_pass(VMOptimizer.fold_constants)),
+    "array_accesses": ({}, function_pass(VMOptimizer.array_accesses)),
+    "reuse_pointer": ({}, function_pass(lambda function:
+                                        VMOptimizer.reuse_pointer(
+                                            VMOptimizer.array_accesses(
+                                                function)))),
+    "peephole": ({}, function_pass(VMOptimizer.peephole)),
+    "coalesce": ({}, function_pass(VMOptimizer.coalesce_locals)),
+    "cfg": ({}, function_pass(lambda function: ControlFlow.simplify(
+        function, optimize=True))),
+    "no_cfg": ({"control_flow": False}, None),
+    "optimize": ({"optimize": True}, None),
+    "reuse_locals": ({"optimize": True, "reuse_locals": True}, None),
+    "hoist": ({"hoist_invariants": True}, None),
+    "bottom_loops": ({"bottom_loops": True}, None),
+    "inline": ({}, lambda outputs: VMInliner.inline(outputs)[0]),
+    "all": ({"optimize": True, "reuse_locals": True,
+             "hoist_invariants": True, "bottom_loops": True},
+            lambda outputs: VMInliner.inline(outputs)[0]),
+}
+
+
+def bench_differential(path: str = SAMPLES,
+                       max_steps: str = "3000000") -> None:
+    """Compiles the programs under a directory, the workloads and the
+    regression programs by default and in every variant, runs them in the
+    VM interpreter and checks that every variant prints the same text and
+    draws the same screen as the default build. Exits with an error if any
+    doesn't.
+    """
+    programs = sample_programs(path)
+    programs["MathWorkload"] = [MATH_WORKLOAD]
+    programs["StringWorkload"] = [STRING_WORKLOAD]
+    programs["PointWorkload"] = POINT_WORKLOAD
+    programs["LocalsWorkload"] = [LOCALS_WORKLOAD]
+    programs["CircleWorkload"] = CIRCLE_WORKLOAD
+    programs.update(REGRESSION_PROGRAMS)
+    print("differential: the variants which print or draw something else "
+          "than the default build")
+    failed = 0
+    for name, sources in programs.items():
+        plain = run_program(compile_sources(sources), int(max_steps))
+        different = []
+        for variant, (options, transform) in VARIANTS.items():
+            outputs = compile_sources(sources, **options)
+            if transform is not None:
+                outputs = transform(outputs)
+            machine = run_program(outputs, int(max_steps))
+            if machine.output() != plain.output() or \
+                    machine.screen_checksum() != plain.screen_checksum():
+                different.append(variant)
+        failed += len(different)
+        print("  %-16s %s" % (name, ", ".join(different) or "same"))
+    if failed:
+        sys.exit("%d variants differ" % failed)
+
+
+BENCHMARKS = {"tokenizer": bench_tokenizer, "tokens": bench_tokens,
+              "memory": bench_memory, "jobs": bench_jobs,
+              "cache": bench_cache, "symbols": bench_symbols,
+              "writer": bench_writer, "peephole": bench_peephole,
+              "fold": bench_fold, "expressions": bench_expressions,
+              "vm": bench_vm, "jit": bench_jit, "asm": bench_asm,
+              "hack": bench_hack, "profile": bench_profile,
+              "sourcemap": bench_sourcemap, "stringpool": bench_stringpool,
+              "tables": bench_tables, "prune": bench_prune,
+              "inline": bench_inline, "locals": bench_locals,
+              "arrays": bench_arrays, "loops": bench_loops,
+              "hoist": bench_hoist, "cfg": bench_cfg,
+              "differential": bench_differential}
+
+
+if "__main__" == __name__:
+    # Runs a single benchmark. Most take an optional file or directory, the
+    # others take sizes, or nothing at all.
+    if len(sys.argv) < 2 or sys.argv[1] not in BENCHMARKS:
+        sys.exit("Invalid usage, please use: Benchmark <"
+                 + "|".join(BENCHMARKS) + "> [arguments]")
+    BENCHMARKS[sys.argv[1]](*sys.argv[2:])
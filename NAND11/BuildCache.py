@@ -0,0 +1,155 @@
+"""
+This file is part of nand2tetris, as taught in The Hebrew University, and
+was written by Aviv Yaish. It is an extension to the specifications given
+[here](https://www.nand2tetris.org) (Shimon Schocken and Noam Nisan, 2017),
+as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
+"""
+import hashlib
+import os
+import shutil
+import time
+import typing
+
+COMPILER_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache",
+                                 "JackCompiler")
+DEFAULT_MAX_SIZE = 64 * 2 ** 20
+DEFAULT_MAX_AGE = 30 * 24 * 60 * 60
+
+
+def compiler_version() -> str:
+    """
+    Returns:
+        str: a hash of the compiler's own sources, so that changing the
+        compiler invalidates everything it cached before.
+    """
+    digest = hashlib.sha256()
+    for filename in sorted(os.listdir(COMPILER_DIR)):
+        if os.path.splitext(filename)[1] == ".py":
+            with open(os.path.join(COMPILER_DIR, filename), 'rb') as source:
+                digest.update(filename.encode() + b"\0" + source.read())
+    return digest.hexdigest()
+
+
+class BuildCache:
+    """A persistent cache of compiled classes. Every entry is the .vm output
+    of one class, stored under a hash of the class's source, the compiler
+    version and the compilation options. Entries are evicted by age and by
+    the total size of the cache, oldest first.
+    """
+
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR,
+                 options: str = "") -> None:
+        """Opens the cache, creating its directory if needed.
+
+        Args:
+            cache_dir (str): the directory holding the cache.
+            options (str): the compilation options that change the output.
+        """
+        self.cache_dir = cache_dir
+        self.salt = (compiler_version() + "\0" + options + "\0").encode()
+        self.keys = {}
+        self.hits = 0
+        self.misses = 0
+        self.stored = 0
+        self.evicted = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def entry_path(self, key: str) -> str:
+        """
+        Args:
+            key (str): the key of an entry.
+
+        Returns:
+            str: where the entry is stored.
+        """
+        return os.path.join(self.cache_dir, key[:2], key + ".vm")
+
+    def key_of(self, input_path: str) -> str:
+        """
+        Args:
+            input_path (str): path of a .jack file.
+
+        Returns:
+            str: the key of the file's current contents.
+        """
+        with open(input_path, 'rb') as input_file:
+            return hashlib.sha256(self.salt + input_file.read()).hexdigest()
+
+    def restore(self, input_path: str, output_path: str) -> bool:
+        """Writes the cached output of a class, if there is one.
+
+        Args:
+            input_path (str): path of the .jack file.
+            output_path (str): where its output should be written.
+
+        Returns:
+            bool: True on a hit, False if the class must be compiled.
+        """
+        key = self.key_of(input_path)
+        entry_path = self.entry_path(key)
+        try:
+            shutil.copyfile(entry_path, output_path)
+        except FileNotFoundError:
+            self.keys[input_path] = key
+            self.misses += 1
+            return False
+        # a hit makes the entry young again
+        os.utime(entry_path)
+        self.hits += 1
+        return True
+
+    def store(self, input_path: str, output_path: str) -> None:
+        """Caches the output of a class which missed the cache.
+
+        Args:
+            input_path (str): path of the .jack file.
+            output_path (str): where its output was written.
+        """
+        key = self.keys.pop(input_path, None) or self.key_of(input_path)
+        entry_path = self.entry_path(key)
+        os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+        temp_path = entry_path + ".%d.tmp" % os.getpid()
+        shutil.copyfile(output_path, temp_path)
+        os.replace(temp_path, entry_path)
+        self.stored += 1
+
+    def entries(self) -> typing.List[typing.Tuple[float, int, str]]:
+        """
+        Returns:
+            list: the modification time, size and path of every entry,
+            oldest first.
+        """
+        entries = []
+        for dir_path, dir_names, file_names in os.walk(self.cache_dir):
+            for filename in file_names:
+                if filename.endswith(".vm"):
+                    path = os.path.join(dir_path, filename)
+                    stat = os.stat(path)
+                    entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+        return entries
+
+    def evict(self, max_size: int = DEFAULT_MAX_SIZE,
+              max_age: float = DEFAULT_MAX_AGE) -> None:
+        """Removes the entries older than max_age, then the oldest entries
+        until the cache is no larger than max_size.
+
+        Args:
+            max_size (int): the largest allowed total size, in bytes.
+            max_age (float): the largest allowed age, in seconds.
+        """
+        entries = self.entries()
+        total = sum(size for mtime, size, path in entries)
+        oldest_allowed = time.time() - max_age
+        for mtime, size, path in entries:
+            if mtime >= oldest_allowed and total <= max_size:
+                break
+            os.remove(path)
+            total -= size
+            self.evicted += 1
+
+    def __str__(self):
+        return "cache: %d hits, %d misses, %d stored, %d evicted" % (
+            self.hits, self.misses, self.stored, self.evicted)
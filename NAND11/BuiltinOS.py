@@ -0,0 +1,400 @@
+"""
+This file is part of nand2tetris, as taught in The Hebrew University, and
+was written by Aviv Yaish. It is an extension to the specifications given
+[here](https://www.nand2tetris.org) (Shimon Schocken and Noam Nisan, 2017),
+as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
+
+Built-in implementations of the Jack OS classes, used by the VM interpreter
+for every OS subroutine which the loaded .vm files don't define, like the
+built-in OS of the nand2tetris VM emulator. They run headless: the Screen
+draws into the screen memory map, Output keeps a transcript of the printed
+text instead of drawing it, and Keyboard reads from a queue of input keys.
+"""
+import math
+import typing
+from array import array
+
+HEAP_BASE = 2048
+HEAP_END = 16384
+SCREEN = 16384
+KEYBOARD = 24576
+NEW_LINE = 128
+BACK_SPACE = 129
+DOUBLE_QUOTE = 34
+
+
+class Halt(Exception):
+    """Stops the machine, for Sys.halt, Sys.error and blocked input."""
+
+
+def to_word(value: int) -> int:
+    """
+    Args:
+        value (int): any integer.
+
+    Returns:
+        int: the value wrapped to a signed 16-bit word.
+    """
+    return (value + 0x8000) % 0x10000 - 0x8000
+
+
+class BuiltinOS:
+    """The state of the built-in OS classes of one machine: the heap, the
+    drawing color, the printed text and the pending input keys.
+    """
+
+    def __init__(self, ram: typing.MutableSequence[int],
+                 keys: str = "") -> None:
+        """
+        Args:
+            ram (array): the RAM of the machine.
+            keys (str): the keys that Keyboard.readChar will return.
+        """
+        self.ram = ram
+        self.keys = list(reversed(keys))
+        self.free = [(HEAP_BASE, HEAP_END - HEAP_BASE)]
+        self.color = True
+        self.output = []
+
+    def subroutines(self) -> typing.Dict[str, typing.Tuple[
+            typing.Callable, int]]:
+        """
+        Returns:
+            dict: the bound implementation and the argument count of every
+            OS subroutine, by its VM name.
+        """
+        return {name: (getattr(self, attribute), count)
+                for name, (attribute, count) in SUBROUTINES.items()}
+
+    def error(self, code: int) -> None:
+        self.output.append("ERR%d" % code)
+        raise Halt("Sys.error(%d)" % code)
+
+    # Math
+
+    def math_abs(self, x):
+        return to_word(abs(x))
+
+    def math_multiply(self, x, y):
+        return to_word(x * y)
+
+    def math_divide(self, x, y):
+        if y == 0:
+            self.error(3)
+        return to_word(int(x / y))
+
+    def math_sqrt(self, x):
+        if x < 0:
+            self.error(4)
+        return math.isqrt(x)
+
+    def math_max(self, a, b):
+        return max(a, b)
+
+    def math_min(self, a, b):
+        return min(a, b)
+
+    # Memory, a first fit allocator which keeps every block's size in the
+    # word before it.
+
+    def memory_peek(self, address):
+        return self.ram[address]
+
+    def memory_poke(self, address, value):
+        self.ram[address] = value
+
+    def memory_alloc(self, size):
+        if size <= 0:
+            self.error(5)
+        for position, (segment, length) in enumerate(self.free):
+            if length > size:
+                if length - size - 1 > 0:
+                    self.free[position] = (segment + size + 1,
+                                           length - size - 1)
+                else:
+                    del self.free[position]
+                self.ram[segment] = size + 1
+                return segment + 1
+        self.error(6)
+
+    def memory_de_alloc(self, block):
+        self.free.append((block - 1, self.ram[block - 1]))
+
+    # Array
+
+    def array_new(self, size):
+        if size <= 0:
+            self.error(2)
+        return self.memory_alloc(size)
+
+    # String, stored as its maximum length, its length and then its chars.
+
+    def string_new(self, max_length):
+        if max_length < 0:
+            self.error(14)
+        string = self.memory_alloc(max_length + 2)
+        self.ram[string] = max_length
+        self.ram[string + 1] = 0
+        return string
+
+    def string_length(self, string):
+        return self.ram[string + 1]
+
+    def string_char_at(self, string, j):
+        if not 0 <= j < self.ram[string + 1]:
+            self.error(15)
+        return self.ram[string + 2 + j]
+
+    def string_set_char_at(self, string, j, c):
+        if not 0 <= j < self.ram[string + 1]:
+            self.error(16)
+        self.ram[string + 2 + j] = c
+
+    def string_append_char(self, string, c):
+        length = self.ram[string + 1]
+        if length >= self.ram[string]:
+            self.error(17)
+        self.ram[string + 2 + length] = c
+        self.ram[string + 1] = length + 1
+        return string
+
+    def string_erase_last_char(self, string):
+        if self.ram[string + 1] == 0:
+            self.error(18)
+        self.ram[string + 1] -= 1
+
+    def string_int_value(self, string):
+        text = self.text_of(string)
+        digits = text[1:] if text[:1] == "-" else text
+        length = 0
+        while length < len(digits) and digits[length].isdigit():
+            length += 1
+        value = int(digits[:length] or "0")
+        return to_word(-value if text[:1] == "-" else value)
+
+    def string_set_int(self, string, value):
+        text = str(value)
+        if len(text) > self.ram[string]:
+            self.error(19)
+        self.ram[string + 1] = len(text)
+        for index, letter in enumerate(text):
+            self.ram[string + 2 + index] = ord(letter)
+
+    def string_new_line(self):
+        return NEW_LINE
+
+    def string_back_space(self):
+        return BACK_SPACE
+
+    def string_double_quote(self):
+        return DOUBLE_QUOTE
+
+    def text_of(self, string: int) -> str:
+        """
+        Args:
+            string (int): the address of a String.
+
+        Returns:
+            str: the characters of the String.
+        """
+        start = string + 2
+        return "".join(map(chr, self.ram[start:start + self.ram[string + 1]]))
+
+    def new_string(self, text: str) -> int:
+        """
+        Args:
+            text (str): characters.
+
+        Returns:
+            int: the address of a new String which holds them.
+        """
+        string = self.string_new(max(len(text), 1))
+        for letter in text:
+            self.string_append_char(string, ord(letter))
+        return string
+
+    # Output, as a transcript of the printed text.
+
+    def output_move_cursor(self, i, j):
+        if not (0 <= i < 23 and 0 <= j < 64):
+            self.error(20)
+
+    def output_print_char(self, c):
+        if c == NEW_LINE:
+            self.output.append("\n")
+        elif c == BACK_SPACE:
+            self.output_back_space()
+        else:
+            self.output.append(chr(c))
+
+    def output_print_string(self, string):
+        self.output.append(self.text_of(string))
+
+    def output_print_int(self, i):
+        self.output.append(str(i))
+
+    def output_println(self):
+        self.output.append("\n")
+
+    def output_back_space(self):
+        if self.output:
+            self.output[-1] = self.output[-1][:-1]
+
+    # Screen, drawn into the screen memory map.
+
+    def screen_clear_screen(self):
+        self.ram[SCREEN:KEYBOARD] = array('h', bytes(2 * (KEYBOARD - SCREEN)))
+
+    def screen_set_color(self, b):
+        self.color = b != 0
+
+    def screen_draw_pixel(self, x, y):
+        if not (0 <= x < 512 and 0 <= y < 256):
+            self.error(7)
+        self.set_pixels(x, x, y)
+
+    def set_pixels(self, x1: int, x2: int, y: int) -> None:
+        """Paints a horizontal run of pixels in the current color.
+
+        Args:
+            x1 (int): the first column.
+            x2 (int): the last column.
+            y (int): the row.
+        """
+        row = SCREEN + y * 32
+        for word in range(x1 // 16, x2 // 16 + 1):
+            low = max(x1 - word * 16, 0)
+            high = min(x2 - word * 16, 15)
+            mask = ((1 << (high + 1)) - 1) ^ ((1 << low) - 1)
+            value = self.ram[row + word] & 0xffff
+            value = value | mask if self.color else value & ~mask
+            self.ram[row + word] = to_word(value)
+
+    def screen_draw_line(self, x1, y1, x2, y2):
+        if not (0 <= min(x1, x2) and max(x1, x2) < 512 and
+                0 <= min(y1, y2) and max(y1, y2) < 256):
+            self.error(8)
+        if y1 == y2:
+            self.set_pixels(min(x1, x2), max(x1, x2), y1)
+            return
+        dx, dy = abs(x2 - x1), abs(y2 - y1)
+        steps = max(dx, dy)
+        for step in range(steps + 1):
+            x = x1 + (x2 - x1) * step // steps
+            y = y1 + (y2 - y1) * step // steps
+            self.set_pixels(x, x, y)
+
+    def screen_draw_rectangle(self, x1, y1, x2, y2):
+        if not (0 <= x1 <= x2 < 512 and 0 <= y1 <= y2 < 256):
+            self.error(9)
+        for y in range(y1, y2 + 1):
+            self.set_pixels(x1, x2, y)
+
+    def screen_draw_circle(self, x, y, r):
+        if not (0 <= x < 512 and 0 <= y < 256):
+            self.error(12)
+        if not (0 <= r <= 181 and 0 <= x - r and x + r < 512 and
+                0 <= y - r and y + r < 256):
+            self.error(13)
+        for dy in range(-r, r + 1):
+            half = math.isqrt(r * r - dy * dy)
+            self.set_pixels(x - half, x + half, y + dy)
+
+    # Keyboard, fed by the queue of input keys. Waiting for a key which
+    # will never come halts the machine.
+
+    def keyboard_key_pressed(self):
+        return self.ram[KEYBOARD]
+
+    def keyboard_read_char(self):
+        if not self.keys:
+            raise Halt("waiting for input")
+        c = ord(self.keys.pop())
+        if c == ord("\n"):
+            c = NEW_LINE
+        self.output_print_char(c)
+        return c
+
+    def read_line(self, message: int) -> str:
+        """
+        Args:
+            message (int): the address of the String to print first.
+
+        Returns:
+            str: the text typed up to the next new line.
+        """
+        self.output_print_string(message)
+        text = ""
+        c = self.keyboard_read_char()
+        while c != NEW_LINE:
+            text = text[:-1] if c == BACK_SPACE else text + chr(c)
+            c = self.keyboard_read_char()
+        return text
+
+    def keyboard_read_line(self, message):
+        return self.new_string(self.read_line(message))
+
+    def keyboard_read_int(self, message):
+        return self.string_int_value(self.new_string(self.read_line(message)))
+
+    # Sys
+
+    def sys_halt(self):
+        raise Halt("Sys.halt")
+
+    def sys_error(self, code):
+        self.error(code)
+
+    def sys_wait(self, duration):
+        if duration < 0:
+            self.error(1)
+
+    def nothing(self, *arguments):
+        return 0
+
+
+# The name of the method which implements every OS subroutine and its
+# number of arguments, methods included.
+SUBROUTINES = {
+    "Math.init": ("nothing", 0), "Math.abs": ("math_abs", 1),
+    "Math.multiply": ("math_multiply", 2), "Math.divide": ("math_divide", 2),
+    "Math.sqrt": ("math_sqrt", 1), "Math.max": ("math_max", 2),
+    "Math.min": ("math_min", 2),
+    "Memory.init": ("nothing", 0), "Memory.peek": ("memory_peek", 1),
+    "Memory.poke": ("memory_poke", 2), "Memory.alloc": ("memory_alloc", 1),
+    "Memory.deAlloc": ("memory_de_alloc", 1),
+    "Array.new": ("array_new", 1), "Array.dispose": ("memory_de_alloc", 1),
+    "String.new": ("string_new", 1), "String.dispose": ("memory_de_alloc", 1),
+    "String.length": ("string_length", 1),
+    "String.charAt": ("string_char_at", 2),
+    "String.setCharAt": ("string_set_char_at", 3),
+    "String.appendChar": ("string_append_char", 2),
+    "String.eraseLastChar": ("string_erase_last_char", 1),
+    "String.intValue": ("string_int_value", 1),
+    "String.setInt": ("string_set_int", 2),
+    "String.newLine": ("string_new_line", 0),
+    "String.backSpace": ("string_back_space", 0),
+    "String.doubleQuote": ("string_double_quote", 0),
+    "Output.init": ("nothing", 0),
+    "Output.moveCursor": ("output_move_cursor", 2),
+    "Output.printChar": ("output_print_char", 1),
+    "Output.printString": ("output_print_string", 1),
+    "Output.printInt": ("output_print_int", 1),
+    "Output.println": ("output_println", 0),
+    "Output.backSpace": ("output_back_space", 0),
+    "Screen.init": ("nothing", 0),
+    "Screen.clearScreen": ("screen_clear_screen", 0),
+    "Screen.setColor": ("screen_set_color", 1),
+    "Screen.drawPixel": ("screen_draw_pixel", 2),
+    "Screen.drawLine": ("screen_draw_line", 4),
+    "Screen.drawRectangle": ("screen_draw_rectangle", 4),
+    "Screen.drawCircle": ("screen_draw_circle", 3),
+    "Keyboard.init": ("nothing", 0),
+    "Keyboard.keyPressed": ("keyboard_key_pressed", 0),
+    "Keyboard.readChar": ("keyboard_read_char", 0),
+    "Keyboard.readLine": ("keyboard_read_line", 1),
+    "Keyboard.readInt": ("keyboard_read_int", 1),
+    "Sys.halt": ("sys_halt", 0), "Sys.error": ("sys_error", 1),
+    "Sys.wait": ("sys_wait", 1),
+}
@@ -0,0 +1,133 @@
+"""
+This file is part of nand2tetris, as taught in The Hebrew University, and
+was written by Aviv Yaish. It is an extension to the specifications given
+[here](https://www.nand2tetris.org) (Shimon Schocken and Noam Nisan, 2017),
+as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
+
+Whole-program dead subroutine elimination. The compiled classes of a
+program are split into their functions, the calls between the functions
+make a call graph, and the functions which can't be reached from the entry
+points are dropped. Jack has no function pointers, so every call is seen.
+
+Both the VM code and the Hack assembly written by HackWriter are handled:
+in VM code a function starts at its function command and calls are call
+commands, in assembly a function starts at its label and is called by
+loading that label. Labels within a function and return addresses have a
+"$" in them, and static variables end in a number, so neither is mistaken
+for a function.
+"""
+import re
+import typing
+
+# The functions every program may start from.
+ROOTS = ("Sys.init", "Main.main")
+
+# A function label and a load of an address, in Hack assembly.
+ASM_FUNCTION = re.compile(r"\(([^$()\s]+)\)$")
+ASM_REFERENCE = re.compile(r"@([^$\s]+)$")
+
+# The pieces of a class: the name of a function, or None for whatever comes
+# before the first one, and the text of the piece.
+Pieces = typing.List[typing.Tuple[typing.Optional[str], str]]
+
+
+def split(text: str, target: str = "vm") -> Pieces:
+    """
+    Args:
+        text (str): the code of a class.
+        target (str): "vm" for VM code, or "asm" for Hack assembly.
+
+    Returns:
+        list: the pieces of the class, in order.
+    """
+    pieces = []
+    name = None
+    lines = []
+    for line in text.splitlines(True):
+        if target == "asm":
+            match = ASM_FUNCTION.match(line.strip())
+            start = match.group(1) if match else None
+        else:
+            words = line.split()
+            start = words[1] if words[:1] == ["function"] else None
+        if start is not None:
+            if name is not None or lines:
+                pieces.append((name, "".join(lines)))
+            name = start
+            lines = []
+        lines.append(line)
+    if name is not None or lines:
+        pieces.append((name, "".join(lines)))
+    return pieces
+
+
+def references(text: str, target: str = "vm") -> typing.Set[str]:
+    """
+    Args:
+        text (str): the code of a function.
+        target (str): "vm" for VM code, or "asm" for Hack assembly.
+
+    Returns:
+        set: the names the function may call. In assembly these are all
+        the loaded symbols, which include more than the functions.
+    """
+    names = set()
+    for line in text.splitlines():
+        if target == "asm":
+            match = ASM_REFERENCE.match(line.strip())
+            if match:
+                names.add(match.group(1))
+        else:
+            words = line.split()
+            if words[:1] == ["call"]:
+                names.add(words[1])
+    return names
+
+
+def reachable(graph: typing.Dict[str, typing.Set[str]],
+              roots: typing.Iterable[str] = ROOTS) -> typing.Set[str]:
+    """
+    Args:
+        graph (dict): the names each function may call, by function.
+        roots (list): the functions the program may start from.
+
+    Returns:
+        set: the functions which may be called when the program runs.
+    """
+    live = set()
+    pending = [root for root in roots if root in graph]
+    while pending:
+        function = pending.pop()
+        if function in live:
+            continue
+        live.add(function)
+        pending.extend(callee for callee in graph[function]
+                       if callee in graph and callee not in live)
+    return live
+
+
+def prune(classes: typing.List[str], target: str = "vm",
+          roots: typing.Iterable[str] = ROOTS) -> typing.List[str]:
+    """Drops the functions of a program which can't be reached from its
+    entry points. A program without any of the entry points is kept whole.
+
+    Args:
+        classes (list): the code of every class of the program.
+        target (str): "vm" for VM code, or "asm" for Hack assembly.
+        roots (list): the functions the program may start from.
+
+    Returns:
+        list: the code of every class, without the dead functions.
+    """
+    pieces = [split(text, target) for text in classes]
+    graph = {name: references(text, target)
+             for class_pieces in pieces for name, text in class_pieces
+             if name is not None}
+    if not any(root in graph for root in roots):
+        # a library, or a class compiled on its own: nothing is known dead
+        return list(classes)
+    live = reachable(graph, roots)
+    return ["".join(text for name, text in class_pieces
+                    if name is None or name in live)
+            for class_pieces in pieces]
@@ -5,55 +5,71 @@ was written by Aviv Yaish. It is an extension to the specifications given
 as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
 Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
 """
+import functools
 import typing
+import ControlFlow
 import JackTokenizer
+from ExpressionTree import (Node, Constant, String, Variable, ArrayRead,
+                            Call, Unary, Binary, generate, is_boolean)
+from HackWriter import HackWriter
+from JackLexer import KEYWORD, SYMBOL, INT_CONST, STRING_CONST, IDENTIFIER
+from LoopOptimizer import Statement, Let, Do, Return, If, While, \
+    grow_frame, hoist, render
+import StringPool
 from SymbolTable import SymbolTable
+from VMOptimizer import array_accesses, coalesce_locals, fold_constants, \
+    peephole, reuse_pointer
 from VMWriter import VMWriter
 
 
-NON_VALID_TYPE = ['class', 'constructor', 'function', 'method', 'field',
-           'static', 'var','true',
-           'false', 'null', 'this', 'let', 'do', 'if', 'else',
-           'while', 'return','{', '}', '(', ')', '[', ']', '.', ',', ';', '+',
-           '-', '*', '/', '&', ',', '<', '>', '=', '~', '^', '#','0', '1', '2', '3', '4', '5', '6', '7', '8', '9']
+# The keywords which may be used where a type is expected.
+TYPE_KEYWORDS = ['int', 'char', 'boolean', 'void']
 
-NON_VALID_NAME = ['class', 'constructor', 'function', 'method', 'field',
-           'static', 'var', 'int', 'char', 'boolean', 'void', 'true',
-           'false', 'null', 'this', 'let', 'do', 'if', 'else',
-           'while', 'return','{', '}', '(', ')', '[', ']', '.', ',', ';', '+',
-           '-', '*', '/', '&', ',', '<', '>', '=', '~', '^', '#', '0', '1', '2', '3', '4', '5', '6', '7', '8', '9']
-
-KEYORDS = ['class', 'constructor', 'function', 'method', 'field',
-           'static', 'var', 'int', 'char', 'boolean', 'void', 'true',
-           'false', 'null', 'this', 'let', 'do', 'if', 'else',
-           'while', 'return']
-SYMBOLS = ['{', '}', '(', ')', '[', ']', '.', ',', ';', '+',
-           '-', '*', '/', '&', ',', '<', '>', '=', '~', '^', '#', '|']
-INTEGERS = ['0', '1', '2', '3', '4', '5', '6', '7', '8', '9']
-
-OPDICT = {'+':"ADD", '-':"SUB", "&":"AND", "|":"OR", "<":"LT", ">":"GT", "=":"EQ"}
-
-PREOPDICT = {'-':"NEG","~":"NOT"}
+OPERATORS = ['+', '-', '*', "/", "&", "|", "<", ">", "="]
 
 KINDDICT = {"VAR": "LOCAL", "ARG":"ARG", "STATIC":"STATIC", "FIELD":"THIS"}
 
-MATHDICT = {"*":"Math.multiply", "/":"Math.divide"}
-
 class CompilationEngine:
     """Gets input from a JackTokenizer and emits its parsed structure into an
     output stream.
     """
-    dict = {"KEYWORD": "keyword", "SYMBOL": "symbol", "INT_CONST": "integerConstant",
-            "STRING_CONST": "stringConstant", "IDENTIFIER": "identifier"}
+    # xml tag of every token kind, indexed by the kinds from JackLexer.
+    tags = ("keyword", "symbol", "integerConstant", "stringConstant", "identifier")
 
     tabs = 0
 
-    def __init__(self, input_stream: "JackTokenizer", output_stream) -> None:
+    def __init__(self, input_stream: "JackTokenizer", output_stream,
+                 optimize: bool = False, target: str = "vm",
+                 source_map: bool = False, string_pool: bool = False,
+                 reuse_locals: bool = False,
+                 bottom_loops: bool = False,
+                 hoist_invariants: bool = False,
+                 control_flow: bool = True) -> None:
         """
         Creates a new compilation engine with the given input and output. The
         next routine called must be compileClass()
         :param input_stream: The input stream.
         :param output_stream: The output stream.
+        :param optimize: Fold constants, address array entries directly,
+            simplify the control flow graph and run the peephole optimizer
+            over every function.
+        :param target: "vm" to write VM code, or "asm" to translate it
+            into Hack assembly.
+        :param source_map: Collect the Jack line of every VM command in
+            source_lines.
+        :param string_pool: Get every string constant from its function in
+            the string pool, rather than building it every time.
+        :param reuse_locals: Share the slots of locals which are never live
+            at the same time, and collect the frames which shrank in
+            frames.
+        :param bottom_loops: Test the condition of a while loop after its
+            body rather than before it.
+        :param hoist_invariants: Compute the expressions which don't change
+            within a while loop once before the loop, and collect them in
+            hoisted.
+        :param control_flow: Pass every function through its control flow
+            graph, which drops unreachable blocks and needless jumps with
+            -O. The seconds spent in every pass are collected in timings.
         """
         # Your code goes here!
         # Note that you can write to output_stream like so:
@@ -62,9 +78,44 @@ class CompilationEngine:
         self.symtable = SymbolTable()
         self.tokenizer = input_stream
         self.output = output_stream
-        self.vm_writer = VMWriter(output_stream)
+        self.string_pool = string_pool
+        self.bottom_loops = bottom_loops
+        self.hoist_invariants = hoist_invariants
+        # the subroutine, the line and the hoisted expressions of every loop
+        # which had any, and the number of locals of the subroutines which
+        # got locals for them
+        self.hoisted = []
+        self.frame_sizes = {}
+        self.subroutine_name = None
+        self.timings = {}
+        # the function, and its number of locals before and after, of every
+        # frame which shrank
+        self.frames = []
+        passes = [fold_constants, array_accesses, reuse_pointer] if optimize \
+            else []
+        if hoist_invariants:
+            passes.insert(0, functools.partial(grow_frame,
+                                               sizes=self.frame_sizes))
+        if reuse_locals:
+            passes.append(functools.partial(coalesce_locals,
+                                            frames=self.frames))
+        if control_flow:
+            passes.append(functools.partial(ControlFlow.simplify,
+                                            optimize=optimize,
+                                            timings=self.timings))
+        if optimize:
+            passes.append(peephole)
+        self.source_lines = [] if source_map else None
+        if target == "asm":
+            self.vm_writer = HackWriter(output_stream, passes=passes,
+                                        timings=self.timings)
+        else:
+            self.vm_writer = VMWriter(output_stream, passes=passes,
+                                      source_lines=self.source_lines,
+                                      timings=self.timings)
         self.class_name = None
         self.compile_class()
+        self.vm_writer.flush()
 
 
 
@@ -113,6 +164,7 @@ class CompilationEngine:
         you will understand why this is necessary in project 11.
         """
         self.symtable.start_subroutine()
+        self.mark()
         call = False
         if self.tokenizer.cur_token == "constructor":
             self.eat("constructor")
@@ -137,6 +189,7 @@ class CompilationEngine:
         self.eat("(")
         self.compile_parameter_list()
         self.eat(")")
+        self.subroutine_name = func_name
         self.compile_subroutine_body(func_name, call)
         print(self.symtable)
 
@@ -199,6 +252,7 @@ class CompilationEngine:
         "{}".
         """
         while self.tokenizer.cur_token in ["if", "while", "let", "do", "return"]:
+            self.mark()
             if self.tokenizer.cur_token == "if":
                 self.compile_if()
             elif self.tokenizer.cur_token == "let":
@@ -252,9 +306,16 @@ class CompilationEngine:
     def compile_while(self) -> None:
         """Compiles a while statement."""
         # self.write_tabs("open","whileStatement")
+        line = self.vm_writer.line
+        if self.hoist_invariants:
+            self.write_while(self.parse_while())
+            return
         self.eat('while')
         label1 = self.generate_label()
         label2 = self.generate_label()
+        if self.bottom_loops:
+            self.compile_bottom_tested_while(line, label1, label2)
+            return
         self.vm_writer.write_label(label1)
         self.eat("(")
         self.compile_expression()
@@ -264,10 +325,260 @@ class CompilationEngine:
         self.eat("{")
         self.compile_statements()
         self.eat("}")
+        self.vm_writer.line = line
         self.vm_writer.write_goto(label1)
         self.vm_writer.write_label(label2)
         # self.write_tabs("close","whileStatement")
 
+    def compile_bottom_tested_while(self, line: int, body_label: str,
+                                    test_label: str) -> None:
+        """Compiles the rest of a while statement with the condition after
+        the body.
+
+        Args:
+            line (int): the Jack line of the while statement.
+            body_label (str): the label of the body.
+            test_label (str): the label of the condition.
+        """
+        self.eat("(")
+        condition = self.parse_expression()
+        self.eat(")")
+
+        def write_body() -> None:
+            self.eat("{")
+            self.compile_statements()
+            self.eat("}")
+
+        self.write_bottom_tested_loop(line, body_label, test_label,
+                                      condition, write_body)
+
+    def write_bottom_tested_loop(self, line: int, body_label: str,
+                                 test_label: str, condition: Node,
+                                 write_body: typing.Callable[[], None]
+                                 ) -> None:
+        """Writes a while loop with the condition after the body: the loop
+        jumps to the condition once, and every iteration then takes a
+        single branch back to the body. Like the top-tested loop, it goes
+        on only while the condition is true, so a condition which may be
+        another number is compared with true first.
+
+        Args:
+            line (int): the Jack line of the while statement.
+            body_label (str): the label of the body.
+            test_label (str): the label of the condition.
+            condition (Node): the condition.
+            write_body (function): writes the body.
+        """
+        self.vm_writer.write_goto(test_label)
+        self.vm_writer.write_label(body_label)
+        write_body()
+        self.at_line(line)
+        self.vm_writer.write_label(test_label)
+        generate(condition, self.vm_writer)
+        if not is_boolean(condition):
+            self.vm_writer.write_push("CONST", 0)
+            self.vm_writer.write_arithmetic("NOT")
+            self.vm_writer.write_arithmetic("EQ")
+        self.vm_writer.write_if(body_label)
+
+    def parse_statements(self) -> typing.List[Statement]:
+        """Parses a sequence of statements into a list of statement trees,
+        not including the enclosing "{}"."""
+        statements = []
+        while self.tokenizer.cur_token in ["if", "while", "let", "do",
+                                           "return"]:
+            if self.tokenizer.cur_token == "if":
+                statements.append(self.parse_if())
+            elif self.tokenizer.cur_token == "let":
+                statements.append(self.parse_let())
+            elif self.tokenizer.cur_token == "while":
+                statements.append(self.parse_while())
+            elif self.tokenizer.cur_token == "do":
+                statements.append(self.parse_do())
+            else:
+                statements.append(self.parse_return())
+        return statements
+
+    def parse_let(self) -> Let:
+        """Parses a let statement."""
+        line = self.tokenizer.position()[0]
+        self.eat("let")
+        var_name = self.tokenizer.cur_token
+        self.is_valid_name()
+        var_kind = self.symtable.kind_of(var_name)
+        var_index = self.symtable.index_of(var_name)
+        offset = None
+        if self.tokenizer.cur_token == "[":
+            self.eat("[")
+            offset = self.parse_expression()
+            self.eat("]")
+        self.eat("=")
+        value = self.parse_expression()
+        self.eat(";")
+        return Let(line, KINDDICT[var_kind], var_index, offset, value)
+
+    def parse_do(self) -> Do:
+        """Parses a do statement."""
+        line = self.tokenizer.position()[0]
+        self.eat("do")
+        call = self.parse_subroutine_call()
+        self.eat(";")
+        return Do(line, call)
+
+    def parse_return(self) -> Return:
+        """Parses a return statement."""
+        line = self.tokenizer.position()[0]
+        self.eat("return")
+        if self.tokenizer.cur_token == "this":
+            value = Variable("POINTER", 0)
+            self.eat("this")
+        elif self.tokenizer.cur_token != ";":
+            value = self.parse_expression()
+        else:
+            value = Constant(0)
+        self.eat(";")
+        return Return(line, value)
+
+    def parse_if(self) -> If:
+        """Parses an if statement, possibly with a trailing else clause."""
+        line = self.tokenizer.position()[0]
+        label1 = self.generate_label()
+        label2 = self.generate_label()
+        self.eat("if")
+        self.eat("(")
+        condition = self.parse_expression()
+        self.eat(")")
+        self.eat("{")
+        then = self.parse_statements()
+        self.eat("}")
+        otherwise = None
+        if self.tokenizer.cur_token == "else":
+            self.eat("else")
+            self.eat("{")
+            otherwise = self.parse_statements()
+            self.eat("}")
+        return If(line, label1, label2, condition, then, otherwise)
+
+    def parse_while(self) -> While:
+        """Parses a while statement."""
+        line = self.tokenizer.position()[0]
+        self.eat("while")
+        label1 = self.generate_label()
+        label2 = self.generate_label()
+        self.eat("(")
+        condition = self.parse_expression()
+        self.eat(")")
+        self.eat("{")
+        body = self.parse_statements()
+        self.eat("}")
+        return While(line, label1, label2, condition, body)
+
+    def write_statements(self, statements: typing.List[Statement]) -> None:
+        """Writes the code of a list of statement trees, like
+        compile_statements would have written it.
+
+        Args:
+            statements (list): the statements.
+        """
+        for statement in statements:
+            self.at_line(statement.line)
+            if isinstance(statement, Let):
+                if statement.offset is None:
+                    generate(statement.value, self.vm_writer)
+                    self.vm_writer.write_pop(statement.segment,
+                                             statement.index)
+                    continue
+                self.vm_writer.write_push(statement.segment, statement.index)
+                generate(statement.offset, self.vm_writer)
+                self.vm_writer.write_arithmetic("ADD")
+                generate(statement.value, self.vm_writer)
+                self.vm_writer.write_pop("TEMP", 0)
+                self.vm_writer.write_pop("POINTER", 1)
+                self.vm_writer.write_push("TEMP", 0)
+                self.vm_writer.write_pop("THAT", 0)
+            elif isinstance(statement, Do):
+                generate(statement.call, self.vm_writer)
+                self.vm_writer.write_pop("TEMP", 0)
+            elif isinstance(statement, Return):
+                generate(statement.value, self.vm_writer)
+                self.vm_writer.write_return()
+            elif isinstance(statement, If):
+                generate(statement.condition, self.vm_writer)
+                self.vm_writer.write_arithmetic("NOT")
+                self.vm_writer.write_if(statement.else_label)
+                self.write_statements(statement.then)
+                self.at_line(statement.line)
+                self.vm_writer.write_goto(statement.end_label)
+                self.vm_writer.write_label(statement.else_label)
+                if statement.otherwise is not None:
+                    self.write_statements(statement.otherwise)
+                self.at_line(statement.line)
+                self.vm_writer.write_label(statement.end_label)
+            else:
+                self.write_while(statement)
+
+    def write_while(self, loop: While) -> None:
+        """Writes the code of a while statement tree, with the invariant
+        expressions of the loop computed before it.
+
+        Args:
+            loop (While): the loop.
+        """
+        self.at_line(loop.line)
+        hoisted = hoist(loop, self.allocate)
+        if hoisted:
+            names = self.variable_names()
+            self.hoisted.append((self.subroutine_name, loop.line,
+                                 [render(expression, names)
+                                  for expression, index in hoisted]))
+        for expression, index in hoisted:
+            generate(expression, self.vm_writer)
+            self.vm_writer.write_pop("LOCAL", index)
+        if self.bottom_loops:
+            # the end label marks the condition, as in
+            # compile_bottom_tested_while
+            self.write_bottom_tested_loop(
+                loop.line, loop.top_label, loop.end_label, loop.condition,
+                lambda: self.write_statements(loop.body))
+            return
+        self.vm_writer.write_label(loop.top_label)
+        generate(loop.condition, self.vm_writer)
+        self.vm_writer.write_arithmetic("NOT")
+        self.vm_writer.write_if(loop.end_label)
+        self.write_statements(loop.body)
+        self.at_line(loop.line)
+        self.vm_writer.write_goto(loop.top_label)
+        self.vm_writer.write_label(loop.end_label)
+
+    def allocate(self, expression: Node) -> int:
+        """Defines a new local for a hoisted expression. Its name is the
+        expression in parentheses, which no Jack variable can be named.
+
+        Args:
+            expression (Node): the expression.
+
+        Returns:
+            int: the index of the local.
+        """
+        index = self.symtable.var_count("VAR")
+        self.symtable.define("(%s)" % render(expression,
+                                             self.variable_names()),
+                             "int", "VAR")
+        return index
+
+    def variable_names(self) -> typing.Dict[typing.Tuple[str, int], str]:
+        """
+        Returns:
+            dict: the name of every variable in the current scope, by its
+            segment and index.
+        """
+        names = {}
+        for table in (self.symtable.class_table,
+                      self.symtable.subroutine_table):
+            for name, symbol in table.items():
+                names[(KINDDICT[symbol.kind], symbol.index)] = name
+        return names
+
     def compile_return(self) -> None:
         """Compiles a return statement."""
         self.eat("return")
@@ -284,6 +595,7 @@ class CompilationEngine:
     def compile_if(self) -> None:
         """Compiles a if statement, possibly with a trailing else clause."""
         # self.write_tabs("open","ifStatement")
+        line = self.vm_writer.line
         label1 = self.generate_label()
         label2 = self.generate_label()
         self.eat("if")
@@ -295,6 +607,7 @@ class CompilationEngine:
         self.eat("{")
         self.compile_statements()
         self.eat("}")
+        self.vm_writer.line = line
         self.vm_writer.write_goto(label2)
         self.vm_writer.write_label(label1)
         if self.tokenizer.cur_token == "else":
@@ -302,101 +615,82 @@ class CompilationEngine:
             self.eat("{")
             self.compile_statements()
             self.eat("}")
+        self.vm_writer.line = line
         self.vm_writer.write_label(label2)
         # self.write_tabs("close","ifStatement")
 
 
     def compile_expression(self) -> None:
         """Compiles an expression."""
-        if self.tokenizer.cur_token == "null":
-            self.vm_writer.write_push("CONST", 0)
-            self.tokenizer.advance()
-
-        if self.tokenizer.cur_token in ["-", "~"]:
-            op = self.tokenizer.cur_token
+        generate(self.parse_expression(), self.vm_writer)
+
+    def parse_expression(self) -> Node:
+        """Parses an expression into a tree.
+        The binary operators are right associative, and a unary operator
+        applies to the whole rest of the expression, so the tree leans to the
+        right. The operators are collected in a loop and the tree is built
+        from the last term back, so long expressions don't recurse.
+        """
+        pending = []
+        while True:
+            while self.tokenizer.cur_token in ["-", "~"]:
+                pending.append((self.tokenizer.cur_token, None))
+                self.tokenizer.advance()
+            node = self.parse_term()
+            if self.tokenizer.cur_token not in OPERATORS:
+                break
+            pending.append((self.tokenizer.cur_token, node))
             self.tokenizer.advance()
-            self.compile_expression()
-            self.vm_writer.write_arithmetic(PREOPDICT[op])
-
-
-        if self.tokenizer.cur_token == "(":
+        for op, left in reversed(pending):
+            if left is None:
+                node = Unary(op, node)
+            else:
+                node = Binary(op, left, node)
+        return node
+
+    def parse_term(self) -> Node:
+        """Parses a single term, without the unary operators before it."""
+        token = self.tokenizer.cur_token
+        kind = self.tokenizer.cur_kind
+        if token == "(":
             self.eat("(")
-            self.compile_expression()
+            node = self.parse_expression()
             self.eat(")")
-
-
-        if self.tokenizer.cur_token[0] in INTEGERS:
-            self.vm_writer.write_push("CONST", int(self.tokenizer.cur_token))
-            self.tokenizer.advance()
-
-        if self.tokenizer.cur_token in ["true", "false"]:
-            if self.tokenizer.cur_token == "true":
-                self.vm_writer.write_push("CONST", 1)
-                self.vm_writer.write_arithmetic("NEG")
+            return node
+        if kind == INT_CONST:
+            node = Constant(int(token))
+        elif token in ["null", "false"]:
+            node = Constant(0)
+        elif token == "true":
+            node = Unary("-", Constant(1))
+        elif kind == STRING_CONST:
+            if self.string_pool:
+                node = Call(StringPool.function_name(token[1:-1]), None, [])
             else:
-                self.vm_writer.write_push("CONST", 0)
+                node = String(token[1:-1])
+        elif kind == IDENTIFIER or kind == KEYWORD:
+            symbol = self.symtable.lookup(token)
+            if symbol is None:
+                return self.parse_subroutine_call()
+            var_kind, var_type, var_index = symbol
+            node = Variable(KINDDICT[var_kind], var_index)
             self.tokenizer.advance()
-
-        # if it's a string
-        if self.tokenizer.cur_token[0] == '\"':
-            phrase = self.tokenizer.cur_token[1:-1]
-            self.vm_writer.write_push("CONST", len(phrase))
-            self.vm_writer.write_call("String.new", 1)
-            for letter in phrase:
-                self.vm_writer.write_push("CONST", ord(letter))
-                self.vm_writer.write_call("String.appendChar", 2)
-            self.tokenizer.advance()
-
-        # if it's a function
-        if self.tokenizer.cur_token not in INTEGERS and self.tokenizer.cur_token not in SYMBOLS:
-            if self.symtable.type_of(self.tokenizer.cur_token) is None:
-                self.compile_subroutine_call()
-            else:
-                var_name = self.tokenizer.cur_token
-                var_kind = self.symtable.kind_of(var_name)
-                var_index = self.symtable.index_of(var_name)
-                var_type = self.symtable.type_of(var_name)
+            if self.tokenizer.cur_token == "[":
+                self.eat("[")
+                node = ArrayRead(node, self.parse_expression())
+                self.eat("]")
+            elif self.tokenizer.cur_token == ".":
+                self.eat(".")
+                function_name = var_type + "." + self.tokenizer.cur_token
                 self.tokenizer.advance()
-                if self.tokenizer.cur_token == "[":
-                    self.eat("[")
-                    self.vm_writer.write_push(KINDDICT[var_kind], var_index)
-                    self.compile_expression()
-                    self.vm_writer.write_arithmetic("ADD")
-                    # self.vm_writer.write_pop("TEMP", 0)
-                    self.vm_writer.write_pop("POINTER", 1)
-                    # self.vm_writer.write_push("TEMP", 0)
-                    self.vm_writer.write_push("THAT", 0)
-                    self.eat("]")
-                elif self.tokenizer.cur_token == ".":
-                    self.eat(".")
-                    self.vm_writer.write_push(KINDDICT[self.symtable.kind_of(var_name)],var_index)
-                    function_name = var_type + "." + self.tokenizer.cur_token
-                    self.tokenizer.advance()
-                    self.eat("(")
-                    call_var_num = self.compile_expression_list()
-                    self.eat(")")
-                    self.vm_writer.write_call(function_name, call_var_num+1)
-                else:
-                    kind = KINDDICT[self.symtable.kind_of(var_name)]
-                    index = self.symtable.index_of(var_name)
-                    self.vm_writer.write_push(kind, index)
-                    # self.tokenizer.advance()
-
-        while self.tokenizer.cur_token in ['+', '-', '*', "/", "&", "|", "<", ">", "="]:
-            op = self.tokenizer.cur_token
-            self.tokenizer.advance()
-            self.compile_expression()
-            if self.tokenizer.cur_token == "(":
                 self.eat("(")
-                self.compile_expression()
+                node = Call(function_name, node, self.parse_expression_list())
                 self.eat(")")
-            if op in ['+', '-', "&", "|", "<", ">", "="]:
-                self.vm_writer.write_arithmetic(OPDICT[op])
-            else:
-                self.vm_writer.write_call(MATHDICT[op], 2)
-
-
-
+            return node
+        else:
+            self.eat(1)
+        self.tokenizer.advance()
+        return node
 
     def compile_term(self) -> None:
         """Compiles a term. 
@@ -410,7 +704,7 @@ class CompilationEngine:
         """
         # Your code goes here!
         self.write_tabs("open", "term")
-        if self.tokenizer.token_type() == "IDENTIFIER":
+        if self.tokenizer.cur_kind == IDENTIFIER:
             self.is_valid_name()
             if self.tokenizer.cur_token == "[":
                 self.eat("[")
@@ -439,13 +733,19 @@ class CompilationEngine:
 
     def compile_expression_list(self) -> int:
         """Compiles a (possibly empty) comma-separated list of expressions."""
-        var_count = 0
+        expressions = self.parse_expression_list()
+        for expression in expressions:
+            generate(expression, self.vm_writer)
+        return len(expressions)
+
+    def parse_expression_list(self) -> typing.List[Node]:
+        """Parses a (possibly empty) comma-separated list of expressions."""
+        expressions = []
         while self.tokenizer.cur_token != ")":
-            var_count += 1
-            self.compile_expression()
+            expressions.append(self.parse_expression())
             if self.tokenizer.cur_token == ",":
                 self.eat(",")
-        return var_count
+        return expressions
 
     def eat(self, string):
         if self.tokenizer.cur_token != string:
@@ -455,21 +755,19 @@ class CompilationEngine:
 
     def write_out(self):
         self.write_tabs()
-        value = "ERROR"
-        type = self.tokenizer.token_type()
-        if type == "IDENTIFIER":
+        kind = self.tokenizer.cur_kind
+        if kind == IDENTIFIER:
             value = self.tokenizer.identifier()
-
-        if type == "INT_CONST":
-            value = self.tokenizer.int_val()
-        if type == "STRING_CONST":
-            value = self.tokenizer.string_val()
-        if type == "SYMBOL":
+        elif kind == SYMBOL:
             value = self.tokenizer.symbol()
-        if type == "KEYWORD":
+        elif kind == KEYWORD:
             value = self.tokenizer.keyword()
+        elif kind == INT_CONST:
+            value = self.tokenizer.int_val()
+        else:
+            value = self.tokenizer.string_val()
 
-        # self.output.write("<" + self.dict[type] + "> " + str(value) + " </" + self.dict[type] + ">\n")
+        # self.output.write("<" + self.tags[kind] + "> " + str(value) + " </" + self.tags[kind] + ">\n")
         self.tokenizer.advance()
 
     def write_tabs(self, state=None, token=None):
@@ -497,44 +795,58 @@ class CompilationEngine:
             self.vm_writer.write_pop("POINTER", 0)
         self.compile_statements()
         self.eat("}")
+        if self.symtable.var_count("VAR") > count:
+            self.frame_sizes[func_name] = self.symtable.var_count("VAR")
         return count
 
     def is_valid_type(self):
-        if self.tokenizer.cur_token in NON_VALID_TYPE:
+        if self.tokenizer.cur_kind != IDENTIFIER and \
+                self.tokenizer.cur_token not in TYPE_KEYWORDS:
             self.eat(1)
         self.write_out()
 
     def is_valid_name(self):
-        if self.tokenizer.cur_token in NON_VALID_NAME:
-            self.eat(1)
-        if self.tokenizer.cur_token[0] in INTEGERS:
+        if self.tokenizer.cur_kind != IDENTIFIER:
             self.eat(1)
         self.write_out()
 
     def compile_subroutine_call(self):
-        is_method = 0
-        if self.symtable.type_of(self.tokenizer.cur_token) == None:
+        generate(self.parse_subroutine_call(), self.vm_writer)
+
+    def parse_subroutine_call(self) -> Call:
+        receiver = None
+        symbol = self.symtable.lookup(self.tokenizer.cur_token)
+        if symbol is None:
             function_name = self.tokenizer.cur_token
             self.tokenizer.advance()
             if self.tokenizer.cur_token != ".":
-                self.vm_writer.write_push("POINTER", 0)
+                receiver = Variable("POINTER", 0)
                 function_name = self.class_name + "." + function_name
-                is_method = 1
         else:
-            obj = self.tokenizer.cur_token
-            self.vm_writer.write_push(KINDDICT[self.symtable.kind_of(obj)], self.symtable.index_of(obj))
-            function_name = self.symtable.type_of(self.tokenizer.cur_token)
-            is_method = 1
+            receiver = Variable(KINDDICT[symbol.kind], symbol.index)
+            function_name = symbol.type
             self.tokenizer.advance()
         if self.tokenizer.cur_token == ".":
             self.eat(".")
             function_name += "." + self.tokenizer.cur_token
             self.is_valid_name()
         self.eat("(")
-        call_var_num = self.compile_expression_list()
+        arguments = self.parse_expression_list()
         self.eat(")")
-        self.vm_writer.write_call(function_name, call_var_num + is_method)
+        return Call(function_name, receiver, arguments)
+
+
+    def at_line(self, line: int) -> None:
+        """Makes a Jack line the line of the commands written next, if the
+        lines are collected."""
+        if self.source_lines is not None:
+            self.vm_writer.line = line
 
+    def mark(self) -> None:
+        """Makes the line of the current token the line of the commands
+        written next, if the lines are collected."""
+        if self.source_lines is not None:
+            self.vm_writer.line = self.tokenizer.position()[0]
 
     def generate_label(self):
         self.label_count += 1
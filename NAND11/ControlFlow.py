@@ -0,0 +1,369 @@
+"""
+This file is part of nand2tetris, as taught in The Hebrew University, and
+was written by Aviv Yaish. It is an extension to the specifications given
+[here](https://www.nand2tetris.org) (Shimon Schocken and Noam Nisan, 2017),
+as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
+
+The control flow graph of a function: its instructions split into basic
+blocks, which are only entered at their start and only left at their end,
+with an edge from every block to each block which may run right after it.
+
+A block starts with the labels which lead into it, and ends with a goto,
+an if-goto or a return, or just before the next label. The blocks keep the
+order of the instructions, so writing them out in order gives the function
+back as it was, and a block without a jump at its end falls through to the
+next one. The analyses work on the graph as it is; the transformations
+change it in place and connect it again.
+"""
+import typing
+from VMWriter import timed
+
+Instructions = typing.List[tuple]
+
+# The instructions which end a block.
+BRANCHES = ("goto", "if-goto", "return")
+
+
+class Block:
+    """A basic block: its instructions, and the indices of the blocks which
+    may run right after it."""
+    __slots__ = ("instructions", "successors")
+
+    def __init__(self) -> None:
+        self.instructions = []
+        self.successors = []
+
+    def body(self) -> Instructions:
+        """
+        Returns:
+            list: the instructions of the block, without its labels.
+        """
+        return [instruction for instruction in self.instructions
+                if instruction[0] != "label"]
+
+
+class Graph:
+    """The control flow graph of a function: its function command, if any,
+    its blocks in order, the first of which is the entry, and the block of
+    every label."""
+    __slots__ = ("header", "blocks", "labels")
+
+    def __init__(self, header: typing.Optional[tuple],
+                 blocks: typing.List[Block]) -> None:
+        self.header = header
+        self.blocks = blocks
+        self.labels = {}
+        connect(self)
+
+
+def connect(graph: Graph) -> None:
+    """Finds the block of every label and the successors of every block,
+    after the blocks were made or changed.
+
+    Args:
+        graph (Graph): the graph.
+    """
+    graph.labels = {instruction[1]: index
+                    for index, block in enumerate(graph.blocks)
+                    for instruction in block.instructions
+                    if instruction[0] == "label"}
+    count = len(graph.blocks)
+    for index, block in enumerate(graph.blocks):
+        last = block.instructions[-1]
+        block.successors = []
+        if last[0] not in ("goto", "return") and index + 1 < count:
+            block.successors.append(index + 1)
+        if last[0] in ("goto", "if-goto"):
+            block.successors.append(graph.labels[last[1]])
+
+
+def build(instructions: Instructions) -> Graph:
+    """
+    Args:
+        instructions (list): the instructions of a function.
+
+    Returns:
+        Graph: the control flow graph of the function.
+    """
+    header = None
+    if instructions and instructions[0][0] == "function":
+        header = instructions[0]
+        instructions = instructions[1:]
+    blocks = []
+    block = None
+    # whether the current block has anything other than labels
+    started = False
+    for instruction in instructions:
+        op = instruction[0]
+        if block is None or (op == "label" and started):
+            block = Block()
+            blocks.append(block)
+            started = False
+        block.instructions.append(instruction)
+        if op != "label":
+            started = True
+        if op in BRANCHES:
+            block = None
+    return Graph(header, blocks)
+
+
+def serialize(graph: Graph) -> Instructions:
+    """
+    Args:
+        graph (Graph): the graph of a function.
+
+    Returns:
+        list: the instructions of the function, block after block.
+    """
+    instructions = [] if graph.header is None else [graph.header]
+    for block in graph.blocks:
+        instructions.extend(block.instructions)
+    return instructions
+
+
+def reachable(graph: Graph) -> typing.List[bool]:
+    """
+    Args:
+        graph (Graph): the graph of a function.
+
+    Returns:
+        list: for every block, whether it may run at all.
+    """
+    seen = [False] * len(graph.blocks)
+    pending = [0] if graph.blocks else []
+    while pending:
+        index = pending.pop()
+        if not seen[index]:
+            seen[index] = True
+            pending.extend(graph.blocks[index].successors)
+    return seen
+
+
+def reverse_postorder(graph: Graph) -> typing.List[int]:
+    """
+    Args:
+        graph (Graph): the graph of a function.
+
+    Returns:
+        list: the reachable blocks, every block before its successors
+        except along back edges.
+    """
+    order = []
+    seen = set()
+    stack = [(0, iter(graph.blocks[0].successors))] if graph.blocks else []
+    seen.update(index for index, _ in stack)
+    while stack:
+        index, successors = stack[-1]
+        for successor in successors:
+            if successor not in seen:
+                seen.add(successor)
+                stack.append((successor,
+                              iter(graph.blocks[successor].successors)))
+                break
+        else:
+            stack.pop()
+            order.append(index)
+    order.reverse()
+    return order
+
+
+def dominators(graph: Graph) -> typing.List[typing.Optional[int]]:
+    """Finds the immediate dominator of every block: the last block which
+    every path from the entry to it goes through. This is the iterative
+    algorithm of Cooper, Harvey and Kennedy.
+
+    Args:
+        graph (Graph): the graph of a function.
+
+    Returns:
+        list: the immediate dominator of every block. The entry is its own
+        dominator, and the blocks which can't be reached have None.
+    """
+    order = reverse_postorder(graph)
+    position = {index: rank for rank, index in enumerate(order)}
+    predecessors = [[] for _ in graph.blocks]
+    for index in order:
+        for successor in graph.blocks[index].successors:
+            predecessors[successor].append(index)
+    idom = [None] * len(graph.blocks)
+    if not order:
+        return idom
+    idom[0] = 0
+    changed = True
+    while changed:
+        changed = False
+        for index in order[1:]:
+            new = None
+            for predecessor in predecessors[index]:
+                if idom[predecessor] is None:
+                    continue
+                if new is None:
+                    new = predecessor
+                    continue
+                # walk both up the tree until they meet
+                other = predecessor
+                while new != other:
+                    while position[new] > position[other]:
+                        new = idom[new]
+                    while position[other] > position[new]:
+                        other = idom[other]
+            if idom[index] != new:
+                idom[index] = new
+                changed = True
+    return idom
+
+
+def back_edges(graph: Graph, idom: typing.List[typing.Optional[int]]
+               ) -> typing.List[typing.Tuple[int, int]]:
+    """
+    Args:
+        graph (Graph): the graph of a function.
+        idom (list): the immediate dominators of its blocks.
+
+    Returns:
+        list: the edges from a block to a block which dominates it, one for
+        every loop.
+    """
+    edges = []
+    for index, block in enumerate(graph.blocks):
+        for successor in block.successors:
+            dominator = index if idom[index] is not None else None
+            while dominator is not None and dominator != successor:
+                dominator = None if dominator == 0 else idom[dominator]
+            if dominator == successor:
+                edges.append((index, successor))
+    return edges
+
+
+def live_locals(graph: Graph) -> typing.Tuple[typing.List[int],
+                                              typing.List[int]]:
+    """
+    Args:
+        graph (Graph): the graph of a function.
+
+    Returns:
+        tuple: the locals live at the start and at the end of every block,
+        as bit masks: those which may still be read before they are written.
+    """
+    uses = []
+    kills = []
+    for block in graph.blocks:
+        used = written = 0
+        for instruction in block.instructions:
+            if instruction[:2] == ("push", "local"):
+                used |= (1 << instruction[2]) & ~written
+            elif instruction[:2] == ("pop", "local"):
+                written |= 1 << instruction[2]
+        uses.append(used)
+        kills.append(~written)
+    live_in = [0] * len(graph.blocks)
+    live_out = [0] * len(graph.blocks)
+    changed = True
+    while changed:
+        changed = False
+        for index in range(len(graph.blocks) - 1, -1, -1):
+            out = 0
+            for successor in graph.blocks[index].successors:
+                out |= live_in[successor]
+            live_out[index] = out
+            new = uses[index] | (out & kills[index])
+            if new != live_in[index]:
+                live_in[index] = new
+                changed = True
+    return live_in, live_out
+
+
+def thread_jumps(graph: Graph) -> int:
+    """Makes every jump to a block which only jumps on go straight to the
+    final target, as happens at the ends of nested if statements.
+
+    Args:
+        graph (Graph): the graph of a function.
+
+    Returns:
+        int: the number of jumps which changed.
+    """
+    changed = 0
+    for block in graph.blocks:
+        last = block.instructions[-1]
+        if last[0] not in ("goto", "if-goto"):
+            continue
+        label = last[1]
+        seen = set()
+        while label not in seen:
+            seen.add(label)
+            body = graph.blocks[graph.labels[label]].body()
+            if len(body) != 1 or body[0][0] != "goto":
+                break
+            label = body[0][1]
+        if label != last[1]:
+            block.instructions[-1] = (last[0], label)
+            changed += 1
+    if changed:
+        connect(graph)
+    return changed
+
+
+def remove_unreachable(graph: Graph) -> int:
+    """Drops the blocks which can't run, like the code after a return.
+
+    Args:
+        graph (Graph): the graph of a function.
+
+    Returns:
+        int: the number of instructions dropped.
+    """
+    seen = reachable(graph)
+    dropped = sum(len(block.instructions)
+                  for block, live in zip(graph.blocks, seen) if not live)
+    if dropped:
+        graph.blocks = [block for block, live in zip(graph.blocks, seen)
+                        if live]
+        connect(graph)
+    return dropped
+
+
+def drop_jumps_to_next(graph: Graph) -> int:
+    """Drops the gotos to the block which follows anyway, like those over
+    an empty else part.
+
+    Args:
+        graph (Graph): the graph of a function.
+
+    Returns:
+        int: the number of gotos dropped.
+    """
+    dropped = 0
+    for index, block in enumerate(graph.blocks):
+        last = block.instructions[-1]
+        if last[0] == "goto" and graph.labels[last[1]] == index + 1 and \
+                len(block.instructions) > 1:
+            block.instructions.pop()
+            dropped += 1
+    if dropped:
+        connect(graph)
+    return dropped
+
+
+def simplify(instructions: Instructions, optimize: bool = False,
+             timings: typing.Optional[typing.Dict[str, float]] = None
+             ) -> Instructions:
+    """Passes the instructions of a function through its control flow graph.
+    Without optimization they come out as they went in.
+
+    Args:
+        instructions (list): the instructions of a function.
+        optimize (bool): thread jumps, and drop unreachable blocks and
+        gotos to the next block.
+        timings (dict): gets the seconds spent in every step, if given.
+
+    Returns:
+        list: the instructions of the function.
+    """
+    graph = timed(timings, "cfg build", build, instructions)
+    if optimize:
+        timed(timings, "cfg thread_jumps", thread_jumps, graph)
+        timed(timings, "cfg remove_unreachable", remove_unreachable, graph)
+        timed(timings, "cfg drop_jumps_to_next", drop_jumps_to_next, graph)
+    return timed(timings, "cfg serialize", serialize, graph)
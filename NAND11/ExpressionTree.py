@@ -0,0 +1,196 @@
+"""
+This file is part of nand2tetris, as taught in The Hebrew University, and
+was written by Aviv Yaish. It is an extension to the specifications given
+[here](https://www.nand2tetris.org) (Shimon Schocken and Noam Nisan, 2017),
+as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
+
+The expression tree built by the CompilationEngine, and the code generator
+which turns it into VM commands. Variables are resolved while parsing, so a
+tree only holds VMWriter segments and indices.
+"""
+import typing
+from VMWriter import VMWriter
+
+OPDICT = {'+':"ADD", '-':"SUB", "&":"AND", "|":"OR", "<":"LT", ">":"GT", "=":"EQ"}
+
+PREOPDICT = {'-':"NEG","~":"NOT"}
+
+MATHDICT = {"*":"Math.multiply", "/":"Math.divide"}
+
+
+class Node:
+    """A node of an expression tree. Code is generated without recursion:
+    generate() writes the commands which come before the node's children,
+    and pushes the children and whatever must follow them on a stack of
+    nodes that is still to be generated, last first.
+    """
+    __slots__ = ()
+
+    def generate(self, writer: VMWriter, stack: typing.List["Node"]) -> None:
+        """
+        Args:
+            writer (VMWriter): where to write the commands.
+            stack (list): the nodes still to be generated.
+        """
+        raise NotImplementedError
+
+
+class Emit(Node):
+    """A single VMWriter call, scheduled to run after some children."""
+    __slots__ = ("function", "arguments")
+
+    def __init__(self, function: typing.Callable, *arguments) -> None:
+        self.function = function
+        self.arguments = arguments
+
+    def generate(self, writer, stack):
+        self.function(writer, *self.arguments)
+
+
+# The emits which take no varying arguments are shared by all the trees.
+PUSH_THAT = Emit(VMWriter.write_push, "THAT", 0)
+POP_POINTER = Emit(VMWriter.write_pop, "POINTER", 1)
+OPERATIONS = {op: Emit(VMWriter.write_arithmetic, command)
+              for op, command in OPDICT.items()}
+OPERATIONS.update((op, Emit(VMWriter.write_call, name, 2))
+                  for op, name in MATHDICT.items())
+PREOPERATIONS = {op: Emit(VMWriter.write_arithmetic, command)
+                 for op, command in PREOPDICT.items()}
+
+
+class Constant(Node):
+    """A non-negative integer, as well as null and false."""
+    __slots__ = ("value",)
+
+    def __init__(self, value: int) -> None:
+        self.value = value
+
+    def generate(self, writer, stack):
+        writer.write_push("CONST", self.value)
+
+
+class String(Node):
+    """A string constant, built with String.new and String.appendChar."""
+    __slots__ = ("text",)
+
+    def __init__(self, text: str) -> None:
+        self.text = text
+
+    def generate(self, writer, stack):
+        writer.write_push("CONST", len(self.text))
+        writer.write_call("String.new", 1)
+        for letter in self.text:
+            writer.write_push("CONST", ord(letter))
+            writer.write_call("String.appendChar", 2)
+
+
+class Variable(Node):
+    """A value in a memory segment: a variable, or this."""
+    __slots__ = ("segment", "index")
+
+    def __init__(self, segment: str, index: int) -> None:
+        self.segment = segment
+        self.index = index
+
+    def generate(self, writer, stack):
+        writer.write_push(self.segment, self.index)
+
+
+class ArrayRead(Node):
+    """An array entry, base[index]."""
+    __slots__ = ("base", "index")
+
+    def __init__(self, base: Variable, index: Node) -> None:
+        self.base = base
+        self.index = index
+
+    def generate(self, writer, stack):
+        stack += (PUSH_THAT, POP_POINTER, OPERATIONS["+"], self.index,
+                  self.base)
+
+
+class Call(Node):
+    """A subroutine call. Methods get their object as the first argument."""
+    __slots__ = ("name", "receiver", "arguments")
+
+    def __init__(self, name: str, receiver: typing.Optional[Node],
+                 arguments: typing.List[Node]) -> None:
+        self.name = name
+        self.receiver = receiver
+        self.arguments = arguments
+
+    def generate(self, writer, stack):
+        count = len(self.arguments) + (self.receiver is not None)
+        stack.append(Emit(VMWriter.write_call, self.name, count))
+        stack.extend(reversed(self.arguments))
+        if self.receiver is not None:
+            stack.append(self.receiver)
+
+
+class Unary(Node):
+    """A unary operator applied to an operand."""
+    __slots__ = ("op", "operand")
+
+    def __init__(self, op: str, operand: Node) -> None:
+        self.op = op
+        self.operand = operand
+
+    def generate(self, writer, stack):
+        stack += (PREOPERATIONS[self.op], self.operand)
+
+
+class Binary(Node):
+    """A binary operator applied to two operands."""
+    __slots__ = ("op", "left", "right")
+
+    def __init__(self, op: str, left: Node, right: Node) -> None:
+        self.op = op
+        self.left = left
+        self.right = right
+
+    def generate(self, writer, stack):
+        stack += (OPERATIONS[self.op], self.right, self.left)
+
+
+# The binary operators whose value is always true or false.
+COMPARISONS = {"<", ">", "="}
+
+
+def is_boolean(root: Node) -> bool:
+    """
+    Args:
+        root (Node): an expression.
+
+    Returns:
+        bool: True if the expression is known to be true or false: a
+        comparison, true, false, or the ~, & and | of such expressions.
+    """
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, Binary) and node.op in COMPARISONS:
+            continue
+        if isinstance(node, Binary) and node.op in ("&", "|"):
+            stack += (node.left, node.right)
+        elif isinstance(node, Unary) and node.op == "~":
+            stack.append(node.operand)
+        elif isinstance(node, Constant) and node.value == 0:
+            continue
+        elif not (isinstance(node, Unary) and node.op == "-" and
+                  isinstance(node.operand, Constant) and
+                  node.operand.value == 1):
+            return False
+    return True
+
+
+def generate(root: Node, writer: VMWriter) -> None:
+    """Writes the VM commands which compute an expression.
+
+    Args:
+        root (Node): the expression.
+        writer (VMWriter): where to write the commands.
+    """
+    stack = [root]
+    while stack:
+        stack.pop().generate(writer, stack)
@@ -0,0 +1,406 @@
+"""
+This file is part of nand2tetris, as taught in The Hebrew University, and
+was written by Aviv Yaish. It is an extension to the specifications given
+[here](https://www.nand2tetris.org) (Shimon Schocken and Noam Nisan, 2017),
+as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
+
+An emulator of the Hack computer, which runs .hack and .asm programs and
+counts the cycles they take.
+"""
+import argparse
+import os
+import sys
+import time
+import typing
+import zlib
+from array import array
+from BuiltinOS import BuiltinOS, Halt, SCREEN, KEYBOARD
+
+RAM_SIZE = 32768
+
+# The predefined symbols of the Hack assembly language.
+PREDEFINED = {"SP": 0, "LCL": 1, "ARG": 2, "THIS": 3, "THAT": 4,
+              "SCREEN": SCREEN, "KBD": KEYBOARD}
+PREDEFINED.update(("R%d" % register, register) for register in range(16))
+
+# The first address of the variables of a program.
+VARIABLES = 16
+
+# The a-bit and c-bits of every computation, with A for the a-bit clear.
+COMPUTATIONS = {"0": 0b0101010, "1": 0b0111111, "-1": 0b0111010,
+                "D": 0b0001100, "A": 0b0110000, "!D": 0b0001101,
+                "!A": 0b0110001, "-D": 0b0001111, "-A": 0b0110011,
+                "D+1": 0b0011111, "A+1": 0b0110111, "D-1": 0b0001110,
+                "A-1": 0b0110010, "D+A": 0b0000010, "D-A": 0b0010011,
+                "A-D": 0b0000111, "D&A": 0b0000000, "D|A": 0b0010101}
+COMPUTATIONS.update([(computation.replace("A", "M"), code | 0b1000000)
+                     for computation, code in list(COMPUTATIONS.items())
+                     if "A" in computation])
+COMPUTATIONS.update([("A+D", COMPUTATIONS["D+A"]),
+                     ("M+D", COMPUTATIONS["D+M"]),
+                     ("A&D", COMPUTATIONS["D&A"]),
+                     ("M&D", COMPUTATIONS["D&M"]),
+                     ("A|D", COMPUTATIONS["D|A"]),
+                     ("M|D", COMPUTATIONS["D|M"])])
+
+DESTINATIONS = {"": 0, "M": 1, "D": 2, "MD": 3, "DM": 3, "A": 4, "AM": 5,
+                "MA": 5, "AD": 6, "DA": 6, "AMD": 7, "ADM": 7}
+JUMPS = {"": 0, "JGT": 1, "JEQ": 2, "JGE": 3, "JLT": 4, "JNE": 5, "JLE": 6,
+         "JMP": 7}
+
+# The computation of the decoded A-instructions, and of the addresses of
+# the trapped OS subroutines.
+A_INSTRUCTION, TRAP = -1, -2
+
+# The dest bits.
+M_BIT, D_BIT, A_BIT = 1, 2, 4
+
+
+def wrap(value: int) -> int:
+    return ((value + 32768) & 65535) - 32768
+
+
+# What the ALU computes for every c-bits, on D and on A or M. The results
+# are signed 16-bit values.
+ALU = [None] * 64
+ALU[0b101010] = lambda x, y: 0
+ALU[0b111111] = lambda x, y: 1
+ALU[0b111010] = lambda x, y: -1
+ALU[0b001100] = lambda x, y: x
+ALU[0b110000] = lambda x, y: y
+ALU[0b001101] = lambda x, y: ~x
+ALU[0b110001] = lambda x, y: ~y
+ALU[0b001111] = lambda x, y: wrap(-x)
+ALU[0b110011] = lambda x, y: wrap(-y)
+ALU[0b011111] = lambda x, y: wrap(x + 1)
+ALU[0b110111] = lambda x, y: wrap(y + 1)
+ALU[0b001110] = lambda x, y: wrap(x - 1)
+ALU[0b110010] = lambda x, y: wrap(y - 1)
+ALU[0b000010] = lambda x, y: wrap(x + y)
+ALU[0b010011] = lambda x, y: wrap(x - y)
+ALU[0b000111] = lambda x, y: wrap(y - x)
+ALU[0b000000] = lambda x, y: x & y
+ALU[0b010101] = lambda x, y: x | y
+
+
+def assemble(text: str, externals: typing.Iterable[str] = ()) -> typing.Tuple[
+        typing.List[int], typing.Dict[int, str]]:
+    """Assembles a Hack program. The symbols in externals which the program
+    doesn't define as labels are given addresses after the end of the
+    program, so jumping to them can be trapped.
+
+    Args:
+        text (str): Hack assembly.
+        externals (iterable): names of subroutines provided by the machine.
+
+    Returns:
+        tuple: the words of the program, and the name of the external at
+        every trapped address.
+    """
+    lines = []
+    labels = {}
+    for line in text.splitlines():
+        line = line.split("//", 1)[0].replace(" ", "").strip()
+        if not line:
+            continue
+        if line[0] == "(":
+            labels[line[1:-1]] = len(lines)
+        else:
+            lines.append(line)
+    symbols = dict(PREDEFINED)
+    symbols.update(labels)
+    traps = {}
+    for name in externals:
+        if name not in symbols:
+            traps[len(lines) + len(traps)] = name
+    symbols.update((name, address) for address, name in traps.items())
+    variables = VARIABLES
+    words = []
+    for line in lines:
+        if line[0] == "@":
+            symbol = line[1:]
+            if symbol.isdigit():
+                words.append(int(symbol))
+                continue
+            if symbol not in symbols:
+                symbols[symbol] = variables
+                variables += 1
+            words.append(symbols[symbol])
+            continue
+        destination, _, rest = line.rpartition("=")
+        computation, _, jump = rest.partition(";")
+        try:
+            words.append(0b111 << 13 | COMPUTATIONS[computation] << 6 |
+                         DESTINATIONS[destination] << 3 | JUMPS[jump])
+        except KeyError:
+            raise ValueError("invalid instruction: " + line) from None
+    return words, traps
+
+
+def read_hack(text: str) -> typing.List[int]:
+    """
+    Args:
+        text (str): a .hack file, one binary word per line.
+
+    Returns:
+        list: the words of the program.
+    """
+    return [int(line.strip(), 2) for line in text.splitlines()
+            if line.strip()]
+
+
+class ScreenView:
+    """The screen memory map as 256 rows of 512 pixels. It reads the RAM
+    of the machine directly, without copying it, so it always shows the
+    current screen.
+    """
+    shape = (256, 512)
+
+    def __init__(self, ram: array) -> None:
+        """
+        Args:
+            ram (array): the RAM of the machine.
+        """
+        self.words = memoryview(ram)[SCREEN:KEYBOARD]
+
+    def __getitem__(self, position: typing.Tuple[int, int]) -> int:
+        """
+        Args:
+            position (tuple): the row and column of a pixel.
+
+        Returns:
+            int: 1 if the pixel is black, and 0 otherwise.
+        """
+        row, column = position
+        return self.words[row * 32 + column // 16] >> (column % 16) & 1
+
+    def row(self, row: int) -> typing.List[int]:
+        """
+        Args:
+            row (int): a row of the screen.
+
+        Returns:
+            list: the 512 pixels of the row, left to right.
+        """
+        return [word >> bit & 1 for word in self.words[row * 32:row * 32 + 32]
+                for bit in range(16)]
+
+    def __str__(self):
+        return "\n".join("".join(".#"[pixel] for pixel in self.row(row))
+                         for row in range(self.shape[0]))
+
+
+class HackEmulator:
+    """Runs a Hack program. The ROM is decoded once, into parallel arrays
+    of the fields of every instruction: the value of an A-instruction, or
+    the computation, destination and jump of a C-instruction, so the
+    fetch-execute loop only indexes arrays. The RAM is an array of signed
+    16-bit words.
+
+    Like the VM interpreter, the emulator runs the OS subroutines which an
+    assembled program jumps to without defining them with a BuiltinOS: the
+    jump is trapped, the arguments are read from the frame that the call
+    pushed, and the subroutine returns to its caller as a compiled one
+    would. This way a program compiled without the OS runs headless.
+    """
+
+    def __init__(self, keys: str = "") -> None:
+        """Creates a machine with an empty ROM and a zeroed RAM.
+
+        Args:
+            keys (str): the keys that Keyboard.readChar will return.
+        """
+        self.ram = array('h', bytes(2 * RAM_SIZE))
+        self.os = BuiltinOS(self.ram, keys)
+        self.screen = ScreenView(self.ram)
+        self.values = []
+        self.computations = []
+        self.destinations = []
+        self.jumps = []
+        self.traps = {}
+        self.cycles = 0
+        self.elapsed = 0.0
+        self.builtin_calls = 0
+        self.halted = None
+
+    def load_words(self, words: typing.List[int],
+                   traps: typing.Optional[typing.Dict[int, str]] = None
+                   ) -> None:
+        """Decodes a program into the ROM.
+
+        Args:
+            words (list): the words of the program.
+            traps (dict): the name of the OS subroutine at every trapped
+            address.
+        """
+        # an A-instruction has the computation -1, a C-instruction the a-bit
+        # and c-bits of its computation, and the trapped addresses, which
+        # follow the program, have the computation -2
+        subroutines = self.os.subroutines()
+        traps = traps or {}
+        self.traps = {address: subroutines[name]
+                      for address, name in traps.items()}
+        words = words + [0] * (max(traps, default=len(words) - 1) + 1 -
+                               len(words))
+        self.values = [word if word < 0x8000 else 0 for word in words]
+        self.computations = [word >> 6 & 0b1111111 if word >= 0x8000 else -1
+                             for word in words]
+        for address in traps:
+            self.computations[address] = TRAP
+        self.destinations = [word >> 3 & 0b111 for word in words]
+        self.jumps = [word & 0b111 if word >= 0x8000 else 0
+                      for word in words]
+
+    def load_source(self, text: str) -> None:
+        """Assembles a program and loads it into the ROM.
+
+        Args:
+            text (str): Hack assembly.
+        """
+        self.load_words(*assemble(text, self.os.subroutines()))
+
+    def load_path(self, path: str) -> None:
+        """Loads a .asm or a .hack file into the ROM.
+
+        Args:
+            path (str): the file.
+        """
+        with open(path, 'r') as input_file:
+            text = input_file.read()
+        if os.path.splitext(path)[1].lower() == ".hack":
+            self.load_words(read_hack(text))
+        else:
+            self.load_source(text)
+
+    def trap(self, address: int) -> int:
+        """Runs the OS subroutine at a trapped address, and returns from it.
+
+        Args:
+            address (int): the address.
+
+        Returns:
+            int: the address to return to.
+        """
+        ram = self.ram
+        function, count = self.traps[address]
+        argument = ram[2]
+        frame = ram[1]
+        value = function(*ram[argument:argument + count])
+        return_address = ram[frame - 5]
+        ram[argument] = value or 0
+        ram[0] = argument + 1
+        ram[4] = ram[frame - 1]
+        ram[3] = ram[frame - 2]
+        ram[2] = ram[frame - 3]
+        ram[1] = ram[frame - 4]
+        return return_address
+
+    def run(self, budget: typing.Optional[int] = None) -> int:
+        """Runs the program from address 0 until it halts, by jumping to
+        the jump which precedes it, or until the budget runs out.
+
+        Args:
+            budget (int): the largest number of cycles to run, or None for no
+            limit.
+
+        Returns:
+            int: the number of cycles run.
+        """
+        values = self.values
+        computations = self.computations
+        destinations = self.destinations
+        jumps = self.jumps
+        alu = ALU
+        ram = self.ram
+        limit = budget if budget is not None else float("inf")
+        a = d = pc = 0
+        cycles = 0
+        builtin_calls = 0
+        start = time.perf_counter()
+        self.halted = "cycle budget"
+        try:
+            while cycles < limit:
+                computation = computations[pc]
+                if computation < 0:
+                    if computation == A_INSTRUCTION:
+                        cycles += 1
+                        a = values[pc]
+                        pc += 1
+                    else:
+                        builtin_calls += 1
+                        pc = self.trap(pc)
+                    continue
+                cycles += 1
+                if computation & 0b1000000:
+                    out = alu[computation & 0b111111](d, ram[a])
+                else:
+                    out = alu[computation](d, a)
+                destination = destinations[pc]
+                if destination:
+                    if destination & M_BIT:
+                        ram[a] = out
+                    if destination & D_BIT:
+                        d = out
+                jump = jumps[pc]
+                if jump and jump & (4 if out < 0 else 2 if out == 0 else 1):
+                    if a == pc - 1 and computations[a] < 0 and \
+                            values[a] == a:
+                        # @LOOP; (LOOP) 0;JMP, the idiom which ends a program
+                        self.halted = "halted"
+                        break
+                    pc = a
+                else:
+                    pc += 1
+                if destination & A_BIT:
+                    a = out
+        except Halt as halt:
+            self.halted = str(halt)
+        except IndexError:
+            self.halted = "jumped out of the ROM"
+        self.elapsed += time.perf_counter() - start
+        self.cycles += cycles
+        self.builtin_calls += builtin_calls
+        return cycles
+
+    def output(self) -> str:
+        """
+        Returns:
+            str: the text printed by the OS so far.
+        """
+        return "".join(self.os.output)
+
+    def screen_checksum(self) -> int:
+        """
+        Returns:
+            int: the CRC-32 of the screen memory map.
+        """
+        return zlib.crc32(self.ram[SCREEN:KEYBOARD].tobytes())
+
+    def __str__(self):
+        rate = self.cycles / self.elapsed if self.elapsed else 0.0
+        return ("%d cycles, %d OS calls in %.3f s (%.0f cycles/s), %s, "
+                "screen crc32 %08x" % (
+                    self.cycles, self.builtin_calls, self.elapsed, rate,
+                    self.halted, self.screen_checksum()))
+
+
+if "__main__" == __name__:
+    # Loads a .asm or .hack program and runs it headless, printing what it
+    # printed, then the cycle count of the run.
+    parser = argparse.ArgumentParser(prog="HackEmulator")
+    parser.add_argument("input_path")
+    parser.add_argument("--budget", type=int, default=None,
+                        help="stop after running N cycles")
+    parser.add_argument("--keys", default="",
+                        help="the keys to type when the program reads input")
+    parser.add_argument("--screen", action="store_true",
+                        help="print the screen when the program stops")
+    args = parser.parse_args()
+    emulator = HackEmulator(args.keys)
+    emulator.load_path(os.path.abspath(args.input_path))
+    emulator.run(args.budget)
+    print(emulator.output())
+    if args.screen:
+        print(emulator.screen)
+    print(emulator, file=sys.stderr)
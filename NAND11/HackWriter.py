@@ -0,0 +1,533 @@
+"""
+This file is part of nand2tetris, as taught in The Hebrew University, and
+was written by Aviv Yaish. It is an extension to the specifications given
+[here](https://www.nand2tetris.org) (Shimon Schocken and Noam Nisan, 2017),
+as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
+
+Translates the VM instructions of the compiler straight into Hack assembly,
+without writing and parsing the VM code in between.
+"""
+import typing
+from VMWriter import VMWriter, BUFFER_SIZE, pass_name, timed
+
+# The base address registers of the segments which are pointed to.
+POINTED = {"local": "LCL", "argument": "ARG", "this": "THIS", "that": "THAT"}
+
+# The first address of the temp segment.
+TEMP = 5
+
+# The computation of every binary command, with the top of the stack in D
+# and the value below it in M.
+BINARY = {"add": "M=D+M", "sub": "M=M-D", "and": "M=D&M", "or": "M=D|M"}
+UNARY = {"neg": "M=-M", "not": "M=!M"}
+
+# The jump taken by an if-goto after a comparison, on the difference of its
+# operands, and the jump taken when the comparison is negated first.
+COMPARISONS = {"eq": ("JEQ", "JNE"), "gt": ("JGT", "JLE"),
+               "lt": ("JLT", "JGE")}
+
+# The bulk of the call and return sequences, and of the comparisons, are
+# shared routines. A call site stores its argument count in R13 and the
+# called function in R14, and jumps to $CALL with its return address in D;
+# a comparison jumps to its routine with the return address in D.
+TRAMPOLINES = """($CALL)
+@SP
+AM=M+1
+A=A-1
+M=D
+@LCL
+D=M
+@SP
+AM=M+1
+A=A-1
+M=D
+@ARG
+D=M
+@SP
+AM=M+1
+A=A-1
+M=D
+@THIS
+D=M
+@SP
+AM=M+1
+A=A-1
+M=D
+@THAT
+D=M
+@SP
+AM=M+1
+A=A-1
+M=D
+@SP
+D=M
+@LCL
+M=D
+@5
+D=D-A
+@R13
+D=D-M
+@ARG
+M=D
+@R14
+A=M
+0;JMP
+($RETURN)
+%s@R14
+A=M
+0;JMP
+%s($COMPARED)
+@R15
+A=M
+0;JMP
+"""
+
+# Restores the caller's frame, leaving the return address in R14.
+RETURN = """@5
+D=A
+@LCL
+A=M-D
+D=M
+@R14
+M=D
+@SP
+AM=M-1
+D=M
+@ARG
+A=M
+M=D
+D=A+1
+@SP
+M=D
+@LCL
+AM=M-1
+D=M
+@THAT
+M=D
+@LCL
+AM=M-1
+D=M
+@THIS
+M=D
+@LCL
+AM=M-1
+D=M
+@ARG
+M=D
+@LCL
+A=M-1
+D=M
+@LCL
+M=D
+"""
+
+# A comparison of the two values on top of the stack, which replaces them
+# by true, then by false unless the difference jumps to the end. Only used
+# for eq, whose difference is zero exactly when the values are equal even
+# if the subtraction overflows.
+COMPARE = """@SP
+AM=M-1
+D=M
+A=A-1
+D=M-D
+M=-1
+@%s
+D;%s
+@SP
+A=M-1
+M=0
+"""
+
+# The end of an ordered comparison, once ordered_difference() left the
+# sign of the difference in D: pushes true, then false unless D jumps to
+# the end.
+ORDERED_COMPARE = """@SP
+AM=M+1
+A=A-1
+M=-1
+@%s
+D;%s
+@SP
+A=M-1
+M=0
+"""
+
+
+def ordered_difference(prefix: str) -> typing.List[str]:
+    """
+    Args:
+        prefix (str): the start of the labels the code may use.
+
+    Returns:
+        list: the lines which pop y and then x off the stack and set D to a
+        value with the sign of x - y. When x and y have opposite signs the
+        subtraction may overflow, so D is set to 1 or -1 by the sign of x
+        instead, as a 16-bit x - y would be if it didn't overflow.
+    """
+    return ["@SP", "AM=M-1", "D=M", "@R13", "M=D",
+            "@SP", "AM=M-1", "D=M", "@R14", "M=D",
+            "@%s.NEGATIVE" % prefix, "D;JLT",
+            "@R13", "D=M", "@%s.SUBTRACT" % prefix, "D;JGE",
+            "D=1", "@%s.END" % prefix, "0;JMP",
+            "(%s.NEGATIVE)" % prefix,
+            "@R13", "D=M", "@%s.SUBTRACT" % prefix, "D;JLT",
+            "D=-1", "@%s.END" % prefix, "0;JMP",
+            "(%s.SUBTRACT)" % prefix,
+            "@R13", "D=M", "@R14", "D=M-D",
+            "(%s.END)" % prefix]
+
+
+def compare(command: str, label: str, end: str) -> str:
+    """
+    Args:
+        command (str): "eq", "gt" or "lt".
+        label (str): the start of the labels the code may use.
+        end (str): the label to jump to at the end.
+
+    Returns:
+        str: the code which replaces the two values on top of the stack by
+        the result of comparing them.
+    """
+    jump = COMPARISONS[command][0]
+    if command == "eq":
+        return COMPARE % (end, jump)
+    return "\n".join(ordered_difference(label)) + "\n" + \
+        ORDERED_COMPARE % (end, jump)
+
+PUSH_D = ["@SP", "AM=M+1", "A=A-1", "M=D"]
+POP_D = ["@SP", "AM=M-1", "D=M"]
+
+
+def rom_size(text: str) -> int:
+    """
+    Args:
+        text (str): Hack assembly.
+
+    Returns:
+        int: the number of instructions in it, which is the number of words
+        it takes in the ROM.
+    """
+    size = 0
+    for line in text.splitlines():
+        line = line.split("//", 1)[0].strip()
+        if line and line[0] != "(":
+            size += 1
+    return size
+
+
+def call_sequence(function: str, count: int, return_label: str,
+                  trampolines: bool) -> typing.List[str]:
+    """
+    Args:
+        function (str): the called function.
+        count (int): its number of arguments.
+        return_label (str): a new label to return to.
+        trampolines (bool): jump to the shared call routine, rather than
+        writing the whole call sequence.
+
+    Returns:
+        list: the lines of a call.
+    """
+    if not trampolines:
+        lines = ["@" + return_label, "D=A"] + PUSH_D
+        for register in ("LCL", "ARG", "THIS", "THAT"):
+            lines += ["@" + register, "D=M"] + PUSH_D
+        lines += ["@SP", "D=M", "@LCL", "M=D", "@%d" % (count + 5), "D=D-A",
+                  "@ARG", "M=D"]
+    elif count <= 1:
+        lines = ["@R13", "M=%d" % count]
+    else:
+        lines = ["@%d" % count, "D=A", "@R13", "M=D"]
+    if trampolines:
+        lines += ["@" + function, "D=A", "@R14", "M=D",
+                  "@" + return_label, "D=A", "@$CALL"]
+    else:
+        lines.append("@" + function)
+    lines += ["0;JMP", "(%s)" % return_label]
+    return lines
+
+
+def bootstrap(entry: str = "Sys.init", trampolines: bool = True) -> str:
+    """
+    Args:
+        entry (str): the function which runs the program.
+        trampolines (bool): whether the classes jump to the shared call,
+        return and comparison routines.
+
+    Returns:
+        str: the code which comes first in the ROM: it sets the stack
+        pointer and calls the entry, followed by the shared routines.
+    """
+    lines = ["@256", "D=A", "@SP", "M=D"]
+    lines += call_sequence(entry, 0, "$BOOT", trampolines)
+    lines += ["($HALT)", "@$HALT", "0;JMP"]
+    text = "\n".join(lines) + "\n"
+    if trampolines:
+        comparisons = "".join(
+            "($%s)\n@R15\nM=D\n" % command.upper() +
+            compare(command, "$" + command.upper(), "$COMPARED")
+            + "@$COMPARED\n0;JMP\n" for command in COMPARISONS)
+        text += TRAMPOLINES % (RETURN, comparisons)
+    return text
+
+
+def link(classes: typing.List[str], trampolines: bool = True) -> str:
+    """
+    Args:
+        classes (list): the Hack assembly of every class of a program.
+        trampolines (bool): whether the classes were translated with the
+        shared routines.
+
+    Returns:
+        str: the assembly of the whole program, starting from Sys.init if
+        one of the classes defines it, and from Main.main otherwise.
+    """
+    entry = "Sys.init" if any("(Sys.init)\n" in text for text in classes) \
+        else "Main.main"
+    return bootstrap(entry, trampolines) + "".join(classes)
+
+
+class HackWriter(VMWriter):
+    """
+    Writes Hack assembly instead of VM code, translating the instructions
+    the VMWriter gets. The instructions of each function are collected, run
+    through the optimization passes, and translated together, so common
+    sequences such as a push followed by a pop, an operation or a branch
+    are translated into a single short piece of code.
+
+    Static variables are named after the class, labels after their
+    function, and calls go through shared trampolines which are written
+    once per program by link(), so every call costs about ten words of ROM
+    rather than about fifty.
+    """
+
+    def __init__(self, output_stream: typing.TextIO,
+                 buffer_size: int = BUFFER_SIZE,
+                 passes: typing.Sequence[typing.Callable] = (),
+                 trampolines: bool = True,
+                 timings: typing.Optional[typing.Dict[str, float]] = None
+                 ) -> None:
+        """
+        Args:
+            output_stream (typing.TextIO): the stream to write to.
+            buffer_size (int): how many characters to collect between writes.
+            passes (list): functions which get the instructions of a function
+            and return the instructions to write instead.
+            trampolines (bool): jump to the shared call, return and
+            comparison routines, rather than writing them out every time.
+            timings (dict): gets the seconds spent in every pass, if given.
+        """
+        super().__init__(output_stream, buffer_size, passes,
+                         timings=timings)
+        self.trampolines = trampolines
+        self.function = None
+        self.labels = 0
+        self.rom_size = 0
+
+    def emit(self, instruction: tuple) -> None:
+        """Holds an instruction until its function is complete.
+
+        Args:
+            instruction (tuple): the instruction.
+        """
+        if instruction[0] == "function":
+            self.end_function()
+        self.instructions.append(instruction)
+
+    def end_function(self) -> None:
+        """Runs the held instructions through the optimization passes and
+        writes their translation."""
+        instructions = self.instructions
+        self.instructions = []
+        for optimization in self.passes:
+            instructions = timed(self.timings, pass_name(optimization),
+                                 optimization, instructions)
+        lines = self.translate(instructions)
+        self.rom_size += sum(line[0] != "(" for line in lines)
+        self.write("\n".join(lines) + "\n" if lines else "")
+
+    def new_label(self, kind: str) -> str:
+        """
+        Args:
+            kind (str): what the label is for.
+
+        Returns:
+            str: a label which is used nowhere else in the program.
+        """
+        self.labels += 1
+        return "%s$%s.%d" % (self.function, kind, self.labels)
+
+    def address(self, segment: str, index: int) -> typing.Optional[str]:
+        """
+        Args:
+            segment (str): a segment with a fixed address.
+            index (int): an index in the segment.
+
+        Returns:
+            str: the symbol of the address, or None if the segment is
+            pointed to by a register.
+        """
+        if segment == "temp":
+            return "R%d" % (TEMP + index)
+        if segment == "pointer":
+            return "THAT" if index else "THIS"
+        if segment == "static":
+            return "%s.%d" % (self.function.split(".")[0], index)
+        if segment in POINTED:
+            return None
+        raise ValueError("invalid segment: " + segment)
+
+    def load(self, segment: str, index: int) -> typing.List[str]:
+        """
+        Args:
+            segment (str): a segment.
+            index (int): an index in the segment.
+
+        Returns:
+            list: the lines which set D to the value at the location.
+        """
+        if segment == "constant":
+            if index <= 1:
+                return ["D=%d" % index]
+            return ["@%d" % index, "D=A"]
+        address = self.address(segment, index)
+        if address is not None:
+            return ["@" + address, "D=M"]
+        if index <= 3:
+            return ["@" + POINTED[segment]] + self.walk(index) + ["D=M"]
+        return ["@%d" % index, "D=A", "@" + POINTED[segment], "A=D+M", "D=M"]
+
+    @staticmethod
+    def walk(index: int) -> typing.List[str]:
+        """
+        Args:
+            index (int): a small offset.
+
+        Returns:
+            list: the lines which follow the pointer in M, plus the offset.
+        """
+        if index == 0:
+            return ["A=M"]
+        return ["A=M+1"] + ["A=A+1"] * (index - 1)
+
+    def store(self, segment: str, index: int) -> typing.Tuple[
+            typing.List[str], typing.List[str]]:
+        """
+        Args:
+            segment (str): a segment.
+            index (int): an index in the segment.
+
+        Returns:
+            tuple: the lines to run before D is set, which may use D, and
+            the lines which store D at the location after it is set.
+        """
+        address = self.address(segment, index)
+        if address is not None:
+            return [], ["@" + address, "M=D"]
+        if index <= 6:
+            return [], ["@" + POINTED[segment]] + self.walk(index) + ["M=D"]
+        return (["@%d" % index, "D=A", "@" + POINTED[segment], "D=D+M",
+                 "@R13", "M=D"], ["@R13", "A=M", "M=D"])
+
+    def translate(self, instructions: typing.List[tuple]) -> typing.List[str]:
+        """
+        Args:
+            instructions (list): the instructions of a function.
+
+        Returns:
+            list: the lines of their translation.
+        """
+        lines = []
+        index = 0
+        count = len(instructions)
+        while index < count:
+            instruction = instructions[index]
+            following = instructions[index + 1] if index + 1 < count \
+                else ("",)
+            command = instruction[0]
+            index += 1
+            if command == "push":
+                segment, offset = instruction[1], instruction[2]
+                if following[0] == "pop":
+                    # push x; pop y
+                    before, after = self.store(*following[1:])
+                    lines += before + self.load(segment, offset) + after
+                    index += 1
+                elif following[0] in BINARY:
+                    # push x; add
+                    if segment == "constant" and offset == 1 and \
+                            following[0] in ("add", "sub"):
+                        lines += ["@SP", "A=M-1", "M=M%s1" % (
+                            "+" if following[0] == "add" else "-")]
+                    else:
+                        lines += self.load(segment, offset) + [
+                            "@SP", "A=M-1", BINARY[following[0]]]
+                    index += 1
+                elif following[0] == "if-goto":
+                    # push x; if-goto
+                    lines += self.load(segment, offset) + [
+                        "@%s$%s" % (self.function, following[1]), "D;JNE"]
+                    index += 1
+                elif segment == "constant" and offset <= 1:
+                    lines += ["@SP", "AM=M+1", "A=A-1", "M=%d" % offset]
+                else:
+                    lines += self.load(segment, offset) + PUSH_D
+            elif command == "pop":
+                before, after = self.store(instruction[1], instruction[2])
+                lines += before + POP_D + after
+            elif command in BINARY:
+                lines += POP_D + ["A=A-1", BINARY[command]]
+            elif command in UNARY:
+                lines += ["@SP", "A=M-1", UNARY[command]]
+            elif command in COMPARISONS:
+                negated = following == ("not",)
+                target = instructions[index + negated] \
+                    if index + negated < count else ("",)
+                if target[0] == "if-goto":
+                    # lt; [not;] if-goto
+                    if command == "eq":
+                        lines += POP_D + ["@SP", "AM=M-1", "D=M-D"]
+                    else:
+                        lines += ordered_difference(
+                            self.new_label("compared"))
+                    lines += ["@%s$%s" % (self.function, target[1]),
+                              "D;" + COMPARISONS[command][negated]]
+                    index += 1 + negated
+                elif self.trampolines:
+                    label = self.new_label("compared")
+                    lines += ["@" + label, "D=A", "@$" + command.upper(),
+                              "0;JMP", "(%s)" % label]
+                else:
+                    label = self.new_label("compared")
+                    lines += compare(command, label, label).split() + [
+                        "(%s)" % label]
+            elif command == "label":
+                lines.append("(%s$%s)" % (self.function, instruction[1]))
+            elif command == "goto":
+                lines += ["@%s$%s" % (self.function, instruction[1]),
+                          "0;JMP"]
+            elif command == "if-goto":
+                lines += POP_D + ["@%s$%s" % (self.function, instruction[1]),
+                                  "D;JNE"]
+            elif command == "call":
+                lines += call_sequence(instruction[1], instruction[2],
+                                       self.new_label("ret"),
+                                       self.trampolines)
+            elif command == "function":
+                self.function = instruction[1]
+                lines.append("(%s)" % self.function)
+                locals_count = instruction[2]
+                if locals_count <= 2:
+                    lines += ["@SP", "AM=M+1", "A=A-1", "M=0"] * locals_count
+                else:
+                    lines += ["@SP", "A=M"] + ["M=0", "A=A+1"] * locals_count
+                    lines += ["D=A", "@SP", "M=D"]
+            elif command == "return":
+                if self.trampolines:
+                    lines += ["@$RETURN", "0;JMP"]
+                else:
+                    lines += RETURN.split() + ["@R14", "A=M", "0;JMP"]
+            else:
+                raise ValueError("invalid command: " + command)
+        return lines
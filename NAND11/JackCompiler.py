@@ -6,47 +6,471 @@ as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
 Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
 """
 
+import argparse
+import concurrent.futures
+import contextlib
+import io
 import os
 import sys
 import typing
+import CallGraph
+from BuildCache import BuildCache, DEFAULT_CACHE_DIR, DEFAULT_MAX_AGE, \
+    DEFAULT_MAX_SIZE
 from CompilationEngine import CompilationEngine
-from JackTokenizer import JackTokenizer
+from HackWriter import HackWriter, link, rom_size
+from JackTokenizer import JackTokenizer, StreamingJackTokenizer
+import SourceMap
+import StringPool
 from SymbolTable import SymbolTable
+from VMInliner import THRESHOLD, inline
+from VMInterpreter import parse
 from VMWriter import VMWriter
 
 
 def compile_file(
-        input_file: typing.TextIO, output_file: typing.TextIO) -> None:
+        input_file: typing.TextIO, output_file: typing.TextIO,
+        streaming: bool = False,
+        options: typing.Optional[typing.Dict[str, typing.Any]] = None,
+        map_file: typing.Optional[typing.TextIO] = None,
+        pass_times: bool = False) -> None:
     """Compiles a single file.
 
     Args:
         input_file (typing.TextIO): the file to compile.
         output_file (typing.TextIO): writes all output to this file.
+        streaming (bool): lex the input lazily instead of reading it whole.
+        options (dict): keyword arguments for the CompilationEngine.
+        map_file (typing.TextIO): writes the source map to this file, when
+        the options ask for one.
+        pass_times (bool): print the time spent in every pass.
     """
-    tokenizer = JackTokenizer(input_file)
-    CompilationEngine(tokenizer, output_file)
+    if streaming:
+        tokenizer = StreamingJackTokenizer(input_file)
+    else:
+        tokenizer = JackTokenizer(input_file)
+    engine = CompilationEngine(tokenizer, output_file, **(options or {}))
+    if map_file is not None and engine.source_lines is not None:
+        map_file.write(SourceMap.encode(engine.source_lines))
+    for function, before, after in engine.frames:
+        print("%s: %d -> %d locals" % (function, before, after))
+    for function, line, expressions in engine.hoisted:
+        print("%s: loop at line %d hoisted %s" % (function, line,
+                                                  ", ".join(expressions)))
+    if pass_times:
+        name = os.path.basename(getattr(input_file, "name", ""))
+        for optimization, seconds in sorted(engine.timings.items()):
+            print("%s: %-24s %8.3f ms" % (name, optimization,
+                                          seconds * 1000))
+
+
+def output_path_of(
+        input_path: str,
+        options: typing.Optional[typing.Dict[str, typing.Any]] = None) -> str:
+    """
+    Args:
+        input_path (str): path of a .jack file.
+        options (dict): keyword arguments for the CompilationEngine.
+
+    Returns:
+        str: path of the .vm file it compiles to, or of the .asm file when
+        the target is "asm".
+    """
+    extension = "." + (options or {}).get("target", "vm")
+    return os.path.splitext(input_path)[0] + extension
+
+
+def compile_path(input_path: str, streaming: bool = False,
+                 options: typing.Optional[typing.Dict[str, typing.Any]] = None,
+                 pass_times: bool = False) -> str:
+    """Compiles a .jack file into a .vm file with the same name. This is the
+    unit of work handed to the worker processes, so it opens the files
+    itself.
+
+    Args:
+        input_path (str): path of the file to compile.
+        streaming (bool): lex the input lazily instead of reading it whole.
+        options (dict): keyword arguments for the CompilationEngine.
+        pass_times (bool): print the time spent in every pass.
+
+    Returns:
+        str: everything the compiler printed while compiling the file.
+    """
+    output_path = output_path_of(input_path, options)
+    with contextlib.ExitStack() as stack:
+        input_file = stack.enter_context(open(input_path, 'r'))
+        output_file = stack.enter_context(open(output_path, 'w'))
+        map_file = None
+        if (options or {}).get("source_map"):
+            map_file = stack.enter_context(
+                open(output_path + SourceMap.EXTENSION, 'w'))
+        log = stack.enter_context(
+            contextlib.redirect_stdout(io.StringIO()))
+        compile_file(input_file, output_file, streaming, options, map_file,
+                     pass_times)
+    return log.getvalue()
+
+
+def compile_paths(input_paths: typing.List[str], jobs: int = 1,
+                  streaming: bool = False,
+                  options: typing.Optional[typing.Dict[str, typing.Any]] = None,
+                  pass_times: bool = False) -> typing.List[str]:
+    """Compiles every given file, possibly in parallel. Whatever the number
+    of jobs, the printed output and the errors are reported file by file, in
+    the order of the given paths.
+
+    Args:
+        input_paths (list): paths of the files to compile.
+        jobs (int): how many worker processes to use, 1 compiles in-process.
+        streaming (bool): lex the input lazily instead of reading it whole.
+        options (dict): keyword arguments for the CompilationEngine.
+        pass_times (bool): print the time spent in every pass.
+
+    Returns:
+        list: the paths of the files which failed to compile.
+    """
+    if jobs > 1:
+        executor = concurrent.futures.ProcessPoolExecutor(jobs)
+        results = [executor.submit(compile_path, input_path, streaming,
+                                   options, pass_times)
+                   for input_path in input_paths]
+    else:
+        executor = None
+        results = input_paths
+    failed = []
+    for input_path, result in zip(input_paths, results):
+        try:
+            if executor is None:
+                log = compile_path(input_path, streaming, options,
+                                   pass_times)
+            else:
+                log = result.result()
+        except Exception as error:
+            print(input_path + ": " + str(error).strip(), file=sys.stderr)
+            failed.append(input_path)
+            continue
+        sys.stdout.write(log)
+    if executor is not None:
+        executor.shutdown()
+    return failed
+
+
+def compile_project(input_paths: typing.List[str], jobs: int = 1,
+                    streaming: bool = False,
+                    options: typing.Optional[typing.Dict[str, typing.Any]] = None,
+                    cache: typing.Optional[BuildCache] = None,
+                    pass_times: bool = False) -> bool:
+    """Compiles every given file, reusing the cached output of the classes
+    whose source did not change since they were last compiled.
+
+    Args:
+        input_paths (list): paths of the files to compile.
+        jobs (int): how many worker processes to use, 1 compiles in-process.
+        streaming (bool): lex the input lazily instead of reading it whole.
+        options (dict): keyword arguments for the CompilationEngine.
+        cache (BuildCache): the cache to use, or None to compile everything.
+        pass_times (bool): print the time spent in every pass of the files
+        which are compiled.
+
+    Returns:
+        bool: True if every file compiled, False otherwise.
+    """
+    if cache is not None:
+        input_paths = [
+            input_path for input_path in input_paths
+            if not cache.restore(input_path,
+                                 output_path_of(input_path, options))]
+    failed = compile_paths(input_paths, jobs, streaming, options,
+                           pass_times)
+    if cache is not None:
+        for input_path in input_paths:
+            if input_path not in failed:
+                cache.store(input_path, output_path_of(input_path, options))
+    return not failed
+
+
+def write_string_pool(
+        input_paths: typing.List[str], pool_path: str,
+        options: typing.Optional[typing.Dict[str, typing.Any]] = None
+        ) -> int:
+    """Writes the string pool class of a program, with a function for every
+    string constant of its classes.
+
+    Args:
+        input_paths (list): paths of the .jack files of the program.
+        pool_path (str): path of the file to write.
+        options (dict): keyword arguments for the CompilationEngine.
+
+    Returns:
+        int: the number of distinct string constants.
+    """
+    sources = []
+    for input_path in input_paths:
+        with open(input_path, 'r') as input_file:
+            sources.append(input_file.read())
+    texts = StringPool.collect(sources)
+    with open(pool_path, 'w') as pool_file:
+        if (options or {}).get("target") == "asm":
+            writer = HackWriter(pool_file)
+        else:
+            writer = VMWriter(pool_file)
+        StringPool.write_pool(texts, writer)
+    return len(texts)
+
+
+def inline_program(input_paths: typing.List[str], threshold: int = THRESHOLD,
+                   report: bool = False) -> None:
+    """Inlines the small leaf functions of a compiled program into their
+    callers, rewriting its .vm files.
+
+    Args:
+        input_paths (list): paths of the compiled .jack files.
+        threshold (int): the largest number of instructions of an inlined
+        function.
+        report (bool): print every inlined function and how many of its
+        calls were inlined.
+    """
+    output_paths = [output_path_of(input_path) for input_path in input_paths]
+    classes = []
+    for output_path in output_paths:
+        with open(output_path, 'r') as class_file:
+            classes.append(class_file.read())
+    outputs, inlined = inline(classes, threshold)
+    for output_path, before, after in zip(output_paths, classes, outputs):
+        if after != before:
+            with open(output_path, 'w') as class_file:
+                class_file.write(after)
+    if report:
+        for function, calls in sorted(inlined.items()):
+            print("%-32s %4d calls inlined" % (function, calls),
+                  file=sys.stderr)
+    print("inlined %d calls to %d functions of at most %d instructions"
+          % (sum(inlined.values()), len(inlined), threshold), file=sys.stderr)
+
+
+def translate_program(input_paths: typing.List[str]) -> None:
+    """Translates the .vm files of a compiled program into .asm files.
+
+    Args:
+        input_paths (list): paths of the compiled .jack files.
+    """
+    options = {"target": "asm"}
+    for input_path in input_paths:
+        with open(output_path_of(input_path), 'r') as class_file:
+            instructions = parse(class_file.read())
+        with open(output_path_of(input_path, options), 'w') as asm_file:
+            writer = HackWriter(asm_file)
+            for instruction in instructions:
+                writer.emit(instruction)
+            writer.flush()
+
+
+def prune_program(
+        input_paths: typing.List[str],
+        options: typing.Optional[typing.Dict[str, typing.Any]] = None
+        ) -> None:
+    """Drops the functions which can't be reached from Main.main or Sys.init
+    from the compiled classes of a program, and reports the size of every
+    class before and after.
+
+    Args:
+        input_paths (list): paths of the compiled .jack files.
+        options (dict): keyword arguments for the CompilationEngine.
+    """
+    target = (options or {}).get("target", "vm")
+    size = rom_size if target == "asm" else count_commands
+    output_paths = [output_path_of(input_path, options)
+                    for input_path in input_paths]
+    classes = []
+    for output_path in output_paths:
+        with open(output_path, 'r') as class_file:
+            classes.append(class_file.read())
+    pruned = CallGraph.prune(classes, target)
+    unit = "words" if target == "asm" else "commands"
+    for output_path, before, after in zip(output_paths, classes, pruned):
+        if after != before:
+            with open(output_path, 'w') as class_file:
+                class_file.write(after)
+        print("%-24s %6d -> %6d %s" % (os.path.basename(output_path),
+                                       size(before), size(after), unit),
+              file=sys.stderr)
+    print("%-24s %6d -> %6d %s" % (
+        "total", sum(map(size, classes)), sum(map(size, pruned)), unit),
+        file=sys.stderr)
+
+
+def count_commands(text: str) -> int:
+    """
+    Args:
+        text (str): VM code.
+
+    Returns:
+        int: the number of commands in it.
+    """
+    return sum(1 for line in text.splitlines()
+               if line.split("//", 1)[0].strip())
+
+
+def link_program(input_paths: typing.List[str], program_path: str) -> None:
+    """Writes the Hack assembly of the given classes into a single program,
+    after the bootstrap code and the shared routines, and reports the ROM
+    size of every class.
+
+    Args:
+        input_paths (list): paths of the compiled .jack files.
+        program_path (str): path of the program to write.
+    """
+    options = {"target": "asm"}
+    classes = []
+    for input_path in input_paths:
+        with open(output_path_of(input_path, options), 'r') as class_file:
+            classes.append(class_file.read())
+    program = link(classes)
+    with open(program_path, 'w') as program_file:
+        program_file.write(program)
+    for input_path, text in zip(input_paths, classes):
+        print("%-24s %6d words" % (os.path.basename(
+            output_path_of(input_path, options)), rom_size(text)),
+            file=sys.stderr)
+    print("%-24s %6d words" % (os.path.basename(program_path),
+                               rom_size(program)), file=sys.stderr)
 
 
 if "__main__" == __name__:
-    # Parses the input path and calls compile_file on each input file.
-    # This opens both the input and the output files!
-    # Both are closed automatically when the code finishes running.
-    # If the output file does not exist, it is created automatically in the
-    # correct path, using the correct filename.
-    if not len(sys.argv) == 2:
-        sys.exit("Invalid usage, please use: JackCompiler <input path>")
-    argument_path = os.path.abspath(sys.argv[1])
+    # Parses the input path and compiles each input file. The output file of
+    # every class is created next to it, using the correct filename.
+    parser = argparse.ArgumentParser(prog="JackCompiler")
+    parser.add_argument("input_path")
+    parser.add_argument("--stream", action="store_true",
+                        help="lex the input files lazily, in chunks")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="compile the files in N worker processes")
+    parser.add_argument("-O", "--optimize", action="store_true",
+                        help="fold constants, address array entries "
+                             "directly, drop unreachable blocks and needless "
+                             "jumps and run the peephole optimizer over the "
+                             "VM code")
+    parser.add_argument("--asm", action="store_true",
+                        help="translate every class into Hack assembly and "
+                             "link them into a program")
+    parser.add_argument("--asm-program", metavar="PROGRAM",
+                        help="the program --asm links, as in "
+                             "--asm-program=Pong.asm (default: the input "
+                             "directory's name, with .asm)")
+    parser.add_argument("--source-map", action="store_true",
+                        help="write the Jack line of every VM command into "
+                             "a .vm.map file next to the .vm file")
+    parser.add_argument("--string-pool", action="store_true",
+                        help="build every distinct string constant once, in "
+                             "a %s class written next to the classes"
+                             % StringPool.CLASS_NAME)
+    parser.add_argument("--bottom-loops", action="store_true",
+                        help="test the condition of every while loop after "
+                             "its body, with a single branch per iteration")
+    parser.add_argument("--no-control-flow", action="store_true",
+                        help="write the VM code as it is compiled, without "
+                             "passing every function through its control "
+                             "flow graph")
+    parser.add_argument("--pass-times", action="store_true",
+                        help="print the time spent in every pass, for every "
+                             "compiled file")
+    parser.add_argument("--hoist", action="store_true",
+                        help="compute the expressions which don't change "
+                             "within a while loop once before it, and list "
+                             "them for every loop")
+    parser.add_argument("--reuse-locals", action="store_true",
+                        help="share the slots of locals which are never "
+                             "live at the same time, and list the frames "
+                             "which shrank")
+    parser.add_argument("--inline", action="store_true",
+                        help="inline the functions which call nothing and "
+                             "have at most --inline-threshold instructions "
+                             "into their callers")
+    parser.add_argument("--inline-threshold", type=int, default=THRESHOLD,
+                        metavar="N",
+                        help="the largest function --inline inlines, as in "
+                             "--inline-threshold=12 (default: %(default)s)")
+    parser.add_argument("--inline-report", action="store_true",
+                        help="list the inlined functions")
+    parser.add_argument("--prune", action="store_true",
+                        help="drop the subroutines which can't be reached "
+                             "from Main.main or Sys.init")
+    parser.add_argument("--cache", action="store_true",
+                        help="reuse the output of unchanged classes, cached "
+                             "in --cache-dir")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR,
+                        metavar="DIR",
+                        help="the directory of the --cache, as in "
+                             "--cache-dir=build (default: %(default)s)")
+    parser.add_argument("--cache-max-size", type=float,
+                        default=DEFAULT_MAX_SIZE / 2 ** 20, metavar="MB",
+                        help="evict the oldest entries above this size")
+    parser.add_argument("--cache-max-age", type=float,
+                        default=DEFAULT_MAX_AGE / (24 * 60 * 60),
+                        metavar="DAYS",
+                        help="evict the entries unused for this long")
+    args = parser.parse_args()
+    if args.source_map and (args.cache or args.asm or args.prune or
+                            args.inline):
+        parser.error("--source-map can't be used with --cache, --asm, "
+                     "--inline or --prune")
+    argument_path = os.path.abspath(args.input_path)
     if os.path.isdir(argument_path):
         files_to_assemble = [
             os.path.join(argument_path, filename)
-            for filename in os.listdir(argument_path)]
+            for filename in sorted(os.listdir(argument_path))]
     else:
         files_to_assemble = [argument_path]
-    for input_path in files_to_assemble:
-        filename, extension = os.path.splitext(input_path)
-        if extension.lower() != ".jack":
-            continue
-        output_path = filename + ".vm"
-        with open(input_path, 'r') as input_file, \
-                open(output_path, 'w') as output_file:
-            compile_file(input_file, output_file)
+    files_to_assemble = [
+        input_path for input_path in files_to_assemble
+        if os.path.splitext(input_path)[1].lower() == ".jack"]
+    program_directory = argument_path if os.path.isdir(argument_path) \
+        else os.path.dirname(argument_path)
+    pool_source = os.path.join(program_directory,
+                               StringPool.CLASS_NAME + ".jack")
+    if args.string_pool and pool_source in files_to_assemble:
+        parser.error("--string-pool can't be used in a program with a %s "
+                     "class" % StringPool.CLASS_NAME)
+    options = {"optimize": args.optimize}
+    if args.asm and not args.inline:
+        # inlining works on VM code, which is translated afterwards
+        options["target"] = "asm"
+    if args.source_map:
+        options["source_map"] = True
+    if args.string_pool:
+        options["string_pool"] = True
+    if args.reuse_locals:
+        options["reuse_locals"] = True
+    if args.bottom_loops:
+        options["bottom_loops"] = True
+    if args.hoist:
+        options["hoist_invariants"] = True
+    if args.no_control_flow:
+        options["control_flow"] = False
+    cache = None
+    if args.cache:
+        cache = BuildCache(args.cache_dir, repr(sorted(options.items())))
+    success = compile_project(files_to_assemble, args.jobs, args.stream,
+                              options, cache, args.pass_times)
+    if cache is not None:
+        cache.evict(int(args.cache_max_size * 2 ** 20),
+                    args.cache_max_age * 24 * 60 * 60)
+        print(cache, file=sys.stderr)
+    if not success:
+        sys.exit(1)
+    if args.string_pool:
+        count = write_string_pool(files_to_assemble,
+                                  output_path_of(pool_source, options),
+                                  options)
+        print("%s: %d string constants" % (StringPool.CLASS_NAME, count),
+              file=sys.stderr)
+        files_to_assemble.append(pool_source)
+    if args.inline:
+        inline_program(files_to_assemble, args.inline_threshold,
+                       args.inline_report)
+    if args.prune:
+        prune_program(files_to_assemble, options)
+    if args.asm and args.inline:
+        translate_program(files_to_assemble)
+    if args.asm:
+        link_program(files_to_assemble,
+                     args.asm_program or program_directory + ".asm")
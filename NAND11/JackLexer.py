@@ -0,0 +1,318 @@
+"""
+This file is part of nand2tetris, as taught in The Hebrew University, and
+was written by Aviv Yaish. It is an extension to the specifications given
+[here](https://www.nand2tetris.org) (Shimon Schocken and Noam Nisan, 2017),
+as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
+"""
+import bisect
+import re
+import sys
+import typing
+from array import array
+
+KEYORDS = ['class', 'constructor', 'function', 'method', 'field',
+           'static', 'var', 'int', 'char', 'boolean', 'void', 'true',
+           'false', 'null', 'this', 'let', 'do', 'if', 'else',
+           'while', 'return']
+SYMBOLS = ['{', '}', '(', ')', '[', ']', '.', ',', ';', '+',
+           '-', '*', '/', '&', ',', '<', '>', '=', '~', '^', '#', '|']
+INTEGERS = ['0', '1', '2', '3', '4', '5', '6', '7', '8', '9']
+
+# Token kinds, computed once at lex time. TOKEN_TYPES maps a kind back to
+# the name returned by JackTokenizer.token_type().
+KEYWORD, SYMBOL, INT_CONST, STRING_CONST, IDENTIFIER = range(5)
+TOKEN_TYPES = ("KEYWORD", "SYMBOL", "INT_CONST", "STRING_CONST", "IDENTIFIER")
+
+# Interned text and kind of every reserved token.
+_RESERVED = {}
+for _text in KEYORDS:
+    _RESERVED[_text] = (sys.intern(_text), KEYWORD)
+for _text in SYMBOLS:
+    _RESERVED[_text] = (sys.intern(_text), SYMBOL)
+del _text
+_DIGITS = frozenset(INTEGERS)
+
+# Characters that end a word: whitespace, any symbol and the string quote.
+_BREAK = r'\s{}()\[\].,;+\-*/&|<>=~^#"'
+
+# Whitespace and comments, and a single token (captured as group 1).
+_SKIP = r'(?:\s+|//[^\n]*|/\*.*?(?:\*/|\Z))*'
+_TOKEN = (r'("[^"\n]*"?'
+          r'|\d+'
+          r'|[{}()\[\].,;+\-*/&|<>=~^#]'
+          r'|[^' + _BREAK + r'\d][^' + _BREAK + r']*)')
+
+# The master pattern. Every match is one token together with the whitespace
+# and comments in front of it, so the whole source is lexed in one pass and
+# the token itself is always group 1. Only the trailing comments at the end
+# of the source match without a token.
+TOKEN_PATTERN = re.compile(_SKIP + _TOKEN + '?', re.DOTALL)
+
+# The streaming lexer matches the two parts separately, so it can tell when a
+# comment or a token may continue into the next chunk. Its skip pattern never
+# runs a block comment to the end of the buffer.
+SKIP_PATTERN = re.compile(_SKIP.replace(r'(?:\*/|\Z)', r'\*/'), re.DOTALL)
+SINGLE_TOKEN_PATTERN = re.compile(_TOKEN)
+
+LINE_BREAK_PATTERN = re.compile(r'\n')
+
+# How many characters the streaming lexer reads at a time.
+CHUNK_SIZE = 1 << 16
+
+
+class Tokens:
+    """The tokens of a Jack file, stored as parallel arrays: the interned
+    text, the kind and the offset in the source of every token. The line
+    and column of a token are found from its offset when they are asked
+    for, so lexing doesn't pay for them.
+    """
+    __slots__ = ("texts", "kinds", "offsets", "line_starts")
+
+    def __init__(self) -> None:
+        """Creates an empty token stream."""
+        self.texts = []
+        self.kinds = bytearray()
+        self.offsets = array('l')
+        self.line_starts = None
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    def append(self, text: str, kind: int, offset: int) -> None:
+        """Adds a token to the end of the stream.
+
+        Args:
+            text (str): the text of the token.
+            kind (int): the kind of the token.
+            offset (int): where the token starts in the source, or -1.
+        """
+        self.texts.append(text)
+        self.kinds.append(kind)
+        self.offsets.append(offset)
+
+    def position(self, index: int, source: str) -> typing.Tuple[int, int]:
+        """
+        Args:
+            index (int): the index of a token.
+            source (str): the text the tokens were read from.
+
+        Returns:
+            tuple: the line and column of the token, starting at 1, or zeros
+            if its offset is unknown.
+        """
+        if self.line_starts is None:
+            self.line_starts = [0]
+            self.line_starts.extend(
+                match.end() for match in LINE_BREAK_PATTERN.finditer(source))
+        offset = self.offsets[index]
+        if offset < 0:
+            return 0, 0
+        line = bisect.bisect_right(self.line_starts, offset)
+        return line, offset - self.line_starts[line - 1] + 1
+
+
+def classify(text: str) -> typing.Tuple[str, int]:
+    """Classifies the text of a single token.
+
+    Args:
+        text (str): the text of the token.
+
+    Returns:
+        tuple: the interned text and the kind of the token.
+    """
+    reserved = _RESERVED.get(text)
+    if reserved is not None:
+        return reserved
+    if text[0] == '"':
+        return text, STRING_CONST
+    if text[0] in _DIGITS:
+        return text, INT_CONST
+    return sys.intern(text), IDENTIFIER
+
+
+def tokenize(source: str) -> Tokens:
+    """Breaks a Jack source into its tokens in a single pass.
+
+    Args:
+        source (str): the full text of a Jack file.
+
+    Returns:
+        Tokens: the tokens, in order. String constants keep their quotes.
+    """
+    tokens = Tokens()
+    texts = tokens.texts
+    kinds = tokens.kinds
+    offsets = tokens.offsets
+    reserved = _RESERVED
+    digits = _DIGITS
+    intern = sys.intern
+    for match in TOKEN_PATTERN.finditer(source):
+        text = match.group(1)
+        if text is None:
+            continue
+        known = reserved.get(text)
+        if known is not None:
+            text, kind = known
+        elif text[0] == '"':
+            kind = STRING_CONST
+        elif text[0] in digits:
+            kind = INT_CONST
+        else:
+            text = intern(text)
+            kind = IDENTIFIER
+        texts.append(text)
+        kinds.append(kind)
+        offsets.append(match.start(1))
+    return tokens
+
+
+def iter_tokens(input_stream: typing.TextIO,
+                chunk_size: int = CHUNK_SIZE) -> typing.Iterator[
+                    typing.Tuple[str, int, int]]:
+    """Lazily breaks a Jack source into its tokens. The input is read in
+    chunks, and only the unfinished tail of the last chunk is kept between
+    reads, so memory does not grow with the size of the source.
+
+    Args:
+        input_stream (typing.TextIO): input stream.
+        chunk_size (int): how many characters to read at a time.
+
+    Yields:
+        tuple: the interned text, the kind, the offset, the line and the
+        column of every token.
+    """
+    buffer = ""
+    base = 0
+    eof = False
+    line = 1
+    line_start = 0
+    # where the buffer was scanned for line breaks up to
+    scanned = 0
+    while not eof:
+        chunk = input_stream.read(chunk_size)
+        eof = not chunk
+        buffer += chunk
+        end = len(buffer)
+        pos = 0
+        while True:
+            start = pos
+            pos = SKIP_PATTERN.match(buffer, pos).end()
+            if pos == end or buffer.startswith("/*", pos):
+                # the rest is whitespace or an unfinished comment
+                pos = end if eof else start
+                break
+            match = SINGLE_TOKEN_PATTERN.match(buffer, pos)
+            if match.end() == end and not eof:
+                # the token may go on in the next chunk
+                pos = start
+                break
+            text, kind = classify(match.group(1))
+            newlines = buffer.count("\n", scanned, pos)
+            if newlines:
+                line += newlines
+                line_start = base + buffer.rfind("\n", scanned, pos) + 1
+            scanned = pos
+            yield text, kind, base + pos, line, base + pos - line_start + 1
+            pos = match.end()
+        base += pos
+        buffer = buffer[pos:]
+        # the buffer is only cut after a token, which has no line breaks
+        scanned = 0
+
+
+def tokenize_legacy(source: str) -> Tokens:
+    """The original two phase tokenizer: strips the comments line by line and
+    then splits the remaining characters into tokens. Kept as a reference
+    backend for the benchmarks.
+
+    Args:
+        source (str): the full text of a Jack file.
+
+    Returns:
+        Tokens: the tokens, in order, without source offsets.
+    """
+    input_lines = source.splitlines()
+    in_comment = False
+    in_string = False
+    # rids all of the commented lines
+    for i in range(len(input_lines)):
+        cur_line = input_lines[i]
+        input_lines[i] = ""
+        for j in range(len(cur_line)):
+            if cur_line[j] == "\"":
+                in_string = not in_string
+            if not in_string and not in_comment and cur_line[j] == '/' and cur_line[j+1] == "/":
+                break
+            if not in_string and not in_comment and cur_line[j] == "/" and cur_line[j+1] == "*":
+                in_comment = True
+            if not in_comment:
+                input_lines[i] += cur_line[j]
+            if not in_string and cur_line[j] == "/" and j-1 >= 0 and cur_line[j-1] == "*":
+                in_comment = False
+
+    clean = []
+    word = ""
+    number = ""
+    string_var = False
+
+    for phrase in input_lines:
+
+        for letter in phrase:
+
+            if letter == "\"":
+                if not string_var:
+                    string_var = True
+                    word += letter
+                    continue
+                else:
+                    string_var = False
+                    word += letter
+                    clean.append(word)
+                    word = ""
+                    continue
+
+            elif string_var:
+                word += letter
+                continue
+
+            if word != "":
+                if letter == " " or letter == "\t":
+                    clean.append(word)
+                    word = ""
+
+            elif number != "":
+                if letter == " " or letter == "\t":
+                    clean.append(number)
+                    number = ""
+
+            if letter in SYMBOLS:
+
+                if word != "":
+                    clean.append(word)
+                    word = ""
+                if number != "":
+                    clean.append(number)
+                    number = ""
+                clean.append(letter)
+
+            elif letter in INTEGERS:
+                if word == "":
+                    number += letter
+                else:
+                    word += letter
+
+            elif letter != " " and letter != "\t":
+                word += letter
+                if number != "":
+                    clean.append(number)
+                    number = ""
+
+    tokens = Tokens()
+    for text in clean:
+        text, kind = classify(text)
+        tokens.append(text, kind, -1)
+    return tokens
+
+
+BACKENDS = {"regex": tokenize, "legacy": tokenize_legacy}
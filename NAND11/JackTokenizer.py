@@ -6,15 +6,7 @@ as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
 Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
 """
 import typing
-
-ABC = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz_?:"
-KEYORDS = ['class', 'constructor', 'function', 'method', 'field',
-           'static', 'var', 'int', 'char', 'boolean', 'void', 'true',
-           'false', 'null', 'this', 'let', 'do', 'if', 'else',
-           'while', 'return']
-SYMBOLS = ['{', '}', '(', ')', '[', ']', '.', ',', ';', '+',
-           '-', '*', '/', '&', ',', '<', '>', '=', '~', '^', '#', '|']
-INTEGERS = ['0', '1', '2', '3', '4', '5', '6', '7', '8', '9']
+from JackLexer import BACKENDS, CHUNK_SIZE, TOKEN_TYPES, iter_tokens
 
 
 class JackTokenizer:
@@ -101,106 +93,22 @@ class JackTokenizer:
     Note that ^, # correspond to shiftleft and shiftright, respectively.
     """
 
-    def __init__(self, input_stream: typing.TextIO) -> None:
+    def __init__(self, input_stream: typing.TextIO,
+                 backend: str = "regex") -> None:
         """Opens the input stream and gets ready to tokenize it.
 
         Args:
             input_stream (typing.TextIO): input stream.
+            backend (str): the lexer to use, can be "regex" (a single pass
+            over the source) or "legacy" (the original two phase tokenizer).
         """
-        # Your code goes here!
-        # A good place to start is to read all the lines of the input:
-        self.input_lines = input_stream.read().splitlines()
-        in_comment = False
-        in_string = False
-        # rids all of the commented lines
-        for i in range(len(self.input_lines)):
-            cur_line = self.input_lines[i]
-            self.input_lines[i] = ""
-            for j in range(len(cur_line)):
-                if cur_line[j] == "\"":
-                    in_string = not in_string
-                if not in_string and not in_comment and cur_line[j] == '/' and cur_line[j+1] == "/":
-                    break
-                if not in_string and not in_comment and cur_line[j] == "/" and cur_line[j+1] == "*":
-                    in_comment = True
-                if not in_comment:
-                    self.input_lines[i] += cur_line[j]
-                if not in_string and cur_line[j] == "/" and j-1 >= 0 and cur_line[j-1] == "*":
-                    in_comment = False
-
-        self.input_tokens = []
-        for line in self.input_lines:
-            if len(line) == 0:
-                continue
-            self.input_tokens += line.split()
-
-        self.clean_token = self.clean_token_list()
+        self.source = input_stream.read()
+        self.tokens = BACKENDS[backend](self.source)
+        self.clean_token = self.tokens.texts
+        self.token_kinds = self.tokens.kinds
         self.cur_index = 0
         self.cur_token = self.clean_token[0]
-
-    def clean_token_list(self):
-        raw = self.input_lines
-        clean = []
-        word = ""
-        number = ""
-        string_var = False
-
-        for phrase in raw:
-
-            for letter in phrase:
-
-                if letter == "\"":
-                    if not string_var:
-                        string_var = True
-                        word += letter
-                        continue
-                    else:
-                        string_var = False
-                        word += letter
-                        clean.append(word)
-                        word = ""
-                        continue
-
-                elif string_var:
-                    word += letter
-                    continue
-
-
-                if word != "":
-                    if letter == " " or letter == "\t":
-                        clean.append(word)
-                        word = ""
-
-
-                elif number != "":
-                    if letter == " " or letter == "\t":
-                        clean.append(number)
-                        number = ""
-
-                if letter in SYMBOLS:
-
-                    if word != "":
-                        clean.append(word)
-                        word = ""
-                    if number != "":
-                        clean.append(number)
-                        number = ""
-                    clean.append(letter)
-
-                elif letter in INTEGERS:
-                    if word == "":
-                        number += letter
-                    else:
-                        word += letter
-
-
-                elif letter != " " and letter != "\t":
-                    word += letter
-                    if number != "":
-                        clean.append(number)
-                        number = ""
-
-        return clean
+        self.cur_kind = self.token_kinds[0]
 
 
     def has_more_tokens(self) -> bool:
@@ -219,24 +127,24 @@ class JackTokenizer:
         if self.has_more_tokens():
             self.cur_index += 1
             self.cur_token = self.clean_token[self.cur_index]
+            self.cur_kind = self.token_kinds[self.cur_index]
 
 
+    def position(self) -> typing.Tuple[int, int]:
+        """
+        Returns:
+            tuple: the line and column of the current token, starting at 1,
+            or zeros if the lexer doesn't record where tokens are.
+        """
+        return self.tokens.position(self.cur_index, self.source)
+
     def token_type(self) -> str:
         """
         Returns:
             str: the type of the current token, can be
             "KEYWORD", "SYMBOL", "IDENTIFIER", "INT_CONST", "STRING_CONST"
         """
-        if self.cur_token in KEYORDS:
-            return "KEYWORD"
-        elif self.cur_token in SYMBOLS:
-            return "SYMBOL"
-        elif self.cur_token[0] in INTEGERS:
-            return "INT_CONST"
-        elif self.cur_token[0] in ['\"', '\'']:
-            return "STRING_CONST"
-        else:
-            return "IDENTIFIER"
+        return TOKEN_TYPES[self.cur_kind]
 
 
     def keyword(self) -> str:
@@ -305,3 +213,50 @@ class JackTokenizer:
                       double quote or newline '"'
         """
         return self.cur_token[1:-1]
+
+
+class StreamingJackTokenizer(JackTokenizer):
+    """A JackTokenizer which lexes its input lazily. The input stream is read
+    in chunks as the tokens are consumed, and only the current token and the
+    one after it are kept, so compilation starts before the whole file has
+    been read and memory stays bounded.
+    """
+
+    def __init__(self, input_stream: typing.TextIO,
+                 chunk_size: int = CHUNK_SIZE) -> None:
+        """Opens the input stream and reads the first token.
+
+        Args:
+            input_stream (typing.TextIO): input stream.
+            chunk_size (int): how many characters to read at a time.
+        """
+        self.token_stream = iter_tokens(input_stream, chunk_size)
+        self.cur_index = 0
+        self.current = next(self.token_stream)
+        self.cur_token, self.cur_kind = self.current[:2]
+        self.next_token = next(self.token_stream, None)
+
+    def has_more_tokens(self) -> bool:
+        """Do we have more tokens in the input?
+
+        Returns:
+            bool: True if there are more tokens, False otherwise.
+        """
+        return self.next_token is not None
+
+    def advance(self) -> None:
+        """Gets the next token from the input and makes it the current token.
+        This method should be called if has_more_tokens() is true.
+        """
+        if self.next_token is not None:
+            self.cur_index += 1
+            self.current = self.next_token
+            self.cur_token, self.cur_kind = self.current[:2]
+            self.next_token = next(self.token_stream, None)
+
+    def position(self) -> typing.Tuple[int, int]:
+        """
+        Returns:
+            tuple: the line and column of the current token, starting at 1.
+        """
+        return self.current[3], self.current[4]
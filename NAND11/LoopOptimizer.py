@@ -0,0 +1,338 @@
+"""
+This file is part of nand2tetris, as taught in The Hebrew University, and
+was written by Aviv Yaish. It is an extension to the specifications given
+[here](https://www.nand2tetris.org) (Shimon Schocken and Noam Nisan, 2017),
+as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
+
+Loop-invariant code motion for while loops. In hoisting mode the
+CompilationEngine parses a while statement into the statement tree below,
+whose expressions are the trees of ExpressionTree, instead of writing its
+code at once. The expressions which give the same value on every iteration
+are then computed once before the loop, into new locals of the subroutine,
+and read from them within the loop.
+
+Only expressions without side effects are moved, and they are moved out of
+conditionals too, so they may be computed when the loop would not have
+computed them. Reading any address is harmless on the Hack platform, but a
+division by zero is not, so divisions stay where they are. Locals and
+arguments are only changed by let statements of the subroutine itself, but
+fields, statics and array entries may also be changed by a subroutine call
+or through an array, so a loop which calls anything or stores into an
+array keeps all of its memory reads.
+"""
+import typing
+from ExpressionTree import (Node, Constant, String, Variable, ArrayRead,
+                            Call, Unary, Binary)
+
+
+class Statement:
+    """A statement of a loop. expressions and blocks are the names of the
+    attributes which hold its expressions and its lists of statements."""
+    __slots__ = ("line",)
+    expressions = ()
+    blocks = ()
+
+
+class Let(Statement):
+    """A let statement: into a variable, or into an array entry if it has
+    an offset."""
+    __slots__ = ("segment", "index", "offset", "value")
+    expressions = ("offset", "value")
+
+    def __init__(self, line: int, segment: str, index: int,
+                 offset: typing.Optional[Node], value: Node) -> None:
+        self.line = line
+        self.segment = segment
+        self.index = index
+        self.offset = offset
+        self.value = value
+
+
+class Do(Statement):
+    """A do statement."""
+    __slots__ = ("call",)
+    expressions = ("call",)
+
+    def __init__(self, line: int, call: Call) -> None:
+        self.line = line
+        self.call = call
+
+
+class Return(Statement):
+    """A return statement, with the value it returns."""
+    __slots__ = ("value",)
+    expressions = ("value",)
+
+    def __init__(self, line: int, value: Node) -> None:
+        self.line = line
+        self.value = value
+
+
+class If(Statement):
+    """An if statement, with the labels of its else part and of its end.
+    otherwise is None when there is no else part."""
+    __slots__ = ("else_label", "end_label", "condition", "then",
+                 "otherwise")
+    expressions = ("condition",)
+    blocks = ("then", "otherwise")
+
+    def __init__(self, line: int, else_label: str, end_label: str,
+                 condition: Node, then: typing.List[Statement],
+                 otherwise: typing.Optional[typing.List[Statement]]) -> None:
+        self.line = line
+        self.else_label = else_label
+        self.end_label = end_label
+        self.condition = condition
+        self.then = then
+        self.otherwise = otherwise
+
+
+class While(Statement):
+    """A while statement, with the labels of its top and of its end."""
+    __slots__ = ("top_label", "end_label", "condition", "body")
+    expressions = ("condition",)
+    blocks = ("body",)
+
+    def __init__(self, line: int, top_label: str, end_label: str,
+                 condition: Node, body: typing.List[Statement]) -> None:
+        self.line = line
+        self.top_label = top_label
+        self.end_label = end_label
+        self.condition = condition
+        self.body = body
+
+
+# The attributes which hold the operands of every kind of expression node,
+# other than calls.
+OPERANDS = {ArrayRead: ("base", "index"), Unary: ("operand",),
+            Binary: ("left", "right")}
+
+# The binary operators which can be computed ahead of time.
+PURE_OPERATORS = {"+", "-", "*", "&", "|", "<", ">", "="}
+
+# The segments which only the subroutine itself can change.
+PRIVATE_SEGMENTS = {"LOCAL", "ARG", "POINTER"}
+
+
+def children(node: Node) -> typing.List[Node]:
+    """
+    Args:
+        node (Node): an expression node.
+
+    Returns:
+        list: the operands of the node, in order.
+    """
+    if isinstance(node, Call):
+        receiver = [] if node.receiver is None else [node.receiver]
+        return receiver + node.arguments
+    return [getattr(node, name) for name in OPERANDS.get(type(node), ())]
+
+
+def postorder(root: Node) -> typing.List[Node]:
+    """
+    Args:
+        root (Node): an expression.
+
+    Returns:
+        list: the nodes of the expression, every node after its operands.
+    """
+    order = []
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        order.append(node)
+        stack.extend(children(node))
+    order.reverse()
+    return order
+
+
+def walk(statements: typing.List[Statement]) -> typing.List[Statement]:
+    """
+    Args:
+        statements (list): a list of statements.
+
+    Returns:
+        list: the statements, and all the statements nested in them.
+    """
+    found = []
+    pending = [statements]
+    while pending:
+        for statement in pending.pop():
+            found.append(statement)
+            pending.extend(getattr(statement, name)
+                           for name in statement.blocks
+                           if getattr(statement, name) is not None)
+    return found
+
+
+def rewrite(root: Node, replace: typing.Callable[[Node], Node]) -> Node:
+    """Replaces the nodes of an expression from the root down: a node which
+    replace returns as it is keeps its operands, which are replaced in turn.
+
+    Args:
+        root (Node): an expression.
+        replace (function): gets a node and returns the node to use instead.
+
+    Returns:
+        Node: the root of the new expression.
+    """
+    root = replace(root)
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, Call):
+            if node.receiver is not None:
+                node.receiver = replace(node.receiver)
+                stack.append(node.receiver)
+            node.arguments = [replace(argument)
+                              for argument in node.arguments]
+            stack.extend(node.arguments)
+        else:
+            for name in OPERANDS.get(type(node), ()):
+                operand = replace(getattr(node, name))
+                setattr(node, name, operand)
+                stack.append(operand)
+    return root
+
+
+def hoist(loop: While, allocate: typing.Callable[[Node], int]
+          ) -> typing.List[typing.Tuple[Node, int]]:
+    """Takes the invariant expressions out of a loop. Every largest
+    invariant expression which reads a variable is replaced by a local,
+    and the same expression anywhere in the loop shares the local.
+
+    Args:
+        loop (While): the loop, which is changed in place.
+        allocate (function): gets an expression and returns a new local to
+        keep its value in.
+
+    Returns:
+        list: the expressions to compute before the loop, and their locals.
+    """
+    statements = walk(loop.body)
+    written = {(statement.segment, statement.index)
+               for statement in statements
+               if isinstance(statement, Let) and statement.offset is None}
+    roots = [loop.condition] + [
+        getattr(statement, name) for statement in statements
+        for name in statement.expressions
+        if getattr(statement, name) is not None]
+    nodes = [node for root in roots for node in postorder(root)]
+    effects = any(isinstance(node, (Call, String)) for node in nodes) or \
+        any(isinstance(statement, Let) and statement.offset is not None
+            for statement in statements)
+    # whether every node is invariant and reads a variable, and a number
+    # which is the same for equal expressions
+    invariant = {}
+    reads = {}
+    numbers = {}
+    shapes = {}
+    for node in nodes:
+        operands = children(node)
+        if isinstance(node, Constant):
+            stable = True
+            shape = ("constant", node.value)
+        elif isinstance(node, Variable):
+            stable = (node.segment, node.index) not in written and \
+                (node.segment in PRIVATE_SEGMENTS or not effects)
+            shape = ("variable", node.segment, node.index)
+        elif isinstance(node, ArrayRead):
+            stable = not effects
+            shape = ("array",)
+        elif isinstance(node, Unary):
+            stable = True
+            shape = ("unary", node.op)
+        elif isinstance(node, Binary):
+            stable = node.op in PURE_OPERATORS
+            shape = ("binary", node.op)
+        else:
+            stable = False
+            shape = None
+        invariant[id(node)] = stable and all(invariant[id(operand)]
+                                             for operand in operands)
+        reads[id(node)] = isinstance(node, (Variable, ArrayRead)) or \
+            any(reads[id(operand)] for operand in operands)
+        if shape is None or not invariant[id(node)]:
+            numbers[id(node)] = None
+        else:
+            shape += tuple(numbers[id(operand)] for operand in operands)
+            numbers[id(node)] = shapes.setdefault(shape, len(shapes))
+    hoisted = []
+    locals_of = {}
+
+    def replace(node: Node) -> Node:
+        if not isinstance(node, (ArrayRead, Unary, Binary)) or \
+                not invariant[id(node)] or not reads[id(node)]:
+            return node
+        number = numbers[id(node)]
+        if number not in locals_of:
+            locals_of[number] = allocate(node)
+            hoisted.append((node, locals_of[number]))
+        return Variable("LOCAL", locals_of[number])
+
+    loop.condition = rewrite(loop.condition, replace)
+    for statement in statements:
+        for name in statement.expressions:
+            if getattr(statement, name) is not None:
+                setattr(statement, name,
+                        rewrite(getattr(statement, name), replace))
+    return hoisted
+
+
+def render(root: Node, names: typing.Dict[typing.Tuple[str, int], str]
+           ) -> str:
+    """
+    Args:
+        root (Node): an expression.
+        names (dict): the name of every variable, by segment and index.
+
+    Returns:
+        str: the expression as Jack code, with the nested operations in
+        parentheses.
+    """
+    texts = {}
+    for node in postorder(root):
+        operands = [texts[id(operand)] if not isinstance(operand, Binary)
+                    else "(%s)" % texts[id(operand)]
+                    for operand in children(node)]
+        if isinstance(node, Constant):
+            text = str(node.value)
+        elif isinstance(node, String):
+            text = '"%s"' % node.text
+        elif isinstance(node, Variable):
+            text = "this" if node.segment == "POINTER" else names.get(
+                (node.segment, node.index),
+                "%s %d" % (node.segment.lower(), node.index))
+        elif isinstance(node, ArrayRead):
+            text = "%s[%s]" % (texts[id(node.base)], texts[id(node.index)])
+        elif isinstance(node, Unary):
+            text = node.op + operands[0]
+        elif isinstance(node, Binary):
+            text = "%s %s %s" % (operands[0], node.op, operands[1])
+        else:
+            if node.receiver is not None:
+                operands = operands[1:]
+            text = "%s(%s)" % (node.name, ", ".join(operands))
+        texts[id(node)] = text
+    return texts[id(root)]
+
+
+def grow_frame(instructions: typing.List[tuple],
+               sizes: typing.Dict[str, int]) -> typing.List[tuple]:
+    """Gives a function the locals added to it after its function command
+    was written.
+
+    Args:
+        instructions (list): the instructions of a function.
+        sizes (dict): the number of locals of the functions which grew, by
+        name.
+
+    Returns:
+        list: the instructions, with the number of locals updated.
+    """
+    if not instructions or instructions[0][0] != "function" or \
+            instructions[0][1] not in sizes:
+        return instructions
+    name = instructions[0][1]
+    return [("function", name, sizes[name])] + instructions[1:]
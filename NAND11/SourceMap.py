@@ -0,0 +1,73 @@
+"""
+This file is part of nand2tetris, as taught in The Hebrew University, and
+was written by Aviv Yaish. It is an extension to the specifications given
+[here](https://www.nand2tetris.org) (Shimon Schocken and Noam Nisan, 2017),
+as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
+
+Source maps, which give the Jack line every command of a .vm file was
+compiled from. A map is a header line followed by a single line of
+space-separated entries, one per run of commands: the difference between
+the Jack line of a command and of the command before it, followed by
+"*" and a count when the same difference repeats. For example:
+
+    jack-source-map 1
+    3 0*5 1 0*3 -2
+
+means the first six commands come from line 3, the next four from line 4
+and the next from line 2. A line of 0 means the line is unknown.
+"""
+import typing
+
+HEADER = "jack-source-map 1"
+
+# The extension of a map, after the name of its .vm file.
+EXTENSION = ".map"
+
+
+def encode(lines: typing.Sequence[int]) -> str:
+    """
+    Args:
+        lines (list): the Jack line of every VM command, in order.
+
+    Returns:
+        str: the text of the source map.
+    """
+    entries = []
+    previous = 0
+    delta = None
+    count = 0
+    for line in lines:
+        if line - previous == delta:
+            count += 1
+        else:
+            if count:
+                entries.append("%d*%d" % (delta, count) if count > 1
+                               else str(delta))
+            delta = line - previous
+            count = 1
+        previous = line
+    if count:
+        entries.append("%d*%d" % (delta, count) if count > 1 else str(delta))
+    return HEADER + "\n" + " ".join(entries) + "\n"
+
+
+def decode(text: str) -> typing.List[int]:
+    """
+    Args:
+        text (str): the text of a source map.
+
+    Returns:
+        list: the Jack line of every VM command, in order.
+    """
+    header, _, body = text.partition("\n")
+    if header.strip() != HEADER:
+        raise ValueError("not a source map: " + header)
+    lines = []
+    line = 0
+    for entry in body.split():
+        delta, _, count = entry.partition("*")
+        for _ in range(int(count or 1)):
+            line += int(delta)
+            lines.append(line)
+    return lines
@@ -0,0 +1,81 @@
+"""
+This file is part of nand2tetris, as taught in The Hebrew University, and
+was written by Aviv Yaish. It is an extension to the specifications given
+[here](https://www.nand2tetris.org) (Shimon Schocken and Noam Nisan, 2017),
+as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
+
+The string constant pool. In pool mode a string constant compiles into a
+call to the pool function of its text, which builds the string the first
+time it is called, keeps it in a static variable and returns it from then
+on. The function is named after the text, so every class compiles on its
+own and the classes which use the same text share a single string. The
+pool class itself is written once per program, with a function for every
+string constant of its classes.
+
+Pooled strings are shared, so a program compiled in pool mode must not
+change or dispose of its string constants.
+"""
+import typing
+import zlib
+from JackLexer import STRING_CONST, tokenize
+
+# The class of the pool functions.
+CLASS_NAME = "StringPool"
+
+
+def function_name(text: str) -> str:
+    """
+    Args:
+        text (str): the text of a string constant, without the quotes.
+
+    Returns:
+        str: the VM name of the pool function which returns the string.
+    """
+    return "%s.s%08x" % (CLASS_NAME, zlib.crc32(text.encode()))
+
+
+def collect(sources: typing.Iterable[str]) -> typing.List[str]:
+    """
+    Args:
+        sources (list): the sources of the classes of a program.
+
+    Returns:
+        list: the text of every distinct string constant in them, sorted.
+    """
+    texts = set()
+    for source in sources:
+        tokens = tokenize(source)
+        texts.update(text[1:-1] for text, kind in zip(tokens.texts,
+                                                      tokens.kinds)
+                     if kind == STRING_CONST)
+    return sorted(texts)
+
+
+def write_pool(texts: typing.List[str], writer) -> None:
+    """Writes the pool class: a function for every string constant, which
+    keeps its string in the static variable of the same index.
+
+    Args:
+        texts (list): the text of every string constant of the program.
+        writer (VMWriter): writes the class, as VM code or as assembly.
+    """
+    names = {}
+    for index, text in enumerate(texts):
+        name = function_name(text)
+        if names.setdefault(name, text) != text:
+            raise ValueError("string constants %r and %r have the same pool "
+                             "function" % (names[name], text))
+        writer.write_function(name, 0)
+        writer.write_push("STATIC", index)
+        writer.write_if("READY")
+        writer.write_push("CONST", len(text))
+        writer.write_call("String.new", 1)
+        for letter in text:
+            writer.write_push("CONST", ord(letter))
+            writer.write_call("String.appendChar", 2)
+        writer.write_pop("STATIC", index)
+        writer.write_label("READY")
+        writer.write_push("STATIC", index)
+        writer.write_return()
+    writer.flush()
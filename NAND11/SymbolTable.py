@@ -8,28 +8,37 @@ Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
 import typing
 
 
+class Symbol(typing.NamedTuple):
+    """Everything the symbol table knows about an identifier."""
+    kind: str
+    type: str
+    index: int
+
+
 class SymbolTable:
     """A symbol table that associates names with information needed for Jack
     compilation: type, kind and running index. The symbol table has two nested
-    scopes (class/subroutine).
+    scopes (class/subroutine). Each scope maps names straight to their
+    Symbol, and the index is assigned when the name is defined, so every
+    lookup takes constant time.
     """
 
     def __init__(self) -> None:
         """Creates a new empty symbol table."""
-        self.class_table = {"STATIC": [], "FIELD": []}
+        self.class_table = {}
         self.subroutine_table = {}
+        self.counts = {"STATIC": 0, "FIELD": 0, "ARG": 0, "VAR": 0}
 
     def __str__(self):
         return "class table: " + str(self.class_table) + "\n" + "sub_table: " + str(self.subroutine_table)
 
-
-
     def start_subroutine(self) -> None:
         """Starts a new subroutine scope (i.e., resets the subroutine's 
         symbol table).
         """
-        self.subroutine_table = {"VAR": [], "ARG": []}
-
+        self.subroutine_table = {}
+        self.counts["ARG"] = 0
+        self.counts["VAR"] = 0
 
     def define(self, name: str, type: str, kind: str) -> None:
         """Defines a new identifier of a given name, type and kind and assigns 
@@ -42,16 +51,16 @@ class SymbolTable:
             kind (str): the kind of the new identifier, can be:
             "STATIC", "FIELD", "ARG", "VAR".
         """
-        if kind == "FIELD":
-            self.class_table["FIELD"].append((name, type))
-        elif kind == "STATIC":
-            self.class_table["STATIC"].append((name, type))
-        elif kind == "VAR":
-            self.subroutine_table["VAR"].append((name, type))
+        if kind not in ("STATIC", "FIELD", "VAR"):
+            kind = "ARG"
+        index = self.counts[kind]
+        self.counts[kind] = index + 1
+        if kind in ("STATIC", "FIELD"):
+            table = self.class_table
         else:
-            self.subroutine_table["ARG"].append((name, type))
-
-
+            table = self.subroutine_table
+        # the first definition of a name wins, like the original lookups
+        table.setdefault(name, Symbol(kind, type, index))
 
     def var_count(self, kind: str) -> int:
         """
@@ -62,30 +71,35 @@ class SymbolTable:
             int: the number of variables of the given kind already defined in 
             the current scope.
         """
-        if kind in ["STATIC", "FIELD"]:
-            return len(self.class_table[kind])
-        return len(self.subroutine_table[kind])
+        return self.counts[kind]
 
-    def kind_of(self, name: str) -> str:
+    def lookup(self, name: str) -> typing.Optional[Symbol]:
         """
         Args:
             name (str): name of an identifier.
 
         Returns:
-            str: the kind of the named identifier in the current scope, or None
-            if the identifier is unknown in the current scope.
+            Symbol: the kind, type and index of the named identifier in the
+            current scope, or None if the identifier is unknown.
         """
-        for (var_name, var_type) in self.subroutine_table["ARG"]:
-            if var_name == name:
-                return "ARG"
-        for (var_name, var_type) in self.subroutine_table["VAR"]:
-            if var_name == name:
-                return "VAR"
-        for (var_name, var_type) in self.class_table["STATIC"]:
-            if var_name == name:
-                return "STATIC"
-        return "FIELD"
+        symbol = self.subroutine_table.get(name)
+        if symbol is None:
+            symbol = self.class_table.get(name)
+        return symbol
 
+    def kind_of(self, name: str) -> str:
+        """
+        Args:
+            name (str): name of an identifier.
+
+        Returns:
+            str: the kind of the named identifier in the current scope.
+            Unknown identifiers are assumed to be fields.
+        """
+        symbol = self.lookup(name)
+        if symbol is None:
+            return "FIELD"
+        return symbol.kind
 
     def type_of(self, name: str) -> str:
         """
@@ -93,21 +107,13 @@ class SymbolTable:
             name (str):  name of an identifier.
 
         Returns:
-            str: the type of the named identifier in the current scope.
+            str: the type of the named identifier in the current scope, or
+            None if the identifier is unknown in the current scope.
         """
-        for (var_name, type) in self.class_table["STATIC"]:
-            if var_name == name:
-                return type
-        for (var_name, type) in self.class_table["FIELD"]:
-            if var_name == name:
-                return type
-        for (var_name, type) in self.subroutine_table["ARG"]:
-            if var_name == name:
-                return type
-        for (var_name, type) in self.subroutine_table["VAR"]:
-            if var_name == name:
-                return type
-
+        symbol = self.lookup(name)
+        if symbol is None:
+            return None
+        return symbol.type
 
     def index_of(self, name: str) -> int:
         """
@@ -115,26 +121,10 @@ class SymbolTable:
             name (str):  name of an identifier.
 
         Returns:
-            int: the index assigned to the named identifier.
+            int: the index assigned to the named identifier, or None if the
+            identifier is unknown in the current scope.
         """
-        # Your code goes here!
-        index = 0
-        for (var_name, var_type) in self.subroutine_table["ARG"]:
-            if var_name == name:
-                return index
-            index += 1
-        index = 0
-        for (var_name, var_type) in self.subroutine_table["VAR"]:
-            if var_name == name:
-                return index
-            index += 1
-        index = 0
-        for (var_name, var_type) in self.class_table["STATIC"]:
-            if var_name == name:
-                return index
-            index += 1
-        index = 0
-        for (var_name, var_type) in self.class_table["FIELD"]:
-            if var_name == name:
-                return index
-            index += 1
+        symbol = self.lookup(name)
+        if symbol is None:
+            return None
+        return symbol.index
@@ -0,0 +1,210 @@
+"""
+This file is part of nand2tetris, as taught in The Hebrew University, and
+was written by Aviv Yaish. It is an extension to the specifications given
+[here](https://www.nand2tetris.org) (Shimon Schocken and Noam Nisan, 2017),
+as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
+
+Whole-program inlining of small leaf functions: the functions which call
+nothing and have at most a threshold of instructions are copied into their
+callers, across classes, in place of the call.
+
+The arguments and locals of an inlined function become extra locals of its
+caller, which are shared by all the calls it inlines, since a leaf can't
+be in the middle of another one. A call keeps the pointers of its caller,
+so when the inlined function sets pointer 0 or pointer 1 and the caller
+uses the this or that segment, the caller's pointer is kept in another
+extra local and restored after the inlined code. temp is not kept: the
+compiler never uses it across a call. Static variables belong to their
+class, so a function which uses them is only inlined into its own class.
+"""
+import typing
+from VMInterpreter import parse
+from VMOptimizer import peephole
+from VMWriter import encode
+
+Instructions = typing.List[tuple]
+
+# The largest number of instructions, not counting the function command, of
+# the functions which are inlined.
+THRESHOLD = 8
+
+
+def split_functions(instructions: Instructions) -> typing.List[Instructions]:
+    """
+    Args:
+        instructions (list): the instructions of a class.
+
+    Returns:
+        list: the instructions of every function, starting with its function
+        command. Whatever comes before the first function is a list of its
+        own.
+    """
+    functions = [[]]
+    for instruction in instructions:
+        if instruction[0] == "function":
+            functions.append([])
+        functions[-1].append(instruction)
+    return [function for function in functions if function]
+
+
+def is_leaf(function: Instructions, threshold: int) -> bool:
+    """
+    Args:
+        function (list): the instructions of a function.
+        threshold (int): the largest size of an inlined function.
+
+    Returns:
+        bool: True if the function calls nothing, is small enough and ends
+        with a return.
+    """
+    return len(function) - 1 <= threshold and \
+        function[-1] == ("return",) and \
+        all(instruction[0] != "call" for instruction in function)
+
+
+# The segment which every pointer points to.
+POINTED = ("this", "that")
+
+
+def uses_pointer(function: Instructions, pointer: int) -> bool:
+    """
+    Args:
+        function (list): the instructions of a function.
+        pointer (int): 0 for pointer 0, or 1 for pointer 1.
+
+    Returns:
+        bool: True if the function uses the pointer, or the segment it
+        points to.
+    """
+    return any(len(instruction) == 3 and (
+        instruction[1] == POINTED[pointer] or
+        instruction[1:] == ("pointer", pointer))
+        for instruction in function[1:])
+
+
+def expand(callee: Instructions, count: int, base: int,
+           saves: typing.Dict[int, int], site: int) -> Instructions:
+    """
+    Args:
+        callee (list): the instructions of the inlined function.
+        count (int): its number of arguments.
+        base (int): the first extra local of the caller: the arguments
+        come first, then the locals of the callee.
+        saves (dict): the local which keeps each pointer of the caller
+        which the callee changes, by pointer.
+        site (int): a number which tells the calls apart in the caller.
+
+    Returns:
+        list: the instructions which replace the call.
+    """
+    body = callee[1:]
+    out = []
+    for pointer, local in saves.items():
+        out += [("push", "pointer", pointer), ("pop", "local", local)]
+    # a single argument on top of the stack is used where it is, if it is
+    # the first thing the callee pushes and it is not used again
+    forward = count == 1 and body[0] == ("push", "argument", 0) and \
+        all(instruction[1:2] != ("argument",) for instruction in body[1:])
+    if forward:
+        body = body[1:]
+    else:
+        out += [("pop", "local", base + index)
+                for index in reversed(range(count))]
+    for index in range(callee[0][2]):
+        out += [("push", "constant", 0),
+                ("pop", "local", base + count + index)]
+    end = "inline%d.end" % site
+    for index, instruction in enumerate(body):
+        command = instruction[0]
+        if command == "return":
+            if index != len(body) - 1:
+                out.append(("goto", end))
+        elif command in ("label", "goto", "if-goto"):
+            out.append((command, "inline%d.%s" % (site, instruction[1])))
+        elif len(instruction) == 3 and instruction[1] == "argument":
+            out.append((command, "local", base + instruction[2]))
+        elif len(instruction) == 3 and instruction[1] == "local":
+            out.append((command, "local", base + count + instruction[2]))
+        else:
+            out.append(instruction)
+    if any(instruction == ("goto", end) for instruction in out):
+        out.append(("label", end))
+    for pointer, local in saves.items():
+        out += [("push", "local", local), ("pop", "pointer", pointer)]
+    return out
+
+
+def inline(classes: typing.List[str], threshold: int = THRESHOLD
+           ) -> typing.Tuple[typing.List[str], typing.Dict[str, int]]:
+    """Inlines the small leaf functions of a program into their callers.
+
+    Args:
+        classes (list): the VM code of every class of the program.
+        threshold (int): the largest number of instructions of an inlined
+        function.
+
+    Returns:
+        tuple: the VM code of every class, and the number of calls inlined
+        for every inlined function.
+    """
+    programs = [split_functions(parse(text)) for text in classes]
+    leaves = {function[0][1]: function
+              for functions in programs for function in functions
+              if function[0][0] == "function" and
+              is_leaf(function, threshold)}
+    inlined = {}
+    outputs = []
+    for functions in programs:
+        lines = []
+        for function in functions:
+            if function[0][0] == "function":
+                function = inline_calls(function, leaves, inlined)
+            lines.extend(encode(instruction) for instruction in function)
+        outputs.append("".join(lines))
+    return outputs, inlined
+
+
+def inline_calls(function: Instructions,
+                 leaves: typing.Dict[str, Instructions],
+                 inlined: typing.Dict[str, int]) -> Instructions:
+    """
+    Args:
+        function (list): the instructions of a function.
+        leaves (dict): the instructions of the functions which may be
+        inlined, by name.
+        inlined (dict): counts the calls inlined for every function.
+
+    Returns:
+        list: the instructions of the function, with the calls to leaves
+        inlined and the number of locals updated.
+    """
+    header = function[0]
+    class_name = header[1].split(".")[0]
+    uses = [uses_pointer(function, pointer) for pointer in (0, 1)]
+    base = header[2]
+    extra = 0
+    sites = 0
+    out = [header]
+    for instruction in function[1:]:
+        callee = leaves.get(instruction[1]) if instruction[0] == "call" \
+            else None
+        if callee is None or (
+                callee[0][1].split(".")[0] != class_name and
+                any(len(line) == 3 and line[1] == "static"
+                    for line in callee)):
+            out.append(instruction)
+            continue
+        count = instruction[2]
+        size = count + callee[0][2]
+        saves = {}
+        for pointer in (0, 1):
+            if uses[pointer] and ("pop", "pointer", pointer) in callee:
+                saves[pointer] = base + size + len(saves)
+        sites += 1
+        out += expand(callee, count, base, saves, sites)
+        extra = max(extra, size + len(saves))
+        inlined[callee[0][1]] = inlined.get(callee[0][1], 0) + 1
+    if not sites:
+        return function
+    return peephole([("function", header[1], header[2] + extra)] + out[1:])
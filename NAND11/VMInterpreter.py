@@ -0,0 +1,420 @@
+"""
+This file is part of nand2tetris, as taught in The Hebrew University, and
+was written by Aviv Yaish. It is an extension to the specifications given
+[here](https://www.nand2tetris.org) (Shimon Schocken and Noam Nisan, 2017),
+as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
+"""
+import argparse
+import os
+import sys
+import time
+import typing
+import zlib
+from array import array
+from BuiltinOS import BuiltinOS, Halt, SCREEN, KEYBOARD
+
+RAM_SIZE = 32768
+STACK_BASE = 256
+
+# The first addresses of the RAM, as in the Hack platform.
+SP, LCL, ARG, THIS, THAT = range(5)
+TEMP = 5
+STATIC = 16
+
+# The opcodes of the decoded instructions. Segments with a fixed address
+# (temp, pointer and static) share a single opcode, and labels are resolved
+# to instruction indices so they take no instruction of their own.
+(PUSH_CONSTANT, PUSH_LOCAL, PUSH_ARGUMENT, PUSH_THIS, PUSH_THAT, PUSH_FIXED,
+ POP_LOCAL, POP_ARGUMENT, POP_THIS, POP_THAT, POP_FIXED,
+ ADD, SUB, NEG, EQ, GT, LT, AND, OR, NOT,
+ GOTO, IF_GOTO, CALL, CALL_BUILTIN, FUNCTION, RETURN) = range(26)
+
+PUSH_OPCODES = {"constant": PUSH_CONSTANT, "local": PUSH_LOCAL,
+                "argument": PUSH_ARGUMENT, "this": PUSH_THIS,
+                "that": PUSH_THAT}
+POP_OPCODES = {"local": POP_LOCAL, "argument": POP_ARGUMENT,
+               "this": POP_THIS, "that": POP_THAT}
+ARITHMETIC_OPCODES = {"add": ADD, "sub": SUB, "neg": NEG, "eq": EQ, "gt": GT,
+                      "lt": LT, "and": AND, "or": OR, "not": NOT}
+
+Instruction = typing.Tuple[typing.Union[str, int], ...]
+
+
+def parse(text: str) -> typing.List[Instruction]:
+    """
+    Args:
+        text (str): VM code.
+
+    Returns:
+        list: its instructions, in the tuple form used by VMWriter.
+    """
+    instructions = []
+    for line in text.splitlines():
+        words = line.split("//", 1)[0].split()
+        if words:
+            if len(words) == 3:
+                words[2] = int(words[2])
+            instructions.append(tuple(words))
+    return instructions
+
+
+class VMInterpreter:
+    """Runs VM code. The files are loaded first, then linked into a flat
+    list of decoded instructions in which every label, function and segment
+    with a fixed address is already resolved. The RAM is a preallocated
+    array of signed 16-bit words, laid out as on the Hack platform, and the
+    call frames are kept on the stack in RAM as the VM specification
+    describes. Every OS subroutine which the loaded files don't define is
+    run by the BuiltinOS instead.
+    """
+
+    def __init__(self, keys: str = "") -> None:
+        """Creates a machine with no code and a zeroed RAM.
+
+        Args:
+            keys (str): the keys that Keyboard.readChar will return.
+        """
+        self.ram = array('h', bytes(2 * RAM_SIZE))
+        self.os = BuiltinOS(self.ram, keys)
+        self.files = []
+        self.code = None
+        self.operands = None
+        self.arguments = None
+        self.functions = {}
+        self.callees = {}
+        self.steps = 0
+        self.elapsed = 0.0
+        self.builtin_calls = 0
+        self.halted = None
+
+    def load_source(self, name: str, text: str) -> None:
+        """Adds the code of a single .vm file.
+
+        Args:
+            name (str): the name of the file, without its extension, which
+            names its static variables.
+            text (str): the VM code.
+        """
+        self.files.append((name, parse(text)))
+        self.code = None
+
+    def load_path(self, path: str) -> None:
+        """Adds a .vm file, or every .vm file in a directory.
+
+        Args:
+            path (str): the file or directory.
+        """
+        if os.path.isdir(path):
+            paths = [os.path.join(path, filename)
+                     for filename in sorted(os.listdir(path))]
+        else:
+            paths = [path]
+        for input_path in paths:
+            name, extension = os.path.splitext(os.path.basename(input_path))
+            if extension.lower() == ".vm":
+                with open(input_path, 'r') as input_file:
+                    self.load_source(name, input_file.read())
+
+    def link(self) -> None:
+        """Decodes the loaded files into a single program."""
+        functions = {}
+        labels = {}
+        index = 0
+        for name, instructions in self.files:
+            function = None
+            for instruction in instructions:
+                if instruction[0] == "function":
+                    function = instruction[1]
+                    functions.setdefault(function, index)
+                elif instruction[0] == "label":
+                    labels[function, instruction[1]] = index
+                    continue
+                index += 1
+        builtins = self.os.subroutines()
+        code = []
+        operands = []
+        arguments = []
+        callees = {}
+        static_base = STATIC
+        for name, instructions in self.files:
+            function = None
+            statics = 0
+            for instruction in instructions:
+                command = instruction[0]
+                operand = argument = 0
+                if command == "label":
+                    continue
+                if command == "push" or command == "pop":
+                    segment, offset = instruction[1], instruction[2]
+                    opcodes = PUSH_OPCODES if command == "push" \
+                        else POP_OPCODES
+                    if segment in opcodes:
+                        opcode = opcodes[segment]
+                        operand = offset
+                    else:
+                        opcode = PUSH_FIXED if command == "push" \
+                            else POP_FIXED
+                        if segment == "temp":
+                            operand = TEMP + offset
+                        elif segment == "pointer":
+                            operand = THIS + offset
+                        elif segment == "static":
+                            operand = static_base + offset
+                            statics = max(statics, offset + 1)
+                        else:
+                            raise ValueError("invalid segment: " + segment)
+                elif command in ARITHMETIC_OPCODES:
+                    opcode = ARITHMETIC_OPCODES[command]
+                elif command == "goto" or command == "if-goto":
+                    opcode = GOTO if command == "goto" else IF_GOTO
+                    operand = labels[function, instruction[1]]
+                elif command == "call":
+                    argument = instruction[2]
+                    callees[len(code)] = instruction[1]
+                    if instruction[1] in functions:
+                        opcode = CALL
+                        operand = functions[instruction[1]]
+                    elif instruction[1] in builtins:
+                        opcode = CALL_BUILTIN
+                        operand = builtins[instruction[1]][0]
+                    else:
+                        raise ValueError(
+                            "undefined function: " + instruction[1])
+                elif command == "function":
+                    function = instruction[1]
+                    opcode = FUNCTION
+                    operand = instruction[2]
+                elif command == "return":
+                    opcode = RETURN
+                else:
+                    raise ValueError("invalid command: " + command)
+                code.append(opcode)
+                operands.append(operand)
+                arguments.append(argument)
+            static_base += statics
+        self.code = code
+        self.operands = operands
+        self.arguments = arguments
+        self.functions = functions
+        self.callees = callees
+
+    def run(self, max_steps: typing.Optional[int] = None,
+            profile: typing.Optional["Profile"] = None) -> int:
+        """Runs the program from Sys.init, or from Main.main if the loaded
+        files don't define Sys.init, until it returns or halts.
+
+        Args:
+            max_steps (int): the largest number of instructions to execute,
+            or None for no limit.
+            profile (Profile): a VMProfiler.Profile, which gets every call
+            and return, if given.
+
+        Returns:
+            int: the number of instructions executed.
+        """
+        if self.code is None:
+            self.link()
+        entry = "Sys.init" if "Sys.init" in self.functions else "Main.main"
+        if entry not in self.functions:
+            raise ValueError("undefined function: " + entry)
+        code = self.code
+        operands = self.operands
+        arguments = self.arguments
+        ram = self.ram
+        # the return addresses are too wide for a word, so they are kept
+        # here instead of in their slot of the frame
+        returns = [-1]
+        # the bootstrap call, as in the Hack platform
+        ram[SP] = STACK_BASE
+        arg = STACK_BASE
+        sp = lcl = STACK_BASE + 5
+        pc = self.functions[entry]
+        callees = self.callees
+        if profile is not None:
+            profile.call(entry, 0)
+        limit = max_steps if max_steps is not None else float("inf")
+        steps = 0
+        builtin_calls = 0
+        start = time.perf_counter()
+        self.halted = "step limit"
+        try:
+            while steps < limit:
+                opcode = code[pc]
+                steps += 1
+                if opcode == PUSH_CONSTANT:
+                    ram[sp] = operands[pc]
+                    sp += 1
+                elif opcode == PUSH_LOCAL:
+                    ram[sp] = ram[lcl + operands[pc]]
+                    sp += 1
+                elif opcode == PUSH_ARGUMENT:
+                    ram[sp] = ram[arg + operands[pc]]
+                    sp += 1
+                elif opcode == POP_LOCAL:
+                    sp -= 1
+                    ram[lcl + operands[pc]] = ram[sp]
+                elif opcode == IF_GOTO:
+                    sp -= 1
+                    if ram[sp]:
+                        pc = operands[pc]
+                        continue
+                elif opcode == GOTO:
+                    pc = operands[pc]
+                    continue
+                elif opcode == ADD:
+                    sp -= 1
+                    value = ram[sp - 1] + ram[sp]
+                    if value > 32767:
+                        value -= 65536
+                    elif value < -32768:
+                        value += 65536
+                    ram[sp - 1] = value
+                elif opcode == PUSH_FIXED:
+                    ram[sp] = ram[operands[pc]]
+                    sp += 1
+                elif opcode == POP_FIXED:
+                    sp -= 1
+                    ram[operands[pc]] = ram[sp]
+                elif opcode == PUSH_THIS:
+                    ram[sp] = ram[ram[THIS] + operands[pc]]
+                    sp += 1
+                elif opcode == PUSH_THAT:
+                    ram[sp] = ram[ram[THAT] + operands[pc]]
+                    sp += 1
+                elif opcode == POP_ARGUMENT:
+                    sp -= 1
+                    ram[arg + operands[pc]] = ram[sp]
+                elif opcode == POP_THIS:
+                    sp -= 1
+                    ram[ram[THIS] + operands[pc]] = ram[sp]
+                elif opcode == POP_THAT:
+                    sp -= 1
+                    ram[ram[THAT] + operands[pc]] = ram[sp]
+                elif opcode == NOT:
+                    ram[sp - 1] = ~ram[sp - 1]
+                elif opcode == LT:
+                    sp -= 1
+                    ram[sp - 1] = -(ram[sp - 1] < ram[sp])
+                elif opcode == GT:
+                    sp -= 1
+                    ram[sp - 1] = -(ram[sp - 1] > ram[sp])
+                elif opcode == EQ:
+                    sp -= 1
+                    ram[sp - 1] = -(ram[sp - 1] == ram[sp])
+                elif opcode == SUB:
+                    sp -= 1
+                    value = ram[sp - 1] - ram[sp]
+                    if value > 32767:
+                        value -= 65536
+                    elif value < -32768:
+                        value += 65536
+                    ram[sp - 1] = value
+                elif opcode == NEG:
+                    if ram[sp - 1] != -32768:
+                        ram[sp - 1] = -ram[sp - 1]
+                elif opcode == AND:
+                    sp -= 1
+                    ram[sp - 1] = ram[sp - 1] & ram[sp]
+                elif opcode == OR:
+                    sp -= 1
+                    ram[sp - 1] = ram[sp - 1] | ram[sp]
+                elif opcode == CALL:
+                    if profile is not None:
+                        profile.call(callees[pc], steps)
+                    count = arguments[pc]
+                    returns.append(pc + 1)
+                    ram[sp] = 0
+                    ram[sp + 1] = lcl
+                    ram[sp + 2] = arg
+                    ram[sp + 3] = ram[THIS]
+                    ram[sp + 4] = ram[THAT]
+                    arg = sp - count
+                    sp += 5
+                    lcl = sp
+                    pc = operands[pc]
+                    continue
+                elif opcode == FUNCTION:
+                    count = operands[pc]
+                    if count:
+                        ram[sp:sp + count] = array('h', bytes(2 * count))
+                        sp += count
+                elif opcode == RETURN:
+                    if profile is not None:
+                        profile.ret(steps)
+                    frame = lcl
+                    ram[arg] = ram[sp - 1]
+                    sp = arg + 1
+                    ram[THAT] = ram[frame - 1]
+                    ram[THIS] = ram[frame - 2]
+                    arg = ram[frame - 3]
+                    lcl = ram[frame - 4]
+                    pc = returns.pop()
+                    if pc < 0:
+                        self.halted = "returned"
+                        break
+                    continue
+                elif opcode == CALL_BUILTIN:
+                    count = arguments[pc]
+                    sp -= count
+                    builtin_calls += 1
+                    if profile is not None:
+                        profile.call(callees[pc], steps)
+                    value = operands[pc](*ram[sp:sp + count])
+                    if profile is not None:
+                        profile.ret(steps)
+                    ram[sp] = value or 0
+                    sp += 1
+                pc += 1
+        except Halt as halt:
+            self.halted = str(halt)
+        except IndexError:
+            self.halted = "address out of range"
+        self.elapsed += time.perf_counter() - start
+        if profile is not None:
+            profile.finish(steps)
+        self.steps += steps
+        self.builtin_calls += builtin_calls
+        ram[SP] = sp
+        ram[LCL] = lcl
+        ram[ARG] = arg
+        return steps
+
+    def output(self) -> str:
+        """
+        Returns:
+            str: the text printed so far.
+        """
+        return "".join(self.os.output)
+
+    def screen_checksum(self) -> int:
+        """
+        Returns:
+            int: the CRC-32 of the screen memory map.
+        """
+        return zlib.crc32(self.ram[SCREEN:KEYBOARD].tobytes())
+
+    def __str__(self):
+        rate = self.steps / self.elapsed if self.elapsed else 0.0
+        return ("%d VM instructions, %d OS calls in %.3f s (%.0f "
+                "instructions/s), %s, screen crc32 %08x" % (
+                    self.steps, self.builtin_calls, self.elapsed, rate,
+                    self.halted, self.screen_checksum()))
+
+
+if "__main__" == __name__:
+    # Loads every .vm file in the given paths and runs the program, printing
+    # what it printed, then the statistics of the run.
+    parser = argparse.ArgumentParser(prog="VMInterpreter")
+    parser.add_argument("input_paths", nargs="+")
+    parser.add_argument("--max-steps", type=int, default=None,
+                        help="stop after executing N VM instructions")
+    parser.add_argument("--keys", default="",
+                        help="the keys to type when the program reads input")
+    args = parser.parse_args()
+    interpreter = VMInterpreter(args.keys)
+    for input_path in args.input_paths:
+        interpreter.load_path(os.path.abspath(input_path))
+    interpreter.run(args.max_steps)
+    print(interpreter.output())
+    print(interpreter, file=sys.stderr)
@@ -0,0 +1,420 @@
+"""
+This file is part of nand2tetris, as taught in The Hebrew University, and
+was written by Aviv Yaish. It is an extension to the specifications given
+[here](https://www.nand2tetris.org) (Shimon Schocken and Noam Nisan, 2017),
+as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
+"""
+import argparse
+import hashlib
+import os
+import sys
+import time
+import typing
+from BuiltinOS import Halt
+from VMInterpreter import VMInterpreter, Instruction, STATIC, TEMP
+
+# Expressions deeper than this are stored in a variable, so the generated
+# source stays within the limits of the Python compiler.
+MAX_DEPTH = 32
+
+# The Python expression of every command, on its operands. Each is fully
+# parenthesized, so it can be an operand itself. The results of add, sub and
+# neg are wrapped to 16 bits.
+BINARY = {"add": "(((%s + %s + 32768) & 65535) - 32768)",
+          "sub": "(((%s - %s + 32768) & 65535) - 32768)",
+          "and": "(%s & %s)", "or": "(%s | %s)",
+          "eq": "(-(%s == %s))", "gt": "(-(%s > %s))", "lt": "(-(%s < %s))"}
+UNARY = {"neg": "(((32768 - %s) & 65535) - 32768)", "not": "(~%s)"}
+
+# Compiled functions, by the hash of their VM code and of everything else
+# their translation depends on.
+TRANSLATIONS = {}
+
+
+def python_name(function: str) -> str:
+    """
+    Args:
+        function (str): the VM name of a function, like "Main.main".
+
+    Returns:
+        str: the name of its Python function.
+    """
+    return "F_" + function.replace(".", "__")
+
+
+class Value(typing.NamedTuple):
+    """A value on the stack of the function being translated: the Python
+    expression which computes it, what the expression reads and how deep it
+    is nested.
+    """
+    expression: str
+    reads: frozenset
+    depth: int
+
+
+class FunctionTranslator:
+    """Translates the VM code of a single function into the source of a
+    Python function.
+
+    The stack is simulated while translating, so pushes become Python
+    expressions and only pops, calls and jumps become statements. Locals,
+    arguments and the this and that pointers are Python variables; the
+    other segments live in the RAM. A value on the stack is stored in a
+    variable before anything it reads is changed, and before a call if it
+    reads the RAM.
+
+    The code between labels forms blocks. A function with labels becomes a
+    loop over a block number: block k runs when the number is at most k, so
+    a block which doesn't jump falls through to the next one, and a jump
+    sets the number and starts the loop over.
+    """
+
+    def __init__(self, instructions: typing.List[Instruction],
+                 static_base: int, builtins: typing.Set[str]) -> None:
+        """
+        Args:
+            instructions (list): the instructions of the function.
+            static_base (int): the address of the file's first static.
+            builtins (set): the called functions which the OS implements.
+        """
+        self.instructions = instructions
+        self.static_base = static_base
+        self.builtins = builtins
+        self.lines = []
+        self.indent = 1
+        self.stack = []
+        self.names = 0
+        self.depths = {}
+        self.blocks = {}
+
+    def emit(self, line: str) -> None:
+        self.lines.append("    " * self.indent + line)
+
+    def push(self, expression: str, reads: typing.Iterable[str] = (),
+             depth: int = 0) -> None:
+        value = Value(expression, frozenset(reads), depth)
+        if depth > MAX_DEPTH:
+            value = self.store(value)
+        self.stack.append(value)
+
+    def pop(self) -> Value:
+        return self.stack.pop()
+
+    def store(self, value: Value) -> Value:
+        """
+        Args:
+            value (Value): a value.
+
+        Returns:
+            Value: a new variable, assigned the value.
+        """
+        self.names += 1
+        name = "s%d" % self.names
+        self.emit("%s = %s" % (name, value.expression))
+        return Value(name, frozenset(), 0)
+
+    def invalidate(self, changed: str) -> None:
+        """Stores the values which read something about to change.
+
+        Args:
+            changed (str): a variable, or "ram".
+        """
+        for index, value in enumerate(self.stack):
+            if changed in value.reads:
+                self.stack[index] = self.store(value)
+
+    def spill(self) -> None:
+        """Moves the stack into the variables v0, v1... at the end of a
+        block, since the next block can be entered from elsewhere."""
+        if self.stack:
+            names = ["v%d" % index for index in range(len(self.stack))]
+            self.emit("%s = %s" % (", ".join(names), ", ".join(
+                value.expression for value in self.stack)))
+            self.stack = [Value(name, frozenset([name]), 0) for name in names]
+
+    def location(self, segment: str, index: int) -> typing.Tuple[
+            str, typing.Tuple[str, ...]]:
+        """
+        Args:
+            segment (str): a VM segment.
+            index (int): an index in the segment.
+
+        Returns:
+            tuple: the Python expression of the location, and what it reads.
+        """
+        if segment == "constant":
+            return str(index), ()
+        if segment == "local":
+            return "l%d" % index, ("l%d" % index,)
+        if segment == "argument":
+            return "a%d" % index, ("a%d" % index,)
+        if segment == "pointer":
+            name = "this" if index == 0 else "that"
+            return name, (name,)
+        if segment in ("this", "that"):
+            address = segment if index == 0 else "%s + %d" % (segment, index)
+            return "ram[%s]" % address, ("ram", segment)
+        if segment == "temp":
+            return "ram[%d]" % (TEMP + index), ("ram",)
+        if segment == "static":
+            return "ram[%d]" % (self.static_base + index), ("ram",)
+        raise ValueError("invalid segment: " + segment)
+
+    def segments(self) -> typing.List[typing.List[Instruction]]:
+        """
+        Returns:
+            list: the instructions split after every jump and before every
+            label, so each part runs from start to end, or not at all.
+        """
+        segments = [[]]
+        for instruction in self.instructions:
+            if instruction[0] == "label" and segments[-1]:
+                segments.append([])
+            segments[-1].append(instruction)
+            if instruction[0] in ("goto", "if-goto", "return"):
+                segments.append([])
+        return [segment for segment in segments if segment]
+
+    def jump(self, label: str) -> None:
+        self.depths.setdefault(label, len(self.stack))
+        self.emit("label = %d" % self.blocks[label])
+        self.emit("if STEPS > LIMIT:")
+        self.emit("    raise Halt(\"step limit\")")
+        self.emit("continue")
+
+    def translate(self, name: str) -> str:
+        """
+        Args:
+            name (str): the name of the Python function.
+
+        Returns:
+            str: the source of the Python function.
+        """
+        locals_count = 0
+        arguments = set()
+        for instruction in self.instructions:
+            if instruction[0] == "function":
+                locals_count = instruction[2]
+            elif instruction[0] in ("push", "pop") and \
+                    instruction[1] == "argument":
+                arguments.add(instruction[2])
+        labels = [instruction[1] for instruction in self.instructions
+                  if instruction[0] == "label"]
+        self.blocks = {label: index + 1 for index, label in enumerate(labels)}
+        parameters = ["this", "that"]
+        parameters += ["a%d=0" % index
+                       for index in range(max(arguments, default=-1) + 1)]
+        # the RAM is bound as a default, so reading it is a local lookup
+        lines = ["def %s(%s, *_, ram=ram):" % (name, ", ".join(parameters)),
+                 "    global STEPS, OS_CALLS"]
+        for index in range(locals_count):
+            lines.append("    l%d = 0" % index)
+        if labels:
+            lines.append("    label = 0")
+            lines.append("    while True:")
+            lines.append("        if label <= 0:")
+            self.indent = 3
+        self.lines = lines
+        for segment in self.segments():
+            if segment[0][0] == "label":
+                self.spill()
+                label = segment[0][1]
+                depth = self.depths.setdefault(label, len(self.stack))
+                self.stack = [Value("v%d" % index,
+                                    frozenset(["v%d" % index]), 0)
+                              for index in range(depth)]
+                self.indent = 2
+                self.emit("if label <= %d:" % self.blocks[label])
+                self.indent = 3
+                if len(segment) == 1:
+                    self.emit("pass")
+            self.translate_segment(segment)
+        self.emit("raise Halt(\"%s ended without a return\")" % name)
+        return "\n".join(self.lines) + "\n"
+
+    def translate_segment(self, segment: typing.List[Instruction]) -> None:
+        """Translates straight-line code, counting its instructions."""
+        steps = sum(instruction[0] != "label" for instruction in segment)
+        if steps:
+            self.emit("STEPS += %d" % steps)
+        os_calls = sum(instruction[0] == "call" and
+                       instruction[1] in self.builtins
+                       for instruction in segment)
+        if os_calls:
+            self.emit("OS_CALLS += %d" % os_calls)
+        for instruction in segment:
+            command = instruction[0]
+            if command == "push":
+                expression, reads = self.location(*instruction[1:])
+                self.push(expression, reads)
+            elif command == "pop":
+                value = self.pop()
+                target, reads = self.location(*instruction[1:])
+                changed = "ram" if target.startswith("ram") else target
+                self.invalidate(changed)
+                self.emit("%s = %s" % (target, value.expression))
+            elif command in BINARY:
+                right = self.pop()
+                left = self.pop()
+                self.push(BINARY[command] % (left.expression,
+                                             right.expression),
+                          left.reads | right.reads,
+                          max(left.depth, right.depth) + 1)
+            elif command in UNARY:
+                value = self.pop()
+                self.push(UNARY[command] % value.expression, value.reads,
+                          value.depth + 1)
+            elif command == "call":
+                function, count = instruction[1], instruction[2]
+                values = self.stack[len(self.stack) - count:]
+                del self.stack[len(self.stack) - count:]
+                self.invalidate("ram")
+                arguments = [value.expression for value in values]
+                if function in self.builtins:
+                    # the OS returns None from void subroutines
+                    call = "(%s(%s) or 0)"
+                else:
+                    call = "%s(%s)"
+                    arguments = ["this", "that"] + arguments
+                self.push(call % (python_name(function), ", ".join(arguments)))
+                self.stack[-1] = self.store(self.stack[-1])
+            elif command == "return":
+                self.emit("return %s" % self.pop().expression)
+                self.stack = []
+            elif command == "goto":
+                self.spill()
+                self.jump(instruction[1])
+                self.stack = []
+            elif command == "if-goto":
+                condition = self.pop()
+                self.spill()
+                self.emit("if %s:" % condition.expression)
+                self.indent += 1
+                self.jump(instruction[1])
+                self.indent -= 1
+
+
+class VMJit(VMInterpreter):
+    """Runs VM code by translating every function into a Python function
+    once, when the program is linked, and calling those. The translations
+    are compiled once per process, by a hash of the function's code.
+
+    The frames of the calls are Python frames rather than a stack in RAM:
+    the static, temp, this and that segments and the OS use the RAM exactly
+    like the interpreter does, and the same instructions are counted, but
+    the stack, locals and arguments are not in RAM.
+    """
+
+    def __init__(self, keys: str = "") -> None:
+        super().__init__(keys)
+        self.namespace = None
+        self.compiled = 0
+
+    def link(self) -> None:
+        """Translates the loaded files into Python functions."""
+        builtins = self.os.subroutines()
+        defined = {instruction[1] for name, instructions in self.files
+                   for instruction in instructions
+                   if instruction[0] == "function"}
+        namespace = {"ram": self.ram, "Halt": Halt, "STEPS": 0,
+                     "OS_CALLS": 0, "LIMIT": 0}
+        for function, (implementation, count) in builtins.items():
+            if function not in defined:
+                namespace[python_name(function)] = implementation
+        static_base = STATIC
+        self.functions = {}
+        for name, instructions in self.files:
+            statics = 0
+            functions = []
+            for instruction in instructions:
+                if instruction[0] == "function":
+                    functions.append([])
+                if functions:
+                    functions[-1].append(instruction)
+                if instruction[0] in ("push", "pop") and \
+                        instruction[1] == "static":
+                    statics = max(statics, instruction[2] + 1)
+            for function in functions:
+                function_name = function[0][1]
+                if function_name in self.functions:
+                    continue
+                calls = {instruction[1] for instruction in function
+                         if instruction[0] == "call"}
+                for call in calls:
+                    if call not in defined and call not in builtins:
+                        raise ValueError("undefined function: " + call)
+                called_builtins = calls - defined
+                key = hashlib.sha256(repr((
+                    function, static_base, sorted(called_builtins))).encode()
+                ).hexdigest()
+                code = TRANSLATIONS.get(key)
+                if code is None:
+                    translator = FunctionTranslator(function, static_base,
+                                                    called_builtins)
+                    source = translator.translate(python_name(function_name))
+                    code = compile(source, "<%s>" % function_name, "exec")
+                    TRANSLATIONS[key] = code
+                    self.compiled += 1
+                exec(code, namespace)
+                self.functions[function_name] = namespace[
+                    python_name(function_name)]
+            static_base += statics
+        self.namespace = namespace
+        self.code = True
+
+    def run(self, max_steps: typing.Optional[int] = None) -> int:
+        """Runs the program from Sys.init, or from Main.main if the loaded
+        files don't define Sys.init, until it returns or halts. The step
+        limit is checked at every jump, so a run may go a little over it.
+
+        Args:
+            max_steps (int): the largest number of instructions to execute,
+            or None for no limit.
+
+        Returns:
+            int: the number of instructions executed.
+        """
+        if self.code is None:
+            self.link()
+        entry = "Sys.init" if "Sys.init" in self.functions else "Main.main"
+        if entry not in self.functions:
+            raise ValueError("undefined function: " + entry)
+        namespace = self.namespace
+        namespace["STEPS"] = 0
+        namespace["OS_CALLS"] = 0
+        namespace["LIMIT"] = max_steps if max_steps is not None \
+            else float("inf")
+        start = time.perf_counter()
+        self.halted = "returned"
+        try:
+            self.functions[entry](0, 0)
+        except Halt as halt:
+            self.halted = str(halt)
+        except RecursionError:
+            self.halted = "stack overflow"
+        except IndexError:
+            self.halted = "address out of range"
+        self.elapsed += time.perf_counter() - start
+        steps = namespace["STEPS"]
+        self.steps += steps
+        self.builtin_calls += namespace["OS_CALLS"]
+        return steps
+
+
+if "__main__" == __name__:
+    # Loads every .vm file in the given paths and runs the program, printing
+    # what it printed, then the statistics of the run.
+    parser = argparse.ArgumentParser(prog="VMJit")
+    parser.add_argument("input_paths", nargs="+")
+    parser.add_argument("--max-steps", type=int, default=None,
+                        help="stop after executing about N VM instructions")
+    parser.add_argument("--keys", default="",
+                        help="the keys to type when the program reads input")
+    args = parser.parse_args()
+    jit = VMJit(args.keys)
+    for input_path in args.input_paths:
+        jit.load_path(os.path.abspath(input_path))
+    jit.run(args.max_steps)
+    print(jit.output())
+    print(jit, file=sys.stderr)
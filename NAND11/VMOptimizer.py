@@ -0,0 +1,675 @@
+"""
+This file is part of nand2tetris, as taught in The Hebrew University, and
+was written by Aviv Yaish. It is an extension to the specifications given
+[here](https://www.nand2tetris.org) (Shimon Schocken and Noam Nisan, 2017),
+as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
+
+Optimization passes over the VM instructions of a single function, in the
+tuple form used by VMWriter, like ("push", "constant", 7) or ("add",).
+"""
+import typing
+import ControlFlow
+
+Instructions = typing.List[tuple]
+
+# Instructions which never fall through to the next one.
+JUMPS = ("goto", "return")
+
+# Pairs of instructions which cancel each other out.
+CANCELLING = (("not",), ("neg",))
+
+# What the arithmetic commands and the Math calls compute, on signed 16-bit
+# values. The results are wrapped to 16 bits by to_word().
+UNARY = {"neg": lambda a: -a, "not": lambda a: ~a}
+BINARY = {"add": lambda a, b: a + b,
+          "sub": lambda a, b: a - b,
+          "and": lambda a, b: a & b,
+          "or": lambda a, b: a | b,
+          "eq": lambda a, b: -(a == b),
+          "gt": lambda a, b: -(a > b),
+          "lt": lambda a, b: -(a < b)}
+MATH = {("call", "Math.multiply", 2): lambda a, b: a * b,
+        ("call", "Math.divide", 2): lambda a, b: int(a / b)}
+
+
+def constant_of(instructions: Instructions) -> typing.Optional[int]:
+    """
+    Args:
+        instructions (list): instructions which end with a computed value.
+
+    Returns:
+        int: the value, if the last one or two instructions push a constant,
+        possibly negated or inverted, and None otherwise.
+    """
+    if instructions and instructions[-1][:2] == ("push", "constant"):
+        return instructions[-1][2]
+    if len(instructions) >= 2 and \
+            instructions[-2][:2] == ("push", "constant"):
+        if instructions[-1] == ("neg",):
+            return -instructions[-2][2]
+        if instructions[-1] == ("not",):
+            return ~instructions[-2][2]
+    return None
+
+
+def to_word(value: int) -> int:
+    """
+    Args:
+        value (int): any integer.
+
+    Returns:
+        int: the value wrapped to a signed 16-bit word.
+    """
+    return (value + 0x8000) % 0x10000 - 0x8000
+
+
+def push_value(value: int) -> Instructions:
+    """
+    Args:
+        value (int): a signed 16-bit value.
+
+    Returns:
+        list: the shortest instructions which push the value.
+    """
+    if value >= 0:
+        return [("push", "constant", value)]
+    if value == -0x8000:
+        return [("push", "constant", 0x7fff), ("not",)]
+    return [("push", "constant", -value), ("neg",)]
+
+
+def constant_at(out: Instructions,
+                end: int) -> typing.Optional[typing.Tuple[int, int]]:
+    """
+    Args:
+        out (list): instructions.
+        end (int): where the value ends, exclusive.
+
+    Returns:
+        tuple: the value and the start index, if the instructions before end
+        push a constant, possibly negated or inverted, and None otherwise.
+    """
+    if end >= 1 and out[end - 1][:2] == ("push", "constant"):
+        return out[end - 1][2], end - 1
+    if end >= 2 and out[end - 2][:2] == ("push", "constant") and \
+            out[end - 1][0] in UNARY:
+        return to_word(UNARY[out[end - 1][0]](out[end - 2][2])), end - 2
+    return None
+
+
+def operand_start(out: Instructions, end: int) -> typing.Optional[int]:
+    """Walks back over the instructions which compute a single value.
+
+    Args:
+        out (list): instructions.
+        end (int): where the value ends, exclusive.
+
+    Returns:
+        int: where the value starts, or None if it is not straight-line code.
+    """
+    depth = 1
+    pointer = False
+    for index in range(end - 1, -1, -1):
+        op = out[index][0]
+        if op == "push":
+            depth -= 1
+            # that is only valid after the pop pointer 1 which sets it
+            pointer = pointer or out[index][1] == "that"
+        elif op == "pop":
+            depth += 1
+            pointer = pointer and out[index][1:] != ("pointer", 1)
+        elif op in BINARY:
+            depth += 1
+        elif op == "call":
+            depth += out[index][2] - 1
+        elif op not in UNARY:
+            return None
+        if depth == 0 and not pointer:
+            return index
+    return None
+
+
+def power_of_two(value: int) -> int:
+    """
+    Args:
+        value (int): a positive value.
+
+    Returns:
+        int: k if the value is 2^k with k > 0, and 0 otherwise.
+    """
+    if value > 1 and value & (value - 1) == 0:
+        return value.bit_length() - 1
+    return 0
+
+
+# The segments whose entries a later pass can't make a second push of read
+# something else: the that segment and pointer 1 are moved around by
+# array_accesses and reuse_pointer.
+STABLE_SEGMENTS = ("constant", "local", "argument", "static")
+
+
+def doubled(last: tuple, times: int) -> Instructions:
+    """
+    Args:
+        last (tuple): the instruction which computed the value on the stack.
+        times (int): how many times to double it.
+
+    Returns:
+        list: instructions which double the value on the stack, by adding it
+        to itself. The value is pushed again if it was just pushed from a
+        stable segment, and copied through temp 0 otherwise.
+    """
+    instructions = []
+    if last[0] == "push" and last[1] in STABLE_SEGMENTS:
+        instructions = [last, ("add",)]
+        times -= 1
+    for _ in range(times):
+        instructions += [("pop", "temp", 0), ("push", "temp", 0),
+                         ("push", "temp", 0), ("add",)]
+    return instructions
+
+
+def multiplied(last: tuple, value: int) -> typing.Optional[Instructions]:
+    """
+    Args:
+        last (tuple): the instruction which computed the value on the stack.
+        value (int): a constant to multiply the value by.
+
+    Returns:
+        list: instructions which multiply the value on the stack by the
+        constant without calling Math.multiply, or None if there are none.
+    """
+    negate = [("neg",)] if value < 0 else []
+    if abs(value) == 1:
+        return negate
+    shift = power_of_two(abs(value))
+    if shift:
+        return doubled(last, shift) + negate
+    return None
+
+
+def fold_tail(out: Instructions) -> bool:
+    """Folds the constant operation which ends out, if there is one.
+
+    Args:
+        out (list): the instructions kept so far.
+
+    Returns:
+        bool: True if out was changed, False otherwise.
+    """
+    last = out[-1]
+    if last[0] in UNARY:
+        operand = constant_at(out, len(out) - 1)
+        if operand is None:
+            return False
+        value, start = operand
+        folded = push_value(to_word(UNARY[last[0]](value)))
+        if folded == out[start:]:
+            return False
+        out[start:] = folded
+        return True
+    if last[0] in BINARY:
+        operation = BINARY[last[0]]
+    elif last in MATH:
+        operation = MATH[last]
+    else:
+        return False
+    right = constant_at(out, len(out) - 1)
+    if right is not None:
+        right_value, right_start = right
+        left = constant_at(out, right_start)
+        if left is not None:
+            if last == ("call", "Math.divide", 2) and right_value == 0:
+                return False
+            out[left[1]:] = push_value(to_word(operation(left[0], right_value)))
+            return True
+        replacement = None
+        if right_value == 0 and last[0] in ("add", "sub", "or") or \
+                right_value == -1 and last[0] == "and":
+            replacement = []
+        elif last[0] == "call" and right_start > 0:
+            if last[1] == "Math.multiply":
+                replacement = multiplied(out[right_start - 1], right_value)
+            elif abs(right_value) == 1:
+                replacement = [("neg",)] if right_value < 0 else []
+        if replacement is None:
+            return False
+        out[right_start:] = replacement
+        return True
+    start = operand_start(out, len(out) - 1)
+    left = None if start is None else constant_at(out, start)
+    if left is None:
+        return False
+    left_value, left_start = left
+    right_code = out[start:-1]
+    if left_value == 0 and last[0] in ("add", "or") or \
+            left_value == -1 and last[0] == "and":
+        replacement = right_code
+    elif left_value == 0 and last[0] == "sub":
+        replacement = right_code + [("neg",)]
+    elif last == ("call", "Math.multiply", 2):
+        rest = multiplied(right_code[-1], left_value)
+        if rest is None:
+            return False
+        replacement = right_code + rest
+    else:
+        return False
+    out[left_start:] = replacement
+    return True
+
+
+def fold_constants(instructions: Instructions) -> Instructions:
+    """Evaluates the operations on constants at compile time, and replaces
+    the multiplications and divisions which have a constant operand by
+    cheaper code when there is some: x * 2^k is made of additions, and
+    identities like x * 1, x / 1, x + 0 and x & -1 are dropped.
+
+    Args:
+        instructions (list): the instructions of a function.
+
+    Returns:
+        list: the folded instructions.
+    """
+    out = []
+    for instruction in instructions:
+        out.append(instruction)
+        while fold_tail(out):
+            pass
+    return out
+
+
+# How the compiler stores the value on top of the stack into the array entry
+# whose address is under it.
+ARRAY_STORE = [("pop", "temp", 0), ("pop", "pointer", 1), ("push", "temp", 0),
+               ("pop", "that", 0)]
+
+# How the compiler reads the array entry whose address is on the stack.
+ARRAY_READ = [("pop", "pointer", 1), ("push", "that", 0)]
+
+# The segments of the arrays whose address pointer 1 is known to keep, with
+# whether a call may change them.
+TRACKED_BASES = {"constant": False, "local": False, "argument": False,
+                 "static": True, "this": True}
+
+
+def is_base(instruction: tuple) -> bool:
+    """
+    Args:
+        instruction (tuple): an instruction.
+
+    Returns:
+        bool: True if it pushes a value which may be put in pointer 1 and
+        used through the that segment, without computing it.
+    """
+    return instruction[0] == "push" and \
+        instruction[1] not in ("that", "pointer", "temp")
+
+
+def uses_pointer(instructions: Instructions) -> bool:
+    """
+    Args:
+        instructions (list): instructions.
+
+    Returns:
+        bool: True if they use pointer 1 or the that segment.
+    """
+    return any(len(instruction) == 3 and (
+        instruction[1] == "that" or instruction[1:] == ("pointer", 1))
+        for instruction in instructions)
+
+
+def constant_entry(out: Instructions,
+                   end: int) -> typing.Optional[typing.Tuple[int, int]]:
+    """
+    Args:
+        out (list): instructions.
+        end (int): where the address of an array entry ends, exclusive.
+
+    Returns:
+        tuple: where the address starts and the constant index, if the
+        address is an array plus a constant, or just an array once folding
+        dropped an index of 0, and None otherwise.
+    """
+    if end >= 3 and out[end - 1] == ("add",) and \
+            out[end - 2][:2] == ("push", "constant") and is_base(out[end - 3]):
+        return end - 3, out[end - 2][2]
+    if end >= 1 and is_base(out[end - 1]):
+        return end - 1, 0
+    return None
+
+
+def store_tail(out: Instructions) -> bool:
+    """Rewrites a store into an array entry, when computing the stored value
+    doesn't use pointer 1: the address is put in pointer 1 before the value
+    is computed, so the value is popped straight into the entry rather than
+    going through temp 0. An entry at a constant index is addressed by the
+    index in the that segment.
+
+    Args:
+        out (list): the instructions kept so far.
+
+    Returns:
+        bool: True if out was changed, False otherwise.
+    """
+    if out[-4:] != ARRAY_STORE:
+        return False
+    start = operand_start(out, len(out) - 4)
+    if not start or uses_pointer(out[start:-4]):
+        return False
+    value = out[start:-4]
+    entry = constant_entry(out, start)
+    if entry is None:
+        out[start:] = [("pop", "pointer", 1)] + value + [("pop", "that", 0)]
+    else:
+        address, offset = entry
+        out[address:] = [out[address], ("pop", "pointer", 1)] + value + [
+            ("pop", "that", offset)]
+    return True
+
+
+def read_tail(out: Instructions) -> bool:
+    """Rewrites a read of an array entry at a constant index, so the entry
+    is addressed by the index in the that segment.
+
+    Args:
+        out (list): the instructions kept so far.
+
+    Returns:
+        bool: True if out was changed, False otherwise.
+    """
+    if out[-2:] != ARRAY_READ or len(out) < 5 or out[-3] != ("add",):
+        return False
+    entry = constant_entry(out, len(out) - 2)
+    if entry is None or entry[0] != len(out) - 5:
+        return False
+    out[-5:] = [out[-5], ("pop", "pointer", 1), ("push", "that", entry[1])]
+    return True
+
+
+def pointer_needed(instructions: Instructions) -> typing.List[bool]:
+    """
+    Args:
+        instructions (list): the instructions of a function.
+
+    Returns:
+        list: for every position, and the end, whether the instructions from
+        there on use pointer 1 or the that segment before they pop pointer 1.
+    """
+    needed = [False] * (len(instructions) + 1)
+    for index in range(len(instructions) - 1, -1, -1):
+        instruction = instructions[index]
+        if instruction == ("pop", "pointer", 1):
+            needed[index] = False
+        else:
+            needed[index] = uses_pointer([instruction]) or needed[index + 1]
+    return needed
+
+
+def array_accesses(instructions: Instructions) -> Instructions:
+    """Reads and stores array entries at constant indices through the that
+    segment, and stores values which don't use pointer 1 without going
+    through temp 0. Filling a table at constant indices takes two
+    instructions per entry once reuse_pointer drops the repeated pointer 1
+    setting, rather than eight. A read leaves pointer 1 at the array rather
+    than at the entry, so it is only rewritten when nothing after it uses
+    pointer 1 before setting it again.
+
+    Args:
+        instructions (list): the instructions of a function.
+
+    Returns:
+        list: the rewritten instructions.
+    """
+    needed = pointer_needed(instructions)
+    out = []
+    for index, instruction in enumerate(instructions):
+        out.append(instruction)
+        if instruction == ARRAY_STORE[-1]:
+            store_tail(out)
+        elif instruction == ARRAY_READ[-1] and not needed[index + 1]:
+            read_tail(out)
+    return out
+
+
+def reuse_pointer(instructions: Instructions) -> Instructions:
+    """Follows which array pointer 1 holds, and drops the instructions which
+    put the same array there again. What pointer 1 holds is forgotten at
+    every label, when the variable which held the array changes, and at a
+    call when the call may change it. Calls keep pointer 1 itself, since
+    it is part of the frame.
+
+    Args:
+        instructions (list): the instructions of a function.
+
+    Returns:
+        list: the rewritten instructions.
+    """
+    out = []
+    holds = None
+    for instruction in instructions:
+        op = instruction[0]
+        if instruction == ("pop", "pointer", 1):
+            if holds is not None and out and out[-1] == holds:
+                out.pop()
+                continue
+            holds = out[-1] if out and is_base(out[-1]) and \
+                out[-1][1] in TRACKED_BASES else None
+        elif holds is None:
+            pass
+        elif op in ("label", "function") or \
+                op == "pop" and instruction[1:] == holds[1:] or \
+                op == "call" and TRACKED_BASES[holds[1]] or \
+                instruction == ("pop", "pointer", 0) and holds[1] == "this":
+            holds = None
+        out.append(instruction)
+    return out
+
+
+# The commands which leave true or false on the stack.
+BOOLEANS = (("eq",), ("gt",), ("lt",))
+
+
+def is_boolean(out: Instructions) -> bool:
+    """
+    Args:
+        out (list): instructions.
+
+    Returns:
+        bool: True if the value they end by pushing is known to be true or
+        false: a comparison, or a constant 0 or -1.
+    """
+    return bool(out) and out[-1] in BOOLEANS or \
+        constant_of(out) in (0, -1)
+
+
+def rewrite_tail(out: Instructions) -> bool:
+    """Applies the first peephole rule which matches the end of out.
+
+    Args:
+        out (list): the instructions kept so far.
+
+    Returns:
+        bool: True if out was changed, False otherwise.
+    """
+    last = out[-1]
+    op = last[0]
+    if len(out) >= 2:
+        before = out[-2]
+        # push x; pop x
+        if op == "pop" and before[0] == "push" and before[1:] == last[1:]:
+            del out[-2:]
+            return True
+        # not; not and neg; neg
+        if last in CANCELLING and before == last:
+            del out[-2:]
+            return True
+    if op == "not" and len(out) >= 3 and out[-3] == ("push", "constant", 1) \
+            and out[-2] == ("neg",):
+        # true; not
+        out[-3:] = [("push", "constant", 0)]
+        return True
+    if op == "if-goto":
+        value = constant_of(out[:-1])
+        if value is not None:
+            # a branch on a constant either always or never jumps
+            length = 2 if out[-2][0] == "push" else 3
+            out[-length:] = [("goto", last[1])] if value else []
+            return True
+        if out[-4:-1] == [("push", "constant", 0), ("eq",), ("not",)]:
+            # if-goto already jumps on any value but zero
+            out[-4:] = [last]
+            return True
+    if op == "label":
+        if len(out) >= 5 and out[-4] == ("not",) and \
+                out[-3] == ("if-goto", last[1]) and out[-2][0] == "goto" and \
+                is_boolean(out[:-4]):
+            # not; if-goto L1; goto L2; label L1 -> if-goto L2; label L1,
+            # which only holds when the value is true or false: not 5 is
+            # not false either
+            out[-4:] = [("if-goto", out[-2][1]), last]
+            return True
+        # goto L; label ...; label L
+        index = len(out) - 2
+        while index >= 0 and out[index][0] == "label":
+            index -= 1
+        if index >= 0 and out[index] == ("goto", last[1]):
+            del out[index]
+            return True
+    return False
+
+
+def peephole_window(instructions: Instructions) -> Instructions:
+    """Slides a window over the instructions, rewriting the end of the
+    output after every instruction, and drops the code which follows a goto
+    or a return up to the next label.
+
+    Args:
+        instructions (list): the instructions of a function.
+
+    Returns:
+        list: the rewritten instructions.
+    """
+    out = []
+    for instruction in instructions:
+        if out and out[-1][0] in JUMPS and instruction[0] != "label":
+            continue
+        out.append(instruction)
+        while out and rewrite_tail(out):
+            pass
+    return out
+
+
+def remove_dead_labels(instructions: Instructions) -> Instructions:
+    """
+    Args:
+        instructions (list): the instructions of a function.
+
+    Returns:
+        list: the instructions, without the labels nothing jumps to.
+    """
+    targets = {instruction[1] for instruction in instructions
+               if instruction[0] in ("goto", "if-goto")}
+    return [instruction for instruction in instructions
+            if instruction[0] != "label" or instruction[1] in targets]
+
+
+def peephole(instructions: Instructions) -> Instructions:
+    """Runs the peephole rules over the instructions of a function until
+    they no longer apply. Every rule makes the code shorter, so this ends.
+
+    The rules remove push/pop pairs on the same location, double not/neg,
+    gotos to the next label, unreachable code and dead labels, fold
+    branches on constants, and fuse a not into the branch that tests it.
+
+    Args:
+        instructions (list): the instructions of a function.
+
+    Returns:
+        list: the optimized instructions.
+    """
+    length = None
+    while length != len(instructions):
+        length = len(instructions)
+        instructions = remove_dead_labels(peephole_window(instructions))
+    return instructions
+
+
+def coalesce_locals(instructions: Instructions,
+                    frames: typing.Optional[list] = None) -> Instructions:
+    """Puts the locals whose values are never needed at the same time in
+    the same slot, and shrinks the frame of the function to the slots it
+    uses. A local which may be read before it is written relies on being
+    zero when the function starts, so all such locals keep slots of their
+    own. A local copied into another shares its slot when it can, so the
+    copy may be dropped by the peephole rules.
+
+    Args:
+        instructions (list): the instructions of a function.
+        frames (list): gets the name of the function and its number of
+        locals before and after, if the frame shrinks.
+
+    Returns:
+        list: the instructions, with the locals renumbered.
+    """
+    if not instructions or instructions[0][0] != "function" or \
+            not instructions[0][2]:
+        return instructions
+    graph = ControlFlow.build(instructions)
+    live_in, block_out = ControlFlow.live_locals(graph)
+    # the locals live after every instruction, found by going back through
+    # every block from the locals live at its end
+    live_out = []
+    for block, live in zip(reversed(graph.blocks), reversed(block_out)):
+        for instruction in reversed(block.instructions):
+            live_out.append(live)
+            if instruction[:2] == ("pop", "local"):
+                live &= ~(1 << instruction[2])
+            elif instruction[:2] == ("push", "local"):
+                live |= 1 << instruction[2]
+    live_out.append(live_in[0] if graph.blocks else 0)
+    live_out.reverse()
+    count = instructions[0][2]
+    # the function command writes a zero into every local, so the locals
+    # which are live after it conflict with each other
+    entry = live_out[0]
+    conflicts = [entry & ~(1 << local) if entry >> local & 1 else 0
+                 for local in range(count)]
+    moves = [set() for _ in range(count)]
+    used = 0
+    for index, instruction in enumerate(instructions):
+        if len(instruction) != 3 or instruction[1] != "local":
+            continue
+        local = instruction[2]
+        used |= 1 << local
+        if instruction[0] == "pop":
+            others = live_out[index] & ~(1 << local)
+            conflicts[local] |= others
+            for other in range(count):
+                if others >> other & 1:
+                    conflicts[other] |= 1 << local
+            if instructions[index - 1][:2] == ("push", "local"):
+                moves[local].add(instructions[index - 1][2])
+                moves[instructions[index - 1][2]].add(local)
+    slots = {}
+    for local in range(count):
+        if not used >> local & 1:
+            continue
+        taken = {slots[other] for other in slots
+                 if conflicts[local] >> other & 1}
+        preferred = [slots[other] for other in sorted(moves[local])
+                     if other in slots and slots[other] not in taken]
+        slot = preferred[0] if preferred else next(
+            slot for slot in range(count) if slot not in taken)
+        slots[local] = slot
+    size = max(slots.values()) + 1 if slots else 0
+    if size == count and all(local == slot for local, slot in slots.items()):
+        return instructions
+    if frames is not None and size < count:
+        frames.append((instructions[0][1], count, size))
+    out = [("function", instructions[0][1], size)]
+    for instruction in instructions[1:]:
+        if len(instruction) == 3 and instruction[1] == "local":
+            instruction = (instruction[0], "local", slots[instruction[2]])
+        out.append(instruction)
+    return out
@@ -0,0 +1,160 @@
+"""
+This file is part of nand2tetris, as taught in The Hebrew University, and
+was written by Aviv Yaish. It is an extension to the specifications given
+[here](https://www.nand2tetris.org) (Shimon Schocken and Noam Nisan, 2017),
+as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
+
+Attributes the instructions executed by the VM interpreter to the functions
+which executed them.
+"""
+import argparse
+import os
+import sys
+import typing
+from VMInterpreter import VMInterpreter
+
+
+class FunctionStats:
+    """What a single function cost: how many times it was called, the
+    instructions it executed itself, and the instructions executed until
+    it returned, including those of the functions it called.
+    """
+    __slots__ = ("calls", "exclusive", "inclusive", "active")
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.exclusive = 0
+        self.inclusive = 0
+        # how many of the calls are on the stack, so a recursive function
+        # only counts its outermost call as inclusive
+        self.active = 0
+
+
+class Profile:
+    """Gets the calls and returns of a run, with the number of instructions
+    executed so far at each of them. The instructions between two of them
+    were executed by the function on top of the call stack, so only calls
+    and returns need to be seen, not every instruction.
+
+    The OS subroutines run by the interpreter itself are called and return
+    at once, so they are counted as calls which execute no instructions.
+    """
+
+    def __init__(self) -> None:
+        self.functions = {}
+        self.stacks = {}
+        # the stats, the entry step and the call path of every active call
+        self.stack = []
+        self.last = 0
+
+    def charge(self, steps: int) -> None:
+        """Counts the instructions since the last event for the function on
+        top of the stack.
+
+        Args:
+            steps (int): the instructions executed so far.
+        """
+        if self.stack:
+            spent = steps - self.last
+            stats, entry, path = self.stack[-1]
+            stats.exclusive += spent
+            self.stacks[path] = self.stacks.get(path, 0) + spent
+        self.last = steps
+
+    def call(self, function: str, steps: int) -> None:
+        """
+        Args:
+            function (str): the called function.
+            steps (int): the instructions executed so far, including the
+            call.
+        """
+        self.charge(steps)
+        stats = self.functions.get(function)
+        if stats is None:
+            stats = self.functions[function] = FunctionStats()
+        stats.calls += 1
+        stats.active += 1
+        path = self.stack[-1][2] + (function,) if self.stack else (function,)
+        self.stack.append((stats, steps, path))
+
+    def ret(self, steps: int) -> None:
+        """
+        Args:
+            steps (int): the instructions executed so far, including the
+            return.
+        """
+        self.charge(steps)
+        stats, entry, path = self.stack.pop()
+        stats.active -= 1
+        if not stats.active:
+            stats.inclusive += steps - entry
+
+    def finish(self, steps: int) -> None:
+        """Returns from the calls which are still active when a run stops.
+
+        Args:
+            steps (int): the instructions executed in the run.
+        """
+        while self.stack:
+            self.ret(steps)
+
+    def report(self, top: typing.Optional[int] = None) -> str:
+        """
+        Args:
+            top (int): how many functions to list, or None for all of them.
+
+        Returns:
+            str: a table of the functions, the most expensive ones first.
+        """
+        total = max(sum(stats.exclusive
+                        for stats in self.functions.values()), 1)
+        ranked = sorted(self.functions.items(),
+                        key=lambda item: (-item[1].exclusive,
+                                          -item[1].inclusive, item[0]))
+        lines = ["%-32s %9s %11s %6s %11s %6s" % (
+            "function", "calls", "exclusive", "%", "inclusive", "%")]
+        for function, stats in ranked[:top]:
+            lines.append("%-32s %9d %11d %5.1f%% %11d %5.1f%%" % (
+                function, stats.calls, stats.exclusive,
+                100.0 * stats.exclusive / total, stats.inclusive,
+                100.0 * stats.inclusive / total))
+        return "\n".join(lines)
+
+    def collapsed(self) -> str:
+        """
+        Returns:
+            str: the exclusive instructions of every call path, in the
+            collapsed stack format read by flame graph tools, like
+            "Main.main;Math.sqrt 120".
+        """
+        return "".join("%s %d\n" % (";".join(path), spent)
+                       for path, spent in sorted(self.stacks.items())
+                       if spent)
+
+
+if "__main__" == __name__:
+    # Loads every .vm file in the given paths, runs the program and prints
+    # where its instructions were executed.
+    parser = argparse.ArgumentParser(prog="VMProfiler")
+    parser.add_argument("input_paths", nargs="+")
+    parser.add_argument("--max-steps", type=int, default=None,
+                        help="stop after executing N VM instructions")
+    parser.add_argument("--keys", default="",
+                        help="the keys to type when the program reads input")
+    parser.add_argument("--top", type=int, default=20,
+                        help="list the N most expensive functions")
+    parser.add_argument("--collapsed", metavar="FILE",
+                        help="write the call stacks to FILE, for a flame "
+                             "graph")
+    args = parser.parse_args()
+    interpreter = VMInterpreter(args.keys)
+    for input_path in args.input_paths:
+        interpreter.load_path(os.path.abspath(input_path))
+    profile = Profile()
+    interpreter.run(args.max_steps, profile)
+    print(interpreter, file=sys.stderr)
+    print(profile.report(args.top))
+    if args.collapsed:
+        with open(args.collapsed, 'w') as collapsed_file:
+            collapsed_file.write(profile.collapsed())
@@ -5,23 +5,179 @@ was written by Aviv Yaish. It is an extension to the specifications given
 as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
 Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
 """
+import time
 import typing
 
+# VM names of the segments and arithmetic commands used by the compiler.
+SEGMENTS = {"CONST": "constant", "ARG": "argument", "LOCAL": "local",
+            "STATIC": "static", "THIS": "this", "THAT": "that",
+            "POINTER": "pointer", "TEMP": "temp"}
+ARITHMETIC = {command: command.lower() for command in
+              ["ADD", "SUB", "NEG", "EQ", "GT", "LT", "AND", "OR", "NOT"]}
+
+# Formats an instruction tuple as a line of VM code, by its length.
+FORMATS = (None, "%s\n", "%s %s\n", "%s %s %s\n")
+
+# How many characters are buffered before they are written to the output.
+BUFFER_SIZE = 1 << 16
+
+
+class SourceInstruction(tuple):
+    """An instruction with a line attribute: the line of Jack code it was
+    compiled from. The line survives the optimization passes, which only
+    move instructions around or replace them by plain tuples."""
+
+
+def timed(timings: typing.Optional[typing.Dict[str, float]], name: str,
+          function: typing.Callable, *arguments) -> typing.Any:
+    """Calls a function, adding the seconds it took to its entry in timings.
+
+    Args:
+        timings (dict): the seconds spent in every named step, or None to
+        just call the function.
+        name (str): the name of the step.
+        function (function): the function to call.
+        arguments: the arguments of the function.
+
+    Returns:
+        the result of the function.
+    """
+    if timings is None:
+        return function(*arguments)
+    start = time.perf_counter()
+    result = function(*arguments)
+    timings[name] = timings.get(name, 0.0) + time.perf_counter() - start
+    return result
+
+
+def pass_name(optimization: typing.Callable) -> str:
+    """
+    Args:
+        optimization (function): an optimization pass, or a partial of one.
+
+    Returns:
+        str: the name of the pass.
+    """
+    return getattr(optimization, "func", optimization).__name__
+
+
+def encode(instruction: tuple) -> str:
+    """
+    Args:
+        instruction (tuple): a VM instruction, like ("push", "local", 0).
+
+    Returns:
+        str: the line of VM code of the instruction.
+    """
+    return FORMATS[len(instruction)] % instruction
+
 
 class VMWriter:
     """
     Writes VM commands into a file. Encapsulates the VM command syntax.
+
+    Every command is first made into an instruction tuple: the command
+    followed by its arguments, like ("push", "constant", 7) or ("add",).
+    When optimization passes are given, the instructions of each function
+    are collected and passed through them before being written. The text is
+    collected in memory and written in large blocks, whenever more than
+    buffer_size characters are waiting and when flush() is called.
+
+    When source lines are collected, every written command records the
+    Jack line which was current when it was emitted, in the order of the
+    output. An instruction made by an optimization pass takes the line of
+    the instruction before it. When timings are collected, the seconds spent
+    in every pass are added up by the name of the pass.
     """
 
-    def __init__(self, output_stream: typing.TextIO) -> None:
-        """Creates a new file and prepares it for writing VM commands."""
-        # Your code goes here!
-        # Note that you can write to output_stream like so:
-        # output_stream.write("Hello world! \n")
+    def __init__(self, output_stream: typing.TextIO,
+                 buffer_size: int = BUFFER_SIZE,
+                 passes: typing.Sequence[typing.Callable] = (),
+                 source_lines: typing.Optional[typing.List[int]] = None,
+                 timings: typing.Optional[typing.Dict[str, float]] = None
+                 ) -> None:
+        """Creates a new file and prepares it for writing VM commands.
 
+        Args:
+            output_stream (typing.TextIO): the stream to write to.
+            buffer_size (int): how many characters to collect between writes.
+            passes (list): functions which get the instructions of a function
+            and return the instructions to write instead.
+            source_lines (list): gets the Jack line of every written command,
+            if given.
+            timings (dict): gets the seconds spent in every pass, if given.
+        """
         self.output = output_stream
+        self.buffer_size = buffer_size
+        self.buffer = []
+        self.buffered = 0
+        self.passes = list(passes)
+        self.instructions = []
+        self.source_lines = source_lines
+        self.timings = timings
+        # the Jack line of the commands being emitted
+        self.line = 0
+
+    def write(self, command: str) -> None:
+        """Buffers an encoded VM command, flushing if the buffer is full.
+
+        Args:
+            command (str): the command, including its line break.
+        """
+        self.buffer.append(command)
+        self.buffered += len(command)
+        if self.buffered >= self.buffer_size:
+            self.flush_buffer()
 
-    def  write_push(self, segment: str, index: int) -> None:
+    def emit(self, instruction: tuple) -> None:
+        """Writes an instruction, or holds it until its function is complete
+        if there are optimization passes.
+
+        Args:
+            instruction (tuple): the instruction.
+        """
+        if not self.passes:
+            if self.source_lines is not None:
+                self.source_lines.append(self.line)
+            self.write(FORMATS[len(instruction)] % instruction)
+            return
+        if instruction[0] == "function":
+            self.end_function()
+        if self.source_lines is not None:
+            instruction = SourceInstruction(instruction)
+            instruction.line = self.line
+        self.instructions.append(instruction)
+
+    def end_function(self) -> None:
+        """Runs the held instructions through the optimization passes and
+        writes them."""
+        instructions = self.instructions
+        self.instructions = []
+        for optimization in self.passes:
+            instructions = timed(self.timings, pass_name(optimization),
+                                 optimization, instructions)
+        if self.source_lines is not None:
+            line = self.line
+            for instruction in instructions:
+                line = getattr(instruction, "line", line)
+                self.source_lines.append(line)
+        for instruction in instructions:
+            self.write(FORMATS[len(instruction)] % instruction)
+
+    def flush_buffer(self) -> None:
+        """Writes the buffered text to the output stream."""
+        if self.buffer:
+            self.output.write("".join(self.buffer))
+            self.buffer = []
+            self.buffered = 0
+
+    def flush(self) -> None:
+        """Writes everything written so far to the output stream."""
+        if self.instructions:
+            self.end_function()
+        self.flush_buffer()
+
+    def write_push(self, segment: str, index: int) -> None:
         """Writes a VM push command.
 
         Args:
@@ -29,10 +185,7 @@ class VMWriter:
             "LOCAL", "STATIC", "THIS", "THAT", "POINTER", "TEMP"
             index (int): the index to push to.
         """
-        segment_dict = {"CONST": "constant", "ARG": "argument", "LOCAL": "local", "STATIC": "static"
-                           , "THIS": "this", "THAT": "that", "POINTER": "pointer", "TEMP": "temp"}
-        self.output.write("push " + segment_dict[segment] + " " + str(index) + "\n")
-
+        self.emit(("push", SEGMENTS[segment], index))
 
     def write_pop(self, segment: str, index: int) -> None:
         """Writes a VM pop command.
@@ -42,11 +195,7 @@ class VMWriter:
             "LOCAL", "STATIC", "THIS", "THAT", "POINTER", "TEMP".
             index (int): the index to pop from.
         """
-        # Your code goes here!
-        segment_dict = {"CONST": "constant", "ARG": "argument", "LOCAL": "local", "STATIC": "static"
-            , "THIS": "this", "THAT": "that", "POINTER": "pointer", "TEMP": "temp"}
-        self.output.write("pop " + segment_dict[segment] + " " + str(index) + "\n")
-
+        self.emit(("pop", SEGMENTS[segment], index))
 
     def write_arithmetic(self, command: str) -> None:
         """Writes a VM arithmetic command.
@@ -55,12 +204,9 @@ class VMWriter:
             command (str): the command to write, can be "ADD", "SUB", "NEG", 
             "EQ", "GT", "LT", "AND", "OR", "NOT", "SHIFTLEFT", "SHIFTRIGHT".
         """
-        # Your code goes here!
-        if command in ["ADD", "SUB", "NEG", "EQ", "GT", "LT", "AND", "OR", "NOT"]:
-            self.output.write(command.lower() + "\n")
-        else:
+        if command not in ARITHMETIC:
             raise ArithmeticError("no good my boy you did not handle dis")
-
+        self.emit((ARITHMETIC[command],))
 
     def write_label(self, label: str) -> None:
         """Writes a VM label command.
@@ -68,7 +214,7 @@ class VMWriter:
         Args:
             label (str): the label to write.
         """
-        self.output.write("label " + label + "\n")
+        self.emit(("label", label))
 
     def write_goto(self, label: str) -> None:
         """Writes a VM goto command.
@@ -76,7 +222,7 @@ class VMWriter:
         Args:
             label (str): the label to go to.
         """
-        self.output.write("goto " + label + "\n")
+        self.emit(("goto", label))
 
     def write_if(self, label: str) -> None:
         """Writes a VM if-goto command.
@@ -84,7 +230,7 @@ class VMWriter:
         Args:
             label (str): the label to go to.
         """
-        self.output.write("if-goto " + label + "\n")
+        self.emit(("if-goto", label))
 
     def write_call(self, name: str, n_args: int) -> None:
         """Writes a VM call command.
@@ -93,7 +239,7 @@ class VMWriter:
             name (str): the name of the function to call.
             n_args (int): the number of arguments the function receives.
         """
-        self.output.write("call " + name + " " + str(n_args) + "\n")
+        self.emit(("call", name, n_args))
 
     def write_function(self, name: str, n_locals: int) -> None:
         """Writes a VM function command.
@@ -102,8 +248,8 @@ class VMWriter:
             name (str): the name of the function.
             n_locals (int): the number of local variables the function uses.
         """
-        self.output.write("function " + name + " " + str(n_locals) + "\n")
+        self.emit(("function", name, n_locals))
 
     def write_return(self) -> None:
         """Writes a VM return command."""
-        self.output.write("return\n")
\ No newline at end of file
+        self.emit(("return",))